@@ -0,0 +1,125 @@
+# coding: utf-8
+
+import io
+import os
+import random
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+
+# Sizes of the generated images (width, height)
+IMAGE_SIZES = {
+    'small': (320, 240),
+    'medium': (1280, 960),
+    'large': (3000, 2000),
+}
+
+# Extensions of the generated files (images are real JPEGs, the others are a few bytes)
+FILE_EXTENSIONS = ['.jpg', '.jpg', '.png', '.pdf', '.txt', '.doc', '.mp4', '.zip']
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+
+def make_image(size, format='JPEG', seed=0):
+    "Returns the content of an image with a gradient and noise (so compression is realistic)"
+    width, height = size
+    rnd = random.Random(seed)
+    im = Image.new('RGB', (64, 64))
+    im.putdata([(x * 4, y * 4, rnd.randint(0, 255)) for y in range(64) for x in range(64)])
+    im = im.resize(size, Image.BILINEAR)
+    data = io.BytesIO()
+    im.save(data, format=format, quality=85)
+    return data.getvalue()
+
+
+class MediaTree(object):
+    """
+    A synthetic media tree with path (relative to the storage location):
+
+    * flat/: count files within a single folder (listing, pagination)
+    * nested/: count files within nested folders (walk, search)
+    * images/<size>/: images_per_size images of every size (versions)
+
+    Names, folders and filetypes are random, but reproducible with seed.
+    """
+
+    def __init__(self, storage, path, count, images_per_size=10, files_per_folder=100, seed=1):
+        self.storage = storage
+        self.path = path
+        self.count = count
+        self.images_per_size = images_per_size
+        self.files_per_folder = files_per_folder
+        self.seed = seed
+        self.images = {}
+
+    @property
+    def flat_path(self):
+        return os.path.join(self.path, 'flat')
+
+    @property
+    def nested_path(self):
+        return os.path.join(self.path, 'nested')
+
+    @property
+    def images_path(self):
+        return os.path.join(self.path, 'images')
+
+    def _filenames(self, rnd, count):
+        for i in range(count):
+            yield '%s_%s_%06d%s' % (rnd.choice(WORDS), rnd.choice(WORDS), i, rnd.choice(FILE_EXTENSIONS))
+
+    def _nested_folders(self, rnd, count):
+        "Yields (folder, number of files) for count files, up to 3 levels deep"
+        folders = max(1, count // self.files_per_folder)
+        for i in range(folders):
+            depth = rnd.randint(1, 3)
+            parts = ['%s_%d' % (rnd.choice(WORDS), rnd.randint(0, 9)) for level in range(depth - 1)]
+            yield os.path.join(*(parts + ['folder_%05d' % i])), count // folders + (1 if i < count % folders else 0)
+
+    def _write(self, name, content):
+        full_path = None
+        try:
+            full_path = self.storage.path(name)
+        except NotImplementedError:
+            pass
+        if full_path is None:
+            self.storage.save(name, ContentFile(content))
+            return
+        # local files are written directly (much faster than storage.save with 100k files)
+        directory = os.path.dirname(full_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+
+    def create(self):
+        rnd = random.Random(self.seed)
+        thumbnail = make_image((64, 48), seed=self.seed)
+        other = b'x' * 512
+
+        def content(filename):
+            return thumbnail if filename.endswith('.jpg') else other
+
+        for filename in self._filenames(rnd, self.count):
+            self._write(os.path.join(self.flat_path, filename), content(filename))
+
+        filenames = self._filenames(rnd, self.count)
+        for folder, count in self._nested_folders(rnd, self.count):
+            for i in range(count):
+                filename = next(filenames)
+                self._write(os.path.join(self.nested_path, folder, filename), content(filename))
+
+        for size_name, size in sorted(IMAGE_SIZES.items()):
+            data = make_image(size, seed=self.seed)
+            self.images[size_name] = []
+            for i in range(self.images_per_size):
+                name = os.path.join(self.images_path, size_name, 'image_%03d.jpg' % i)
+                self._write(name, data)
+                self.images[size_name].append(name)
+        return self
+
+    def remove(self):
+        if self.storage.exists(self.path):
+            self.storage.rmtree(self.path)
@@ -0,0 +1,56 @@
+# Settings for the benchmarks (s. runbenchmarks.py)
+import os
+import tempfile
+
+SECRET_KEY = 'filebrowser-benchmarks'
+
+DEBUG = False
+
+INSTALLED_APPS = (
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'filebrowser',
+    'django.contrib.admin',
+)
+
+ROOT_URLCONF = 'tests.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+USE_TZ = True
+
+STATIC_URL = '/static/'
+
+# Media trees are created within a temporary folder (or FILEBROWSER_BENCHMARK_ROOT)
+MEDIA_ROOT = os.environ.get('FILEBROWSER_BENCHMARK_ROOT') or tempfile.mkdtemp(prefix='filebrowser_benchmark_')
+MEDIA_URL = '/media/'
+
+FILEBROWSER_DIRECTORY = 'uploads/'
+FILEBROWSER_VERSIONS_BASEDIR = '_versions/'
+FILEBROWSER_PLACEHOLDER = ''
+# os.chmod does not work with storages without local paths (e.g. InMemoryStorage)
+FILEBROWSER_DEFAULT_PERMISSIONS = None
@@ -0,0 +1,125 @@
+# coding: utf-8
+
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from django.utils.six.moves.urllib.parse import urljoin
+
+from filebrowser.storage import ListingEntry, StorageMixin
+
+
+class InMemoryStorage(StorageMixin, Storage):
+    """
+    Keeps files in memory, a stand-in for remote storages (without network
+    latency). Folders are created with makedirs and when saving files.
+    """
+
+    def __init__(self, base_url='/memory/'):
+        self.base_url = base_url
+        self.files = {}
+        self.children = defaultdict(set)
+        self.dirs = {'': self._now()}
+        self._lock = threading.RLock()
+
+    def _name(self, name):
+        name = os.path.normpath(name or '').replace('\\', '/').strip('/')
+        return '' if name == '.' else name
+
+    def _now(self):
+        return timezone.now() if settings.USE_TZ else timezone.datetime.now()
+
+    def _add_dirs(self, name):
+        while name not in self.dirs:
+            self.dirs[name] = self._now()
+            parent = os.path.dirname(name)
+            self.children[parent].add(os.path.basename(name))
+            name = parent
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self.files[self._name(name)][0], name=name)
+
+    def _save(self, name, content):
+        name = self._name(name)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        data = b''.join(content.chunks())
+        with self._lock:
+            self._add_dirs(os.path.dirname(name))
+            self.files[name] = (data, self._now())
+            self.children[os.path.dirname(name)].add(os.path.basename(name))
+        return name
+
+    def delete(self, name):
+        name = self._name(name)
+        with self._lock:
+            if self.files.pop(name, None) is not None:
+                self.children[os.path.dirname(name)].discard(os.path.basename(name))
+
+    def exists(self, name):
+        name = self._name(name)
+        return name in self.files or name in self.dirs
+
+    def isdir(self, name):
+        return self._name(name) in self.dirs
+
+    def isfile(self, name):
+        return self._name(name) in self.files
+
+    def listdir(self, path):
+        path = self._name(path)
+        dirs, files = [], []
+        for child in sorted(self.children.get(path, ())):
+            (dirs if self.isdir(os.path.join(path, child)) else files).append(child)
+        return dirs, files
+
+    def scandir(self, path):
+        path = self._name(path)
+        dirs, files = self.listdir(path)
+        entries = [ListingEntry(name, True, None, self.dirs[os.path.join(path, name)]) for name in dirs]
+        for name in files:
+            data, mtime = self.files[os.path.join(path, name)]
+            entries.append(ListingEntry(name, False, len(data), mtime))
+        return entries
+
+    def size(self, name):
+        return len(self.files[self._name(name)][0])
+
+    def get_modified_time(self, name):
+        name = self._name(name)
+        return self.dirs[name] if name in self.dirs else self.files[name][1]
+
+    def modified_time(self, name):
+        return timezone.make_naive(self.get_modified_time(name)) if settings.USE_TZ else self.get_modified_time(name)
+
+    def url(self, name):
+        return urljoin(self.base_url, filepath_to_uri(self._name(name)))
+
+    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+        if not allow_overwrite and self.exists(new_file_name):
+            raise IOError("The destination file '%s' exists and allow_overwrite is False" % new_file_name)
+        self._save(new_file_name, self._open(old_file_name))
+        self.delete(old_file_name)
+
+    def makedirs(self, name):
+        with self._lock:
+            self._add_dirs(self._name(name))
+
+    def rmtree(self, name):
+        name = self._name(name)
+        prefix = name + '/'
+        with self._lock:
+            for path in [path for path in self.files if path.startswith(prefix)]:
+                del self.files[path]
+            for path in [path for path in self.dirs if path.startswith(prefix) or path == name]:
+                del self.dirs[path]
+                self.children.pop(path, None)
+            self.children[os.path.dirname(name)].discard(os.path.basename(name))
+
+    def setpermission(self, name):
+        pass
@@ -0,0 +1,327 @@
+# coding: utf-8
+
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.test import RequestFactory
+from django.utils.encoding import force_text
+from django.utils.six.moves.urllib.parse import urlencode
+from mock import patch
+from PIL import Image
+
+from filebrowser.base import FileListing, FileObject
+from filebrowser.settings import VERSIONS, LIST_PER_PAGE
+from filebrowser.sites import FileBrowserSite, site as default_site
+from filebrowser.utils import scale_and_crop
+
+from benchmarks.media import IMAGE_SIZES, MediaTree
+from benchmarks.storage import InMemoryStorage
+
+
+# Registered benchmarks: (name, function, storages)
+BENCHMARKS = []
+
+
+def benchmark(name, storages=('local', 'memory')):
+    """
+    Registers a benchmark. The function is called with a Context and returns
+    a callable, which is timed and returns the number of operations (e.g.
+    files listed). An optional second callable resets the state before
+    every run (not timed).
+    """
+    def decorator(func):
+        BENCHMARKS.append((name, func, storages))
+        return func
+    return decorator
+
+
+class Context(object):
+    "A media tree with the FileBrowser site it is browsed with"
+
+    def __init__(self, site, storage_name, tree):
+        self.site = site
+        self.storage_name = storage_name
+        self.tree = tree
+
+    def relative(self, path):
+        "Path relative to site.directory (e.g. for the dir parameter)"
+        return os.path.relpath(path, self.site.directory)
+
+    def request(self, params=None, data=None):
+        "A GET request (or POST with data) of a superuser"
+        url = '/?' + urlencode(params or {})
+        request = RequestFactory().post(url, data) if data is not None else RequestFactory().get(url)
+        request.user = User(is_active=True, is_staff=True, is_superuser=True)
+        request._messages = CookieStorage(request)
+        return request
+
+    def listing(self, path, **kwargs):
+        return FileListing(path, site=self.site, **kwargs)
+
+    def image_fileobjects(self, size_name=None):
+        sizes = [size_name] if size_name else sorted(self.tree.images)
+        return [FileObject(path, site=self.site) for size in sizes for path in self.tree.images[size]]
+
+
+def render(response):
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+# Listing
+
+@benchmark('listing')
+def bench_listing(ctx):
+    def run():
+        return len(ctx.listing(ctx.tree.flat_path).files_listing_filtered())
+    return run
+
+
+@benchmark('listing_sorted_page')
+def bench_listing_sorted_page(ctx):
+    "Sorted by date (requires the date of every file), first page with filesizes"
+    def run():
+        files = ctx.listing(ctx.tree.flat_path, sorting_by='date', sorting_order='desc').files_listing_filtered()
+        page = Paginator(files, LIST_PER_PAGE).page(1)
+        for fileobject in page.object_list:
+            fileobject.filesize
+        return len(files)
+    return run
+
+
+@benchmark('browse')
+def bench_browse(ctx):
+    "The browse view (including the template), first page of the flat folder"
+    def run():
+        render(ctx.site.browse(ctx.request(params={'dir': ctx.relative(ctx.tree.flat_path)})))
+        return 1
+
+    def reset():
+        # versions shown with the listing are generated once, not with every run
+        render(ctx.site.browse(ctx.request(params={'dir': ctx.relative(ctx.tree.flat_path)})))
+    return run, reset
+
+
+@benchmark('walk')
+def bench_walk(ctx):
+    def run():
+        return len(ctx.listing(ctx.tree.nested_path).files_walk_filtered())
+    return run
+
+
+@benchmark('search_traverse')
+def bench_search_traverse(ctx):
+    "Search (with SEARCH_TRAVERSE) for a substring within all subfolders"
+    def run():
+        with patch('filebrowser.sites.SEARCH_TRAVERSE', True):
+            render(ctx.site.browse(ctx.request(params={'dir': ctx.relative(ctx.tree.nested_path), 'q': 'alpha'})))
+        return 1
+    return run
+
+
+# Versions
+
+def bench_versions(size_name):
+    def bench(ctx):
+        "All VERSIONS of every image (with a single decode per image)"
+        fileobjects = ctx.image_fileobjects(size_name)
+
+        def run():
+            for fileobject in fileobjects:
+                fileobject.versions_generate(list(VERSIONS))
+            return len(fileobjects)
+
+        def reset():
+            for fileobject in fileobjects:
+                fileobject.delete_versions()
+        return run, reset
+    return bench
+
+
+def bench_scale_and_crop(size_name, version_suffix):
+    def bench(ctx):
+        "scale_and_crop only (decoded image, no storage)"
+        with ctx.site.storage.open(ctx.tree.images[size_name][0]) as f:
+            im = Image.open(io.BytesIO(f.read()))
+            im.load()
+        options = VERSIONS[version_suffix]
+
+        def run():
+            scale_and_crop(im, options.get('width'), options.get('height'), options.get('opts', ''))
+            return 1
+        return run
+    return bench
+
+
+for size_name in sorted(IMAGE_SIZES):
+    benchmark('versions.%s' % size_name)(bench_versions(size_name))
+    for version_suffix in sorted(VERSIONS):
+        benchmark('scale_and_crop.%s.%s' % (size_name, version_suffix), storages=('memory', ))(
+            bench_scale_and_crop(size_name, version_suffix))
+
+
+# Uploads
+
+@benchmark('upload')
+def bench_upload(ctx):
+    "Uploads of a medium image with the ajax upload view (10 files)"
+    with ctx.site.storage.open(ctx.tree.images['medium'][0]) as f:
+        content = f.read()
+    upload_path = os.path.join(ctx.tree.path, 'uploads')
+
+    def run():
+        for i in range(10):
+            request = ctx.request({'folder': ctx.relative(upload_path)}, {'file': SimpleUploadedFile('upload_%d.jpg' % i, content)})
+            ctx.site._upload_file(request)
+        return 10
+
+    def reset():
+        if ctx.site.storage.exists(upload_path):
+            ctx.site.storage.rmtree(upload_path)
+        ctx.site.storage.makedirs(upload_path)
+    return run, reset
+
+
+# fb_version_generate (uses the default site, local storage only)
+
+def bench_version_generate(workers):
+    def bench(ctx):
+        "Throughput of fb_version_generate with the images folder"
+        fileobjects = ctx.image_fileobjects()
+
+        def run():
+            call_command('fb_version_generate', ctx.tree.images_path,
+                         versions=list(VERSIONS), interactive=False, workers=workers, verbosity=0)
+            return len(fileobjects)
+
+        def reset():
+            for fileobject in fileobjects:
+                fileobject.delete_versions()
+        return run, reset
+    return bench
+
+
+benchmark('fb_version_generate.workers_1', storages=('local', ))(bench_version_generate(1))
+benchmark('fb_version_generate.workers_4', storages=('local', ))(bench_version_generate(4))
+
+
+# Runner
+
+def get_site(storage_name):
+    if storage_name == 'local':
+        return default_site
+    site = FileBrowserSite(name='filebrowser_benchmark_%s' % storage_name, storage=InMemoryStorage())
+    site.directory = default_site.directory
+    return site
+
+
+def time_benchmark(setup, repeat):
+    "Times a benchmark (s. benchmark) repeat times"
+    run, reset = setup if isinstance(setup, tuple) else (setup, None)
+    timings = []
+    ops = 0
+    for i in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.time()
+        ops = run()
+        timings.append(time.time() - start)
+    timings.sort()
+    median = timings[len(timings) // 2] if len(timings) % 2 else sum(timings[len(timings) // 2 - 1:len(timings) // 2 + 1]) / 2
+    return {
+        'repeat': repeat,
+        'min': timings[0],
+        'median': median,
+        'mean': sum(timings) / len(timings),
+        'max': timings[-1],
+        'ops': ops,
+        'ops_per_second': ops / median if median else None,
+    }
+
+
+def run_suite(sizes=(1000, ), storages=('local', 'memory'), repeat=3, select=None, images_per_size=10, log=None):
+    """
+    Runs the benchmarks (names starting with one of select, default: all)
+    for every number of files (sizes) and storage, returns a list of results.
+    """
+    results = []
+    for storage_name in storages:
+        site = get_site(storage_name)
+        for count in sizes:
+            tree = MediaTree(site.storage, os.path.join(site.directory, 'benchmark'), count, images_per_size=images_per_size)
+            tree.remove()
+            if log:
+                log('creating %d files (%s storage)' % (count, storage_name))
+            tree.create()
+            ctx = Context(site, storage_name, tree)
+            try:
+                for name, func, benchmark_storages in BENCHMARKS:
+                    if storage_name not in benchmark_storages:
+                        continue
+                    if select and not any(name.startswith(prefix) for prefix in select):
+                        continue
+                    result = time_benchmark(func(ctx), repeat)
+                    result.update(benchmark=name, storage=storage_name, files=count)
+                    results.append(result)
+                    if log:
+                        log(format_result(result))
+            finally:
+                tree.remove()
+    return results
+
+
+def format_result(result):
+    return '%-40s %-7s %7d files  median %9.2f ms  min %9.2f ms  %10.1f ops/s' % (
+        result['benchmark'], result['storage'], result['files'], result['median'] * 1000, result['min'] * 1000,
+        result['ops_per_second'] or 0)
+
+
+def get_metadata():
+    "Environment of a benchmark run (in order to compare results)"
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode('ascii').strip()
+    except Exception:
+        revision = None
+    return {
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'revision': revision,
+        'python': sys.version.split()[0],
+        'django': django.get_version(),
+        'pil': getattr(Image, '__version__', getattr(Image, 'VERSION', None)),
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, previous, threshold):
+    """
+    Compares the medians with previous results (same benchmark, storage and
+    files). Returns a list of (result, ratio) slower than threshold (e.g. 1.2).
+    """
+    previous = dict(((r['benchmark'], r['storage'], r['files']), r) for r in previous)
+    regressions = []
+    for result in results:
+        before = previous.get((result['benchmark'], result['storage'], result['files']))
+        if before and before['median']:
+            ratio = result['median'] / before['median']
+            result['previous_median'] = before['median']
+            if ratio > threshold:
+                regressions.append((result, ratio))
+    return regressions
+
+
+def write_results(filename, results, **options):
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(force_text(json.dumps({'metadata': get_metadata(), 'options': options, 'results': results}, indent=2, sort_keys=True)))
@@ -1,19 +1,25 @@
 # coding: utf-8
 
 import datetime
+import hashlib
+import heapq
+import math
 import mimetypes
 import os
 import platform
 import tempfile
 import time
 
+from operator import attrgetter
+
 from django.core.files import File
-from django.utils.encoding import python_2_unicode_compatible, force_text
+from django.utils.encoding import python_2_unicode_compatible, force_bytes, force_text
 from django.utils.six import string_types
 from django.utils.functional import cached_property
 
-from filebrowser.settings import EXTENSIONS, VERSIONS, ADMIN_VERSIONS, VERSIONS_BASEDIR, VERSION_QUALITY, STRICT_PIL, IMAGE_MAXBLOCK, DEFAULT_PERMISSIONS
-from filebrowser.utils import path_strip, process_image
+from filebrowser.settings import VERSIONS, ADMIN_VERSIONS, VERSIONS_BASEDIR, VERSION_QUALITY, STRICT_PIL, IMAGE_MAXBLOCK, DEFAULT_PERMISSIONS, VERSION_DRAFT_MODE, VERSIONS_MANIFEST
+from filebrowser.utils import (path_strip, process_image, get_image_dimensions_from_header,
+    get_default_processors, scale_and_crop, scale_and_crop_ratio, crop_center, get_file_type)
 from .namers import get_namer
 
 if STRICT_PIL:
@@ -32,6 +38,194 @@ from .compat import get_modified_time
 ImageFile.MAXBLOCK = IMAGE_MAXBLOCK  # default is 64k
 
 
+# FileObject attributes which only depend on the path of a file, mapped to
+# a function returning the attribute for a filename. Listings sorted by these
+# attributes can be sorted before any FileObject is created (s. files_listing_lazy).
+NAME_SORTING_ATTRS = {
+    'filename': lambda filename: filename,
+    'filename_lower': lambda filename: filename.lower(),
+    'filename_root': lambda filename: os.path.splitext(filename)[0],
+    'extension': lambda filename: os.path.splitext(filename)[1],
+}
+
+
+def options_hash(options):
+    "A hash of version options (callables, e.g. methods, are represented by their name)"
+    def name(value):
+        if callable(value):
+            return '%s.%s' % (getattr(value, '__module__', ''), getattr(value, '__name__', repr(value)))
+        if isinstance(value, (list, tuple)):
+            return [name(item) for item in value]
+        return value
+    items = sorted((key, name(value)) for key, value in options.items())
+    return hashlib.md5(force_bytes(repr(items))).hexdigest()
+
+
+# FileObject attributes which can be filled from a ListingEntry
+LISTING_FIELDS = ('is_folder', 'exists', 'filesize', 'date')
+MISSING_FILE_METADATA = {'is_folder': False, 'exists': False, 'filesize': None, 'date': None}
+
+# FileObject attributes used for sorting, mapped to the LISTING_FIELDS these
+# depend on (prefetched with a single pass before sorting, s. FileListing.sort_keys)
+METADATA_SORTING_FIELDS = {
+    'is_folder': ('is_folder', ),
+    'exists': ('exists', ),
+    'filesize': ('exists', 'filesize'),
+    'date': ('exists', 'date'),
+    'datetime': ('exists', 'date'),
+    'filetype': ('is_folder', ),
+}
+
+# Sort keys of missing values (None) for FileObject attributes, so these
+# sort before any other value
+SORT_KEY_MISSING = {
+    'filesize': float('-inf'),
+    'date': float('-inf'),
+    'datetime': datetime.datetime.min,
+    'dimensions': (),
+    'width': float('-inf'),
+    'height': float('-inf'),
+    'aspectratio': float('-inf'),
+}
+
+
+def prefetch_metadata(fileobjects, fields=LISTING_FIELDS):
+    """
+    Fill is_folder, exists, filesize and date (or just fields) of fileobjects
+    with one listing (s. FileListing.listing_entries) per directory, instead
+    of separate storage calls for every FileObject and attribute.
+
+    FileObjects not found with the listing do not exist. Nothing is filled
+    if the storage does not implement scandir.
+    """
+    slot_names = [FileObject.__dict__[field].slot_name for field in fields]
+    groups = {}
+    for fileobject in fileobjects:
+        if not all(hasattr(fileobject, slot_name) for slot_name in slot_names):
+            groups.setdefault((fileobject.site, fileobject.head), []).append(fileobject)
+    for (site, head), group in groups.items():
+        entries = FileListing(head, site=site).listing_entries()
+        if entries is None:
+            continue
+        entries = dict((entry.name, entry) for entry in entries)
+        for fileobject in group:
+            entry = entries.get(fileobject.filename)
+            if entry is not None:
+                fileobject.set_listing_entry(entry, fields)
+            else:
+                for field in fields:
+                    setattr(fileobject, field, MISSING_FILE_METADATA[field])
+
+
+def prefetch_versions(fileobjects):
+    """
+    List the directories containing the versions of fileobjects (one
+    listing per directory), so version_outdated (and version_generate)
+    do not need any storage calls for existing versions.
+
+    Nothing is prefetched if the storage does not implement scandir.
+    """
+    groups = {}
+    for fileobject in fileobjects:
+        if not fileobject.is_version:
+            version_dir = os.path.join(fileobject.versions_basedir, fileobject.dirname)
+            groups.setdefault((fileobject.site, version_dir), []).append(fileobject)
+    for (site, version_dir), group in groups.items():
+        entries = FileListing(version_dir, site=site).listing_entries()
+        if entries is None:
+            continue
+        entries = dict((entry.name, entry) for entry in entries)
+        for fileobject in group:
+            fileobject._version_entries = entries
+
+
+class LazyFileObjects(object):
+    """
+    A sequence of FileObjects which only keeps the filenames and creates
+    FileObjects for the items being accessed. This way, a Paginator only
+    creates FileObjects for the current page.
+    """
+
+    def __init__(self, path, filenames, site):
+        self.path = path
+        self.filenames = filenames
+        self.site = site
+
+    def _fileobject(self, filename):
+        return FileObject(os.path.join(self.path, filename), site=self.site)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._fileobject(filename) for filename in self.filenames[index]]
+        return self._fileobject(self.filenames[index])
+
+    def __iter__(self):
+        for filename in self.filenames:
+            yield self._fileobject(filename)
+
+    def filter(self, filename_filter):
+        "Returns a new LazyFileObjects with the filenames passing filename_filter"
+        return LazyFileObjects(self.path, [f for f in self.filenames if filename_filter(f)], self.site)
+
+
+class SortedFileObjects(object):
+    """
+    A sequence of FileObjects, sorted by their sort keys (s. FileListing.sort_keys).
+
+    Items are only sorted as far as they are accessed: the first page of a
+    Paginator is selected with heapq (O(n log k)) instead of sorting all
+    FileObjects, iterating sorts all of them.
+    """
+
+    def __init__(self, files, keys, reverse=False):
+        self.files = files
+        self.keys = keys
+        self.reverse = reverse
+        # indices (of files) of the first items
+        self._order = []
+        self._complete = False
+
+    def head(self, count):
+        "Indices of the first count FileObjects, sorted"
+        if self._complete or count <= len(self._order):
+            return self._order
+        indices = range(len(self.files))
+        key = self.keys.__getitem__
+        if count * 4 < len(self.files):
+            if self.reverse:
+                # equal keys in reverse order, like a reversed ascending sort
+                self._order = heapq.nlargest(count, reversed(indices), key=key)
+            else:
+                self._order = heapq.nsmallest(count, indices, key=key)
+        else:
+            self._order = sorted(indices, key=key)
+            if self.reverse:
+                self._order.reverse()
+            self._complete = True
+        return self._order
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            order = self.head(len(self) if step < 0 else stop)
+            return [self.files[i] for i in order[start:stop:step]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.files[self.head(index + 1)[index]]
+
+    def __iter__(self):
+        for i in self.head(len(self)):
+            yield self.files[i]
+
+
 class FileListing():
     """
     The FileListing represents a group of FileObjects/FileDirObjects.
@@ -66,6 +260,8 @@ class FileListing():
 
     # HELPER METHODS
     # sort_by_attr
+    # sort_keys
+    # sort_fileobjects
 
     def sort_by_attr(self, seq, attr):
         """
@@ -78,100 +274,250 @@ class FileListing():
         Returns:
         the sorted list of objects.
         """
-        from operator import attrgetter
         if isinstance(attr, string_types):  # Backward compatibility hack
             attr = (attr, )
         return sorted(seq, key=attrgetter(*attr))
 
+    def _sorting_attrs(self):
+        attrs = self.sorting_by
+        if isinstance(attrs, string_types):
+            attrs = (attrs, )
+        return tuple(attrs or ())
+
+    def sort_keys(self, files):
+        """
+        Returns the sort key of every FileObject of files.
+
+        Metadata needed for sorting (e.g. date) is prefetched with one
+        listing per directory first (s. prefetch_metadata), attributes based
+        on the filename are computed without any storage call. Missing
+        values (None) are replaced with keys sorting before any other value
+        (s. SORT_KEY_MISSING).
+        """
+        attrs = self._sorting_attrs()
+        fields = []
+        for attr in attrs:
+            for field in METADATA_SORTING_FIELDS.get(attr, ()):
+                if field not in fields:
+                    fields.append(field)
+        if fields:
+            prefetch_metadata(files, fields)
+
+        columns = []
+        for attr in attrs:
+            if attr in NAME_SORTING_ATTRS:
+                column = list(map(NAME_SORTING_ATTRS[attr], map(attrgetter('filename'), files)))
+            else:
+                column = list(map(attrgetter(attr), files))
+                if None in column:
+                    if attr in SORT_KEY_MISSING:
+                        missing = SORT_KEY_MISSING[attr]
+                        column = [missing if value is None else value for value in column]
+                    else:
+                        column = [(value is not None, value) for value in column]
+            columns.append(column)
+        if len(columns) == 1:
+            return columns[0]
+        return list(zip(*columns)) if columns else [()] * len(files)
+
+    def sort_fileobjects(self, files):
+        """
+        Returns files sorted by sorting_by and sorting_order (as
+        SortedFileObjects, which only sorts the items being accessed).
+        files itself is not modified.
+        """
+        return SortedFileObjects(files, self.sort_keys(files), reverse=self.sorting_order == "desc")
+
     @cached_property
     def is_folder(self):
         return self.site.storage.isdir(self.path)
 
     def listing(self):
         "List all files for path"
+        if self._listing_entries is not None:
+            return (entry.name for entry in self._listing_entries)
         if self.is_folder:
             dirs, files = self.site.storage.listdir(self.path)
             return (f for f in dirs + files)
         return []
 
-    def _walk(self, path, filelisting):
+    def listing_entries(self):
         """
-        Recursively walks the path and collects all files and
-        directories.
-
-        Danger: Symbolic links can create cycles and this function
-        ends up in a regression.
+        List all files for path as ListingEntry items (s. storage.scandir),
+        or None if site.storage is not able to list metadata along with names.
         """
-        dirs, files = self.site.storage.listdir(path)
+        if self._listing_entries is not None:
+            return self._listing_entries
+        if getattr(self.site.storage, 'scandir', None) is None:
+            return None
+        if not self.is_folder:
+            return []
+        cache = getattr(self.site, 'metadata_cache', None)
+        try:
+            if cache is not None:
+                self._listing_entries = cache.scandir(self.site.storage, self.path)
+            else:
+                self._listing_entries = self.site.storage.scandir(self.path)
+        except NotImplementedError:
+            return None
+        return self._listing_entries
 
-        if dirs:
-            for d in dirs:
-                self._walk(os.path.join(path, d), filelisting)
-                filelisting.extend([path_strip(os.path.join(path, d), self.site.directory)])
+    def _walk_key(self, path):
+        """
+        Identifies the directory path with (st_dev, st_ino), in order to
+        detect cycles (created with symbolic links) while walking.
+        None with storages not providing local paths.
+        """
+        try:
+            stat = os.stat(self.site.storage.path(path))
+        except (NotImplementedError, OSError):
+            return None
+        return stat.st_dev, stat.st_ino
 
-        if files:
-            for f in files:
-                filelisting.extend([path_strip(os.path.join(path, f), self.site.directory)])
+    def walk_iter(self, max_depth=None, stop_func=None):
+        """
+        Walk all files for path, yielding paths (relative to site.directory)
+        as they are found: the content of a directory comes before the
+        directory itself, directories before files.
+
+        Directories are not descended into more than max_depth levels
+        (1 only yields the content of path). The walk ends after yielding
+        an item for which stop_func returns True. Directories already
+        visited (e.g. with symbolic links) are not walked again.
+        """
+        if not self.is_folder:
+            return
+        visited = set([self._walk_key(self.path)])
+        dirs, files = self.site.storage.listdir(self.path)
+        # Every frame: path, depth, remaining directories, files
+        stack = [(self.path, 0, iter(dirs), files)]
+        while stack:
+            path, depth, dirs, files = stack[-1]
+            d = next(dirs, None)
+            if d is not None:
+                dir_path = os.path.join(path, d)
+                key = self._walk_key(dir_path)
+                if (max_depth is None or depth + 1 < max_depth) and (key is None or key not in visited):
+                    visited.add(key)
+                    child_dirs, child_files = self.site.storage.listdir(dir_path)
+                    stack.append((dir_path, depth + 1, iter(child_dirs), child_files))
+                    continue
+                items = [dir_path]
+            else:
+                stack.pop()
+                items = [os.path.join(path, f) for f in files]
+                if stack:
+                    # the directory itself follows its content
+                    items.append(path)
+            for item in items:
+                item = path_strip(item, self.site.directory)
+                yield item
+                if stop_func is not None and stop_func(item):
+                    return
 
     def walk(self):
         "Walk all files for path"
-        filelisting = []
-        if self.is_folder:
-            self._walk(self.path, filelisting)
-        return filelisting
+        return list(self.walk_iter())
 
+    # Cached results of listing_entries (folders first, then files)
+    _listing_entries = None
     # Cached results of files_listing_total (without any filters and sorting applied)
     _fileobjects_total = None
 
-    def files_listing_total(self):
-        "Returns FileObjects for all files in listing"
+    def _sorted(self, files, sort):
+        if not sort:
+            return list(files)
+        if not self.sorting_by and self.sorting_order != "desc":
+            return list(files)
+        return list(self.sort_fileobjects(files))
+
+    def files_listing_total(self, sort=True):
+        "Returns FileObjects for all files in listing (unsorted with sort=False)"
         if self._fileobjects_total is None:
             self._fileobjects_total = []
-            for item in self.listing():
-                fileobject = FileObject(os.path.join(self.path, item), site=self.site)
-                self._fileobjects_total.append(fileobject)
-
-        files = self._fileobjects_total
-
-        if self.sorting_by:
-            files = self.sort_by_attr(files, self.sorting_by)
-        if self.sorting_order == "desc":
-            files.reverse()
+            entries = self.listing_entries()
+            if entries is not None:
+                for entry in entries:
+                    fileobject = FileObject(os.path.join(self.path, entry.name), site=self.site)
+                    fileobject.set_listing_entry(entry)
+                    self._fileobjects_total.append(fileobject)
+            else:
+                for item in self.listing():
+                    fileobject = FileObject(os.path.join(self.path, item), site=self.site)
+                    self._fileobjects_total.append(fileobject)
 
+        # a new list, the cached FileObjects keep their order
+        files = self._sorted(self._fileobjects_total, sort)
         self._results_listing_total = len(files)
         return files
 
-    def files_walk_total(self):
-        "Returns FileObjects for all files in walk"
-        files = []
-        for item in self.walk():
+    def files_walk_iter(self, max_depth=None, stop_func=None):
+        """
+        Yields FileObjects for filtered files in walk (unsorted, s. walk_iter),
+        without collecting the whole tree first.
+        """
+        for item in self.walk_iter(max_depth=max_depth, stop_func=stop_func):
             fileobject = FileObject(os.path.join(self.site.directory, item), site=self.site)
-            files.append(fileobject)
-        if self.sorting_by:
-            files = self.sort_by_attr(files, self.sorting_by)
-        if self.sorting_order == "desc":
-            files.reverse()
+            if not self.filter_func or self.filter_func(fileobject):
+                yield fileobject
+
+    def files_walk_total(self, sort=True):
+        "Returns FileObjects for all files in walk (unsorted with sort=False)"
+        files = [FileObject(os.path.join(self.site.directory, item), site=self.site) for item in self.walk_iter()]
+        files = self._sorted(files, sort)
         self._results_walk_total = len(files)
         return files
 
-    def files_listing_filtered(self):
-        "Returns FileObjects for filtered files in listing"
+    def files_listing_filtered(self, sort=True):
+        """
+        Returns FileObjects for filtered files in listing (unsorted with
+        sort=False). Files are filtered before sorting.
+        """
+        listing = self.files_listing_total(sort=False)
         if self.filter_func:
-            listing = list(filter(self.filter_func, self.files_listing_total()))
-        else:
-            listing = self.files_listing_total()
+            listing = list(filter(self.filter_func, listing))
+        listing = self._sorted(listing, sort)
         self._results_listing_filtered = len(listing)
         return listing
 
-    def files_walk_filtered(self):
-        "Returns FileObjects for filtered files in walk"
+    def files_walk_filtered(self, sort=True):
+        """
+        Returns FileObjects for filtered files in walk (unsorted with
+        sort=False). Files are filtered before sorting.
+        """
+        listing = self.files_walk_total(sort=False)
         if self.filter_func:
-            listing = list(filter(self.filter_func, self.files_walk_total()))
-        else:
-            listing = self.files_walk_total()
+            listing = list(filter(self.filter_func, listing))
+        listing = self._sorted(listing, sort)
         self._results_walk_filtered = len(listing)
         return listing
 
+    def sorting_by_name(self):
+        "True, if the listing is sorted by path based attributes only (s. NAME_SORTING_ATTRS)"
+        return all(attr in NAME_SORTING_ATTRS for attr in self._sorting_attrs())
+
+    def files_listing_lazy(self, filename_filter=None):
+        """
+        Returns LazyFileObjects for filtered files in listing.
+
+        Filenames are filtered with filename_filter (instead of filter_func)
+        and sorted without creating any FileObject, which requires the listing
+        to be sorted by name (s. sorting_by_name).
+        """
+        if not self.sorting_by_name():
+            raise ValueError("Lazy listings cannot be sorted by %s" % (self.sorting_by, ))
+        filenames = list(self.listing())
+        self._results_listing_total = len(filenames)
+        if filename_filter:
+            filenames = [f for f in filenames if filename_filter(f)]
+        if self.sorting_by:
+            getters = [NAME_SORTING_ATTRS[attr] for attr in self._sorting_attrs()]
+            filenames.sort(key=lambda f: tuple(getter(f) for getter in getters))
+        if self.sorting_order == "desc":
+            filenames.reverse()
+        self._results_listing_filtered = len(filenames)
+        return LazyFileObjects(self.path, filenames, self.site)
+
     def results_listing_total(self):
         "Counter: all files"
         if self._results_listing_total is not None:
@@ -197,8 +543,58 @@ class FileListing():
         return len(self.files_walk_filtered())
 
 
+class slot_cached_property(object):
+    """
+    Like cached_property, but the value is kept with a slot of the instance
+    (named _cached_<name>, s. FileObject.__slots__) instead of its __dict__.
+
+    The value can be set (e.g. with prefetched metadata) and deleted.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+        self.name = func.__name__
+        self.slot_name = '_cached_%s' % self.name
+        self.slot = None
+
+    def _slot(self, cls):
+        if self.slot is None:
+            self.slot = getattr(cls, self.slot_name)
+        return self.slot
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        slot = self._slot(type(instance))
+        try:
+            return slot.__get__(instance)
+        except AttributeError:
+            pass
+        value = self.func(instance)
+        slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self._slot(type(instance)).__set__(instance, value)
+
+    def __delete__(self, instance):
+        try:
+            self._slot(type(instance)).__delete__(instance)
+        except AttributeError:
+            pass
+
+    def is_cached(self, instance):
+        "True, if the value has been computed (or set) with instance"
+        try:
+            self._slot(type(instance)).__get__(instance)
+        except AttributeError:
+            return False
+        return True
+
+
 @python_2_unicode_compatible
-class FileObject():
+class FileObject(object):
     """
     The FileObject represents a file (or directory) on the server.
 
@@ -210,6 +606,15 @@ class FileObject():
     where path is a relative path to a storage location
     """
 
+    # Listings create lots of FileObjects, so these have no __dict__: the
+    # attributes derived from the path are computed with every access and
+    # cached properties (s. slot_cached_property) are kept with slots.
+    __slots__ = (
+        'site', 'path', '_version_entries', '__weakref__',
+        '_cached_mimetype', '_cached_filetype', '_cached_filesize', '_cached_date', '_cached_exists',
+        '_cached_dimensions', '_cached_is_folder',
+    )
+
     def __init__(self, path, site=None):
         if not site:
             from filebrowser.sites import site as default_site
@@ -219,11 +624,19 @@ class FileObject():
             self.path = path.replace('\\', '/')
         else:
             self.path = path
-        self.head = os.path.dirname(path)
-        self.filename = os.path.basename(path)
-        self.filename_lower = self.filename.lower()
-        self.filename_root, self.extension = os.path.splitext(self.filename)
-        self.mimetype = mimetypes.guess_type(self.filename)
+        # entries of the versions directory (s. prefetch_versions)
+        self._version_entries = None
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for name in FileObject.__slots__:
+            if name != '__weakref__' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def __str__(self):
         return force_text(self.path)
@@ -238,17 +651,66 @@ class FileObject():
     def __len__(self):
         return len(self.path)
 
+    # PATH COMPONENTS
+    # head
+    # filename
+    # filename_lower
+    # filename_root
+    # extension
+    # mimetype
+
+    @property
+    def head(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def filename_lower(self):
+        return self.filename.lower()
+
+    @property
+    def filename_root(self):
+        return os.path.splitext(self.filename)[0]
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.filename)[1]
+
+    @slot_cached_property
+    def mimetype(self):
+        return mimetypes.guess_type(self.filename)
+
     # HELPER METHODS
     # _get_file_type
+    # is_cached
+    # set_listing_entry
 
     def _get_file_type(self):
         "Get file type as defined in EXTENSIONS."
-        file_type = ''
-        for k, v in EXTENSIONS.items():
-            for extension in v:
-                if self.extension.lower() == extension.lower():
-                    file_type = k
-        return file_type
+        return get_file_type(self.extension)
+
+    def is_cached(self, name):
+        "True, if the cached property name (e.g. filesize) has been computed or filled already"
+        return getattr(type(self), name).is_cached(self)
+
+    def set_listing_entry(self, entry, fields=LISTING_FIELDS):
+        """
+        Fill is_folder, exists, filesize and date (or just fields) from a
+        ListingEntry (s. storage.scandir), so these need no further storage calls.
+        """
+        # Directories of remote storages have no modified time
+        exists = entry.is_dir or entry.modified_time is not None
+        values = {
+            'is_folder': entry.is_dir,
+            'exists': exists,
+            'filesize': entry.size if exists else None,
+            'date': time.mktime(entry.modified_time.timetuple()) if entry.modified_time is not None else None,
+        }
+        for field in fields:
+            setattr(self, field, values[field])
 
     # GENERAL ATTRIBUTES/PROPERTIES
     # filetype
@@ -257,17 +719,17 @@ class FileObject():
     # datetime
     # exists
 
-    @cached_property
+    @slot_cached_property
     def filetype(self):
         "Filetype as defined with EXTENSIONS"
         return 'Folder' if self.is_folder else self._get_file_type()
 
-    @cached_property
+    @slot_cached_property
     def filesize(self):
         "Filesize in bytes"
         return self.site.storage.size(self.path) if self.exists else None
 
-    @cached_property
+    @slot_cached_property
     def date(self):
         "Modified time (from site.storage) as float (mktime)"
         if self.exists:
@@ -281,7 +743,7 @@ class FileObject():
             return datetime.datetime.fromtimestamp(self.date)
         return None
 
-    @cached_property
+    @slot_cached_property
     def exists(self):
         "True, if the path exists, False otherwise"
         return self.site.storage.exists(self.path)
@@ -320,16 +782,50 @@ class FileObject():
     # aspectratio
     # orientation
 
-    @cached_property
+    @slot_cached_property
     def dimensions(self):
         "Image dimensions as a tuple"
         if self.filetype != 'Image':
             return None
+        cache = getattr(self.site, 'metadata_cache', None)
+        if cache is not None and self.date is not None:
+            metadata = cache.get_file(self.path, self.date)
+            if 'dimensions' in metadata:
+                return metadata['dimensions']
         try:
-            im = Image.open(self.site.storage.open(self.path))
-            return im.size
+            dimensions = self._read_dimensions()
         except:
-            pass
+            return None
+        if cache is not None and self.date is not None:
+            cache.set_file(self.path, self.date, dimensions=dimensions)
+        return dimensions
+
+    # Number of bytes read from the start of an image file in order to find
+    # its dimensions, before falling back to PIL
+    dimensions_header_sizes = (4 * 1024, 64 * 1024)
+
+    def _read_dimensions(self):
+        "Read image dimensions from the header of the file (or with PIL for unknown formats)"
+        storage = self.site.storage
+        for length in self.dimensions_header_sizes:
+            if hasattr(storage, 'read_header'):
+                header = storage.read_header(self.path, length)
+            else:
+                f = storage.open(self.path)
+                try:
+                    header = f.read(length)
+                finally:
+                    f.close()
+            dimensions = get_image_dimensions_from_header(header)
+            if dimensions:
+                return tuple(dimensions)
+            if len(header) < length:  # whole file has been read
+                break
+        f = storage.open(self.path)
+        try:
+            return Image.open(f).size
+        finally:
+            f.close()
 
     @property
     def width(self):
@@ -366,7 +862,7 @@ class FileObject():
     # is_folder
     # is_empty
 
-    @cached_property
+    @slot_cached_property
     def is_folder(self):
         "True, if path is a folder"
         return self.site.storage.isdir(self.path)
@@ -425,7 +921,9 @@ class FileObject():
     # admin_versions()
     # version_name(suffix)
     # version_path(suffix)
+    # version_outdated(suffix)
     # version_generate(suffix)
+    # versions_generate(suffixes)
 
     def _get_options(self, version_suffix, extra_options=None):
         options = dict(VERSIONS.get(version_suffix, {}))
@@ -471,33 +969,128 @@ class FileObject():
             self.dirname,
             self.version_name(version_suffix, extra_options))
 
+    @property
+    def versions_manifest(self):
+        "The cache recording generated versions (s. VERSIONS_MANIFEST), or None"
+        if not VERSIONS_MANIFEST:
+            return None
+        return getattr(self.site, 'metadata_cache', None)
+
+    def version_outdated(self, version_suffix, extra_options=None):
+        """
+        True, if a version does not exist or is older than the original.
+
+        Versions recorded with the versions manifest (generated with the
+        same options) are not checked with the storage, unless the directory
+        of the version has been listed anyway (s. prefetch_versions).
+        """
+        version_path = self.version_path(version_suffix, extra_options)
+        manifest = self.versions_manifest
+        version_entries = self._version_entries
+        if manifest is not None:
+            options = self._get_options(version_suffix, extra_options)
+            record = manifest.get_version(self.path, version_path)
+            if record is not None and record['options_hash'] == options_hash(options) and \
+                    (not self.is_cached('date') or self.date == record['original_date']) and \
+                    (version_entries is None or os.path.basename(version_path) in version_entries):
+                return False
+        if version_entries is not None:
+            # the directory of the version has been listed (s. prefetch_versions)
+            entry = version_entries.get(os.path.basename(version_path))
+            if entry is None or entry.is_dir or entry.modified_time is None:
+                return True
+            if (self.date or 0) > time.mktime(entry.modified_time.timetuple()):
+                return True
+        elif not self.site.storage.isfile(version_path):
+            return True
+        elif get_modified_time(self.site.storage, self.path) > get_modified_time(self.site.storage, version_path):
+            return True
+        if manifest is not None:
+            self._record_version(version_suffix, version_path, options)
+        return False
+
     def version_generate(self, version_suffix, extra_options=None):
         "Generate a version"  # FIXME: version_generate for version?
-        path = self.path
         options = self._get_options(version_suffix, extra_options)
 
         version_path = self.version_path(version_suffix, extra_options)
-        if not self.site.storage.isfile(version_path):
-            version_path = self._generate_version(version_path, options)
-        elif get_modified_time(self.site.storage, path) > get_modified_time(self.site.storage, version_path):
-            version_path = self._generate_version(version_path, options)
+        if self.version_outdated(version_suffix, extra_options):
+            version_path = self._generate_version(version_path, options, version_suffix)
         return FileObject(version_path, site=self.site)
 
-    def _generate_version(self, version_path, options):
-        """
-        Generate Version for an Image.
-        value has to be a path relative to the storage location.
+    def versions_generate(self, version_suffixes, extra_options=None):
         """
+        Generate several versions with a single decode of the original.
 
-        tmpfile = File(tempfile.NamedTemporaryFile())
+        Only missing or outdated versions are generated.
+        Returns a dict with the FileObject of every version_suffix.
+        """
+        versions = {}
+        jobs = []
+        for version_suffix in version_suffixes:
+            version_path = self.version_path(version_suffix, extra_options)
+            if self.version_outdated(version_suffix, extra_options):
+                jobs.append((version_suffix, version_path, self._get_options(version_suffix, extra_options)))
+            else:
+                versions[version_suffix] = FileObject(version_path, site=self.site)
+        if not jobs:
+            return versions
+
+        im = self._open_image([options for version_suffix, version_path, options in jobs])
+        if im is None:
+            for version_suffix, version_path, options in jobs:
+                versions[version_suffix] = FileObject("", site=self.site)
+            return versions
+
+        for (version_suffix, version_path, options), version in self._process_versions(im, jobs):
+            version_path = self._save_version(version, version_path)
+            self._record_version(version_suffix, version_path, options, version.size)
+            versions[version_suffix] = FileObject(version_path, site=self.site)
+        return versions
+
+    def _draft_size(self, size, options_list):
+        """
+        The smallest size an image of size can be decoded with (s. Image.draft)
+        for generating versions with options_list, or None if the versions
+        need the image with its full size.
+        """
+        if not options_list or get_default_processors() != [scale_and_crop]:
+            return None
+        x, y = size
+        draft_x, draft_y = 0, 0
+        for options in options_list:
+            if not options.get('draft', VERSION_DRAFT_MODE):
+                return None
+            ratio = scale_and_crop_ratio(size, options.get('width'), options.get('height'), options.get('opts', ''))
+            if ratio is None or ratio[0] >= 1.0:
+                return None
+            draft_x = max(draft_x, int(math.ceil(x * ratio[0])))
+            draft_y = max(draft_y, int(math.ceil(y * ratio[0])))
+        return draft_x, draft_y
+
+    def _open_image(self, options_list=()):
+        """
+        Open and decode the original image (None, if the file cannot be opened).
 
+        JPEGs are decoded with a reduced size, if all versions
+        generated with options_list are small enough (s. _draft_size).
+        """
         try:
             f = self.site.storage.open(self.path)
         except IOError:
-            return ""
-        im = Image.open(f)
-        version_dir, version_basename = os.path.split(version_path)
-        root, ext = os.path.splitext(version_basename)
+            return None
+        try:
+            im = Image.open(f)
+            draft_size = self._draft_size(im.size, options_list)
+            if draft_size:
+                im.draft(im.mode, draft_size)
+            im.load()
+        finally:
+            f.close()
+        return im
+
+    def _process_version(self, im, options):
+        "Process the original image im with options"
         version = process_image(im, options)
         if not version:
             version = im
@@ -505,6 +1098,44 @@ class FileObject():
             for m in options['methods']:
                 if callable(m):
                     version = m(version)
+        return version
+
+    def _process_versions(self, im, jobs):
+        """
+        Yields (job, version) for a list of jobs (version_suffix, version_path, options).
+
+        With the default processor (scale_and_crop), downscaled versions are
+        processed from the largest to the smallest one. Every version is
+        scaled from the (uncropped) previous one instead of the original.
+        """
+        scaled_jobs = []
+        for job in jobs:
+            options = job[2]
+            ratio = None
+            if get_default_processors() == [scale_and_crop] and 'methods' not in options:
+                ratio = scale_and_crop_ratio(im.size, options.get('width'), options.get('height'), options.get('opts', ''))
+            if ratio is not None and ratio[0] < 1.0:
+                scaled_jobs.append((ratio, job))
+            else:
+                yield job, self._process_version(im, options)
+
+        source = im
+        x, y = im.size
+        for (r, xr, yr), job in sorted(scaled_jobs, key=lambda item: item[0][0], reverse=True):
+            size = (int(math.ceil(x * r)), int(math.ceil(y * r)))
+            if source.size != size:
+                source = source.resize(size, resample=Image.ANTIALIAS)
+            version = source
+            if 'crop' in job[2].get('opts', ''):
+                version = crop_center(source, xr, yr)
+            yield job, version
+
+    def _save_version(self, version, version_path):
+        "Save the processed image version to version_path"
+        tmpfile = File(tempfile.NamedTemporaryFile())
+
+        version_dir, version_basename = os.path.split(version_path)
+        root, ext = os.path.splitext(version_basename)
 
         # IF need Convert RGB
         if ext in [".jpg", ".jpeg"] and version.mode not in ("L", "RGB"):
@@ -519,11 +1150,38 @@ class FileObject():
         if version_path != self.site.storage.get_available_name(version_path):
             self.site.storage.delete(version_path)
         self.site.storage.save(version_path, tmpfile)
+        # prefetched version entries (s. prefetch_versions) are outdated now
+        self._version_entries = None
         # set permissions
         if DEFAULT_PERMISSIONS is not None:
             os.chmod(self.site.storage.path(version_path), DEFAULT_PERMISSIONS)
         return version_path
 
+    def _record_version(self, version_suffix, version_path, options, dimensions=None):
+        "Record a version with the versions manifest (if any)"
+        manifest = self.versions_manifest
+        if manifest is None:
+            return
+        manifest.set_version(
+            self.path, version_path,
+            original_date=self.date,
+            version_suffix=version_suffix,
+            options_hash=options_hash(options),
+            dimensions=dimensions)
+
+    def _generate_version(self, version_path, options, version_suffix=None):
+        """
+        Generate Version for an Image.
+        value has to be a path relative to the storage location.
+        """
+        im = self._open_image([options])
+        if im is None:
+            return ""
+        version = self._process_version(im, options)
+        version_path = self._save_version(version, version_path)
+        self._record_version(version_suffix, version_path, options, version.size)
+        return version_path
+
     # DELETE METHODS
     # delete()
     # delete_versions()
@@ -543,6 +1201,8 @@ class FileObject():
                 self.site.storage.delete(version)
             except:
                 pass
+        if self.versions_manifest is not None:
+            self.versions_manifest.delete_versions(self.path)
 
     def delete_admin_versions(self):
         "Delete admin versions"
@@ -551,3 +1211,5 @@ class FileObject():
                 self.site.storage.delete(version)
             except:
                 pass
+        if self.versions_manifest is not None:
+            self.versions_manifest.delete_versions(self.path, self.admin_versions())
@@ -0,0 +1,273 @@
+# coding: utf-8
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_bytes
+from django.utils.module_loading import import_string
+
+from filebrowser import signals
+from filebrowser.compat import get_modified_time
+from filebrowser.settings import METADATA_CACHE, METADATA_CACHE_OPTIONS
+
+logger = logging.getLogger('filebrowser')
+
+
+def get_metadata_cache(site):
+    "Returns the metadata cache (as defined with METADATA_CACHE) for a site, or None."
+    if not METADATA_CACHE:
+        return None
+    cache_cls = import_string(METADATA_CACHE)
+    options = dict(METADATA_CACHE_OPTIONS)
+    options.setdefault('key_prefix', site.name or '')
+    return cache_cls(**options)
+
+
+class MetadataCache(object):
+    """
+    Caches directory listings (s. storage.scandir) and file metadata
+    (e.g. image dimensions) in front of site.storage.
+
+    Listings are validated with the modified time of the directory, file
+    metadata with the modified time of the file. Subclasses only have to
+    implement get, set and delete.
+    """
+
+    def __init__(self, key_prefix=''):
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        "Returns the record stored with key, or None"
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        "Stores the record value with key"
+        raise NotImplementedError()
+
+    def delete(self, key):
+        "Removes the record stored with key (if any)"
+        raise NotImplementedError()
+
+    def make_key(self, kind, path):
+        path = os.path.normpath(path or '.')
+        digest = hashlib.md5(force_bytes(path)).hexdigest()
+        return 'filebrowser:%s:%s:%s' % (self.key_prefix, kind, digest)
+
+    def _modified_time(self, storage, path):
+        # Storages without modified times for directories (e.g. S3, where
+        # folders are key prefixes) raise AttributeError or return None
+        try:
+            return get_modified_time(storage, path)
+        except (OSError, NotImplementedError, AttributeError):
+            return None
+
+    def scandir(self, storage, path):
+        """
+        Returns storage.scandir(path), read from the cache as long as the
+        modified time of the directory did not change.
+        """
+        mtime = self._modified_time(storage, path)
+        if mtime is None:
+            return storage.scandir(path)
+        key = self.make_key('dir', path)
+        record = self.get(key)
+        if record is not None and record['mtime'] == mtime:
+            return record['entries']
+        entries = storage.scandir(path)
+        self.set(key, {'mtime': mtime, 'entries': list(entries)})
+        return entries
+
+    def get_file(self, path, mtime):
+        "Returns a dict of cached metadata for the file path (empty if stale or missing)"
+        record = self.get(self.make_key('file', path))
+        if record is None or record['mtime'] != mtime:
+            return {}
+        return record['metadata']
+
+    def set_file(self, path, mtime, **metadata):
+        "Stores metadata for the file path with its modified time"
+        key = self.make_key('file', path)
+        record = self.get(key)
+        if record is None or record['mtime'] != mtime:
+            record = {'mtime': mtime, 'metadata': {}}
+        record['metadata'].update(metadata)
+        self.set(key, record)
+
+    def get_version(self, path, version_path):
+        "Returns the manifest record of version_path for the original path (or None)"
+        return (self.get(self.make_key('versions', path)) or {}).get(version_path)
+
+    def set_version(self, path, version_path, **record):
+        "Records version_path of the original path with the version manifest"
+        key = self.make_key('versions', path)
+        versions = self.get(key) or {}
+        record.update(original=path, version_path=version_path)
+        versions[version_path] = record
+        self.set(key, versions)
+        # the original of a version, in order to remove versions by their path (s. delete_version)
+        self.set(self.make_key('version', version_path), {'original': path, 'version_path': version_path})
+
+    def delete_versions(self, path, version_paths=None):
+        "Removes version_paths (default: all versions) of the original path from the version manifest"
+        key = self.make_key('versions', path)
+        versions = self.get(key) or {}
+        if version_paths is None:
+            version_paths = list(versions)
+        for version_path in version_paths:
+            versions.pop(version_path, None)
+            self.delete(self.make_key('version', version_path))
+        if versions:
+            self.set(key, versions)
+        else:
+            self.delete(key)
+
+    def delete_version(self, version_path):
+        "Removes version_path from the version manifest of its original (e.g. when the file has been deleted)"
+        record = self.get(self.make_key('version', version_path))
+        if record is not None:
+            self.delete_versions(record['original'], [record['version_path']])
+
+    def get_content(self, digest):
+        "Returns the content index record (path and mtime) of a file with the content digest (or None)"
+        return self.get(self.make_key('content', digest))
+
+    def set_content(self, digest, path, mtime):
+        "Records path (with its modified time) as the file with the content digest"
+        self.set(self.make_key('content', digest), {'path': path, 'mtime': mtime})
+
+    def delete_content(self, digest):
+        "Removes the content digest from the content index"
+        self.delete(self.make_key('content', digest))
+
+    def invalidate(self, path):
+        "Removes all cached data (including the version manifest) for path and the listing of its parent directory"
+        path = os.path.normpath(path or '.')
+        self.delete(self.make_key('dir', path))
+        self.delete(self.make_key('file', path))
+        self.delete(self.make_key('versions', path))
+        self.delete(self.make_key('dir', os.path.dirname(path)))
+
+
+class DjangoMetadataCache(MetadataCache):
+    """
+    Stores metadata with Django's cache framework.
+    """
+
+    def __init__(self, key_prefix='', cache_alias='default', timeout=None):
+        super(DjangoMetadataCache, self).__init__(key_prefix=key_prefix)
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+class SQLiteMetadataCache(MetadataCache):
+    """
+    Stores metadata with a local SQLite database file. The location (an
+    absolute path) has to be given with METADATA_CACHE_OPTIONS.
+    """
+
+    def __init__(self, key_prefix='', location=None):
+        super(SQLiteMetadataCache, self).__init__(key_prefix=key_prefix)
+        if not location:
+            raise ImproperlyConfigured("SQLiteMetadataCache requires a location, e.g. "
+                                       "FILEBROWSER_METADATA_CACHE_OPTIONS = {'location': '/var/cache/filebrowser.sqlite3'}")
+        self.location = location
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.location)
+            connection.execute('CREATE TABLE IF NOT EXISTS filebrowser_metadata (key TEXT PRIMARY KEY, value BLOB)')
+            self._local.connection = connection
+        return connection
+
+    def __getstate__(self):
+        # connections are not pickled (e.g. with the site of a FileObject)
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    # Errors of the database (e.g. "database is locked" with several
+    # processes writing) are logged, records are read from the storage then.
+
+    def get(self, key):
+        try:
+            row = self.connection.execute('SELECT value FROM filebrowser_metadata WHERE key = ?', (key, )).fetchone()
+        except sqlite3.Error:
+            logger.warning('Error reading the metadata cache %s', self.location, exc_info=True)
+            return None
+        if row is None:
+            return None
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        try:
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO filebrowser_metadata (key, value) VALUES (?, ?)',
+                    (key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))))
+        except sqlite3.Error:
+            logger.warning('Error writing the metadata cache %s', self.location, exc_info=True)
+
+    def delete(self, key):
+        try:
+            with self.connection:
+                self.connection.execute('DELETE FROM filebrowser_metadata WHERE key = ?', (key, ))
+        except sqlite3.Error:
+            logger.warning('Error writing the metadata cache %s', self.location, exc_info=True)
+
+
+# Invalidate the metadata cache whenever the FileBrowser changes files/folders
+
+def invalidate_path(sender, path, site, **kwargs):
+    if getattr(site, 'metadata_cache', None) is not None:
+        site.metadata_cache.invalidate(path)
+
+
+def invalidate_upload(sender, file, site, **kwargs):
+    if getattr(site, 'metadata_cache', None) is not None:
+        site.metadata_cache.invalidate(file.path)
+
+
+def invalidate_rename(sender, path, new_name, site, **kwargs):
+    if getattr(site, 'metadata_cache', None) is not None:
+        site.metadata_cache.invalidate(path)
+        site.metadata_cache.invalidate(os.path.join(os.path.dirname(path), new_name))
+
+
+def invalidate_action(sender, site, **kwargs):
+    if getattr(site, 'metadata_cache', None) is not None:
+        for fileobject in kwargs.get('fileobject', kwargs.get('fileobjects', [])):
+            site.metadata_cache.invalidate(fileobject.path)
+
+
+signals.filebrowser_post_upload.connect(invalidate_upload)
+signals.filebrowser_post_createdir.connect(invalidate_path)
+signals.filebrowser_post_delete.connect(invalidate_path)
+signals.filebrowser_post_rename.connect(invalidate_rename)
+signals.filebrowser_actions_post_apply.connect(invalidate_action)
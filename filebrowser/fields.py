@@ -8,6 +8,7 @@ try:
     from django.urls import reverse
 except ImportError:
     from django.core.urlresolvers import reverse
+from django.db.models import QuerySet
 from django.db.models.fields import CharField
 from django.forms.widgets import Input
 from django.template.loader import render_to_string
@@ -15,7 +16,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.contrib.admin.templatetags.admin_static import static
 from django.contrib.admin.options import FORMFIELD_FOR_DBFIELD_DEFAULTS
 
-from filebrowser.base import FileObject
+from filebrowser.base import FileObject, LISTING_FIELDS, prefetch_metadata, prefetch_versions
 from filebrowser.settings import ADMIN_THUMBNAIL, EXTENSIONS, UPLOAD_TEMPDIR
 from filebrowser.sites import site
 
@@ -82,6 +83,8 @@ class FileBrowseFormField(forms.CharField):
         if format:
             self.format = format or ''
             self.extensions = extensions or EXTENSIONS.get(format)
+        # lower case extensions for clean(), built once
+        self.allowed_extensions = frozenset(extension.lower() for extension in self.extensions or ())
         super(FileBrowseFormField, self).__init__(*args, **kwargs)
 
     def clean(self, value):
@@ -89,7 +92,7 @@ class FileBrowseFormField(forms.CharField):
         if not value:
             return value
         file_extension = os.path.splitext(value)[1].lower()
-        if self.extensions and file_extension not in self.extensions:
+        if self.allowed_extensions and file_extension not in self.allowed_extensions:
             raise forms.ValidationError(self.error_messages['extension'] % {'ext': file_extension, 'allowed': ", ".join(self.extensions)})
         return value
 
@@ -210,6 +213,8 @@ class FileBrowseUploadFormField(forms.CharField):
         if format:
             self.format = format or ''
             self.extensions = extensions or EXTENSIONS.get(format)
+        # lower case extensions for clean(), built once
+        self.allowed_extensions = frozenset(extension.lower() for extension in self.extensions or ())
         self.upload_to = upload_to
         self.temp_upload_dir = temp_upload_dir
         super(FileBrowseUploadFormField, self).__init__(*args, **kwargs)
@@ -219,7 +224,7 @@ class FileBrowseUploadFormField(forms.CharField):
         if value == '':
             return value
         file_extension = os.path.splitext(value)[1].lower()
-        if self.extensions and file_extension not in self.extensions:
+        if self.allowed_extensions and file_extension not in self.allowed_extensions:
             raise forms.ValidationError(self.error_messages['extension'] % {'ext': file_extension, 'allowed': ", ".join(self.extensions)})
         return value
 
@@ -282,6 +287,59 @@ class FileBrowseUploadField(CharField):
         return super(FileBrowseUploadField, self).formfield(**defaults)
 
 
+def prefetch_fileobjects(objects, field_names=None, fields=LISTING_FIELDS, versions=False):
+    """
+    Prefetch metadata (s. prefetch_metadata) of the FileObjects of all
+    FileBrowseFields (or just field_names) of objects (model instances)
+    with one listing per directory. With versions, the directories of
+    the versions are listed as well (s. prefetch_versions).
+    """
+    fileobjects = []
+    for obj in objects:
+        for field in obj._meta.fields:
+            if not isinstance(field, (FileBrowseField, FileBrowseUploadField)):
+                continue
+            if field_names is not None and field.name not in field_names:
+                continue
+            value = getattr(obj, field.attname)
+            if isinstance(value, FileObject):
+                fileobjects.append(value)
+    prefetch_metadata(fileobjects, fields)
+    if versions:
+        prefetch_versions(fileobjects)
+    return objects
+
+
+class FileBrowseQuerySet(QuerySet):
+    """
+    A QuerySet prefetching FileObject metadata of FileBrowseFields,
+    e.g. objects = FileBrowseQuerySet.as_manager()
+    """
+
+    _prefetch_fileobjects = None
+
+    def prefetch_fileobjects(self, *field_names, **kwargs):
+        """
+        Prefetch metadata of FileObjects when the QuerySet is evaluated
+        (s. prefetch_fileobjects for the keyword arguments fields and versions).
+        """
+        clone = self._clone()
+        clone._prefetch_fileobjects = (field_names or None, kwargs)
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super(FileBrowseQuerySet, self)._clone(*args, **kwargs)
+        clone._prefetch_fileobjects = self._prefetch_fileobjects
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super(FileBrowseQuerySet, self)._fetch_all()
+        if not fetched and self._prefetch_fileobjects is not None:
+            field_names, kwargs = self._prefetch_fileobjects
+            prefetch_fileobjects([obj for obj in self._result_cache if hasattr(obj, '_meta')], field_names, **kwargs)
+
+
 try:
     from south.modelsinspector import add_introspection_rules
     add_introspection_rules([], ["^filebrowser\.fields\.FileBrowseField"])
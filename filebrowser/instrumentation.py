@@ -0,0 +1,230 @@
+# coding: utf-8
+
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.utils.functional import LazyObject, empty
+from django.utils.module_loading import import_string
+
+from filebrowser.settings import STORAGE_METRICS, STORAGE_METRICS_OPTIONS
+
+
+logger = logging.getLogger('filebrowser.instrumentation')
+
+# Storage methods counted and timed (s. STORAGE_INSTRUMENTATION)
+INSTRUMENTED_METHODS = (
+    'exists', 'isdir', 'isfile', 'listdir', 'scandir', 'size', 'open', 'save', 'save_upload',
+    'delete', 'move', 'makedirs', 'rmtree', 'url', 'read_header', 'get_available_name',
+    'get_modified_time', 'modified_time', 'get_accessed_time', 'accessed_time', 'get_created_time', 'created_time',
+)
+
+_local = threading.local()
+_instrumented_classes = {}
+
+
+def get_metrics_sink(site):
+    "Returns the metrics sink (as defined with STORAGE_METRICS) for a site, or None."
+    if not STORAGE_METRICS:
+        return None
+    sink_cls = import_string(STORAGE_METRICS)
+    return sink_cls(**STORAGE_METRICS_OPTIONS)
+
+
+class StorageCalls(object):
+    """
+    The storage calls of one request (view), by operation.
+
+    Only the outermost calls are recorded, e.g. the exists() calls made by
+    get_available_name() are part of get_available_name.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.calls = defaultdict(int)
+        self.durations = defaultdict(float)
+        self.depth = 0
+
+    def add(self, operation, duration):
+        self.calls[operation] += 1
+        self.durations[operation] += duration
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def total_duration(self):
+        return sum(self.durations.values())
+
+    def server_timing(self):
+        "Returns the value of a Server-Timing header"
+        return ', '.join(
+            'fb-%s;desc="%s (%d)";dur=%.2f' % (operation, operation, self.calls[operation], self.durations[operation] * 1000)
+            for operation in sorted(self.calls))
+
+    def __str__(self):
+        return '%s: %d storage calls (%.2f ms)%s' % (
+            self.view, self.total_calls, self.total_duration * 1000,
+            ''.join(', %s=%d (%.2f ms)' % (operation, self.calls[operation], self.durations[operation] * 1000)
+                    for operation in sorted(self.calls)))
+
+
+def _instrumented_method(name):
+    def method(self, *args, **kwargs):
+        original = getattr(super(type(self), self), name)
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None or recorder.depth:
+            return original(*args, **kwargs)
+        recorder.depth += 1
+        start = time.time()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            recorder.depth -= 1
+            recorder.add(name, time.time() - start)
+    method.__name__ = str(name)
+    return method
+
+
+def _unpickle_instrumented_storage(cls, state):
+    storage = object.__new__(cls)
+    storage.__dict__.update(state)
+    return instrument_storage(storage)
+
+
+def _reduce_instrumented_storage(self):
+    # The instrumented class is created at runtime (and cannot be found by
+    # pickle), so the storage is pickled with its original class.
+    return _unpickle_instrumented_storage, (type(self).__bases__[0], self.__dict__)
+
+
+def instrument_storage(storage):
+    """
+    Returns a storage recording its calls with the current request (s.
+    instrumented_view). The returned storage is an instance of a subclass of
+    the storage class, sharing its state with storage.
+    """
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    cls = storage.__class__
+    if getattr(cls, '_filebrowser_instrumented', False):
+        return storage
+    if cls not in _instrumented_classes:
+        attrs = dict((name, _instrumented_method(name)) for name in INSTRUMENTED_METHODS if hasattr(cls, name))
+        attrs['_filebrowser_instrumented'] = True
+        attrs['__reduce__'] = _reduce_instrumented_storage
+        attrs['__module__'] = cls.__module__
+        _instrumented_classes[cls] = type(str('Instrumented%s' % cls.__name__), (cls, ), attrs)
+    instrumented = object.__new__(_instrumented_classes[cls])
+    instrumented.__dict__ = storage.__dict__
+    return instrumented
+
+
+def instrumented_view(view, site, name):
+    """
+    Records the storage calls of view (including rendering the template)
+    and reports them with response headers, the logger
+    'filebrowser.instrumentation' and the metrics sink of site.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        recorder = _local.recorder = StorageCalls(name)
+
+        def finish(response):
+            _local.recorder = None
+            report(recorder, response, site)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            _local.recorder = None
+            raise
+        if getattr(response, 'is_rendered', True):
+            finish(response)
+        else:
+            # the template (e.g. versions) is rendered after the view returned
+            response.add_post_render_callback(finish)
+        return response
+    return wrapper
+
+
+def report(recorder, response, site):
+    response['X-FileBrowser-Storage-Calls'] = str(recorder.total_calls)
+    if recorder.calls:
+        response['Server-Timing'] = recorder.server_timing()
+    logger.debug('%s', recorder)
+    sink = getattr(site, 'metrics_sink', None)
+    if sink is not None:
+        for operation in recorder.calls:
+            try:
+                sink.record(recorder.view, operation, recorder.calls[operation], recorder.durations[operation])
+            except Exception:
+                logger.exception('Error recording storage metrics')
+
+
+class LocalMetricsSink(object):
+    """
+    Keeps the number and duration (seconds) of storage calls by view and
+    operation in memory (e.g. for tests or a metrics endpoint).
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.durations = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record(self, view, operation, calls, duration):
+        with self._lock:
+            self.calls[(view, operation)] += calls
+            self.durations[(view, operation)] += duration
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.durations.clear()
+
+    # pickled along with the site (e.g. FileObjects cached with a pickling cache backend)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class StatsdMetricsSink(object):
+    """
+    Sends the storage calls of every request to StatsD (with UDP), as
+    <prefix>.<view>.<operation>.calls (counter) and .time (timer in ms).
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='filebrowser.storage'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, view, operation, calls, duration):
+        name = '%s.%s.%s' % (self.prefix, view.strip('_'), operation)
+        data = '%s.calls:%d|c\n%s.time:%.3f|ms' % (name, calls, name, duration * 1000)
+        try:
+            self._socket.sendto(data.encode('ascii'), self.address)
+        except socket.error:
+            pass  # metrics must not break requests
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_socket']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
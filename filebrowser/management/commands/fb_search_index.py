@@ -0,0 +1,35 @@
+# coding: utf-8
+
+from django.core.management.base import BaseCommand, CommandError
+
+from filebrowser.sites import get_site_dict, site as default_site
+
+
+class Command(BaseCommand):
+    help = "(Re)Build the search index (s. SEARCH_INDEX) of a FileBrowser site."
+
+    def add_arguments(self, parser):
+        parser.add_argument('media_path', nargs='?', default=None,
+                            help='Directory to index (relative to the storage location). Default: site.directory.')
+        parser.add_argument('--site', default=None,
+                            help='Name of the FileBrowser site. Default: the main site.')
+
+    def handle(self, *args, **options):
+        site = default_site
+        if options['site']:
+            try:
+                site = get_site_dict()[options['site']]
+            except KeyError:
+                raise CommandError('FileBrowser site "%s" doesn\'t exist.' % options['site'])
+
+        if site.search_index is None:
+            raise CommandError('No search index defined (s. FILEBROWSER_SEARCH_INDEX).')
+
+        path = options['media_path']
+        if path is None:
+            path = site.directory
+        if path and not site.storage.isdir(path):
+            raise CommandError('<media_path> must be a directory.\n"%s" is no directory.' % path)
+
+        count = site.search_index.rebuild(site.storage, path)
+        self.stdout.write('%d files/folders indexed in "%s".\n' % (count, path))
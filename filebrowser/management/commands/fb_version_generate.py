@@ -1,13 +1,19 @@
 # coding: utf-8
 
+import io
+import multiprocessing
 import os
 import re
+import time
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.encoding import force_text
+from django.utils.six import string_types
 from django.utils.six.moves import input
 
-from filebrowser.base import FileListing
+from filebrowser.base import FileListing, FileObject
 from filebrowser.settings import EXTENSION_LIST, EXCLUDE, DIRECTORY, VERSIONS
 
 
@@ -19,19 +25,196 @@ for k, v in VERSIONS.items():
     filter_re.append(re.compile(exp))
 
 
+def generate_versions(task):
+    """
+    Generates versions for one image (runs with the worker processes).
+    Returns the path and an error message (None, if everything went fine).
+    """
+    path, version_suffixes = task
+    try:
+        FileObject(path).versions_generate(version_suffixes)
+    except Exception as e:
+        return path, '%s: %s' % (e.__class__.__name__, e)
+    return path, None
+
+
+class Checkpoint(object):
+    """
+    A file with the paths of all images processed by an (interrupted) run.
+
+    The first line holds the selected versions. If the versions changed,
+    the checkpoint is not used.
+    """
+
+    def __init__(self, filename, version_suffixes):
+        self.filename = filename
+        self.header = force_text('versions: %s\n' % ','.join(version_suffixes))
+        self.done = set()
+        self.file = None
+
+    def load(self):
+        "Reads the processed paths, returns False if the checkpoint does not belong to this run."
+        if not os.path.exists(self.filename):
+            return True
+        with io.open(self.filename, encoding='utf-8') as f:
+            if f.readline() != self.header:
+                return False
+            self.done = set(line.rstrip('\n') for line in f if line.strip())
+        return True
+
+    def open(self, resume):
+        mode = 'a' if resume and os.path.exists(self.filename) else 'w'
+        self.file = io.open(self.filename, mode, encoding='utf-8')
+        if mode == 'w':
+            self.file.write(self.header)
+            self.file.flush()
+
+    def add(self, path):
+        self.file.write(force_text(path) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
 class Command(BaseCommand):
     help = "(Re)Generate image versions."
 
+    # Seconds between two progress reports
+    progress_interval = 5
+
     def add_arguments(self, parser):
-        parser.add_argument('media_path', nargs='?', default=DIRECTORY)
+        parser.add_argument('media_path', nargs='*', default=[DIRECTORY])
+        parser.add_argument(
+            '--versions', nargs='+', dest='versions', metavar='VERSION',
+            help='Versions to generate (as defined with VERSIONS). Default: all versions.')
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false', dest='interactive', default=True,
+            help='Do NOT prompt for a version, generate all versions (if no --versions are given).')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes. Default: 1 (no worker processes).')
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='File to record processed images with. An interrupted run continues with the '
+                 'remaining images, when started again with the same checkpoint file.')
 
     def handle(self, *args, **options):
-        path = options['media_path']
-
-        if not os.path.isdir(os.path.join(settings.MEDIA_ROOT, path)):
-            raise CommandError('<media_path> must be a directory in MEDIA_ROOT (If you don\'t add a media_path the default path is DIRECTORY).\n"%s" is no directory.' % path)
+        paths = options['media_path']
+        if isinstance(paths, string_types):
+            paths = [paths]
+
+        for path in paths:
+            if not os.path.isdir(os.path.join(settings.MEDIA_ROOT, path)):
+                raise CommandError('<media_path> must be a directory in MEDIA_ROOT (If you don\'t add a media_path the default path is DIRECTORY).\n"%s" is no directory.' % path)
+
+        if options['workers'] < 1:
+            raise CommandError('--workers must be a positive number.')
+
+        if options['versions']:
+            for version_name in options['versions']:
+                if version_name not in VERSIONS:
+                    raise CommandError('Version "%s" doesn\'t exist.' % version_name)
+            version_suffixes = options['versions']
+        elif options['interactive']:
+            version_suffixes = self.select_versions()
+        else:
+            version_suffixes = list(VERSIONS)
+
+        checkpoint = None
+        if options['checkpoint']:
+            checkpoint = Checkpoint(options['checkpoint'], version_suffixes)
+            resume = checkpoint.load()
+            if not resume:
+                self.stderr.write('Checkpoint "%s" was created with other versions, starting over.\n' % checkpoint.filename)
+            elif checkpoint.done:
+                self.stdout.write('Resuming from checkpoint "%s" (%d images done).\n' % (checkpoint.filename, len(checkpoint.done)))
+            checkpoint.open(resume)
 
-        # get version name
+        # filelisting
+        tasks = []
+        for path in paths:
+            filelisting = FileListing(path, filter_func=self.filter_images)  # FIXME filterfunc: no hidden files, exclude list, no versions, just images!
+            for fileobject in filelisting.files_walk_iter():
+                if fileobject.filetype != "Image":
+                    continue
+                if checkpoint and force_text(fileobject.path) in checkpoint.done:
+                    continue
+                tasks.append((fileobject.path, version_suffixes))
+
+        self.stdout.write('generating %s for %d images\n' % (
+            'version "%s"' % version_suffixes[0] if len(version_suffixes) == 1 else '%d versions' % len(version_suffixes),
+            len(tasks)))
+
+        try:
+            errors = self.run_tasks(tasks, options['workers'], checkpoint, int(options['verbosity']))
+        except KeyboardInterrupt:
+            if checkpoint:
+                checkpoint.close()
+                raise CommandError('Interrupted, start again with --checkpoint "%s" to continue.' % checkpoint.filename)
+            raise
+
+        if errors:
+            if checkpoint:
+                checkpoint.close()
+            raise CommandError('%d of %d images failed.' % (errors, len(tasks)))
+        if checkpoint:
+            # the run is complete, the next one starts from scratch
+            checkpoint.remove()
+
+    def run_tasks(self, tasks, workers, checkpoint, verbosity):
+        "Generates versions for tasks, returns the number of errors"
+        if workers > 1:
+            # forked processes must not share database connections
+            connections.close_all()
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(generate_versions, tasks, chunksize=8)
+        else:
+            pool = None
+            results = (generate_versions(task) for task in tasks)
+
+        errors = 0
+        start = last_report = time.time()
+        try:
+            for done, (path, error) in enumerate(results, 1):
+                if error:
+                    errors += 1
+                    self.stderr.write('error generating versions for %s: %s\n' % (path, error))
+                else:
+                    if checkpoint:
+                        checkpoint.add(path)
+                    if verbosity > 1:
+                        self.stdout.write('generated versions for: %s\n' % path)
+                now = time.time()
+                if verbosity > 0 and (now - last_report >= self.progress_interval or done == len(tasks)):
+                    last_report = now
+                    self.stdout.write(self.progress(done, len(tasks), now - start))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return errors
+
+    def progress(self, done, total, elapsed):
+        "Returns a progress report with the estimated time remaining"
+        eta = elapsed / done * (total - done)
+        return '%d/%d images (%d%%), elapsed %s, remaining %s\n' % (
+            done, total, 100 * done // total, self.format_seconds(elapsed), self.format_seconds(eta))
+
+    def format_seconds(self, seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+    def select_versions(self):
+        "Prompts for a version, returns the selected version suffixes"
         while 1:
             self.stdout.write('\nSelect a version you want to generate:\n')
             for version in VERSIONS:
@@ -40,48 +223,10 @@ class Command(BaseCommand):
             version_name = input('(leave blank to generate all versions): ')
 
             if version_name == "":
-                selected_version = None
-                break
-            else:
-                try:
-                    tmp = VERSIONS[version_name]
-                    selected_version = version_name
-                    break
-                except:
-                    self.stderr.write('Error: Version "%s" doesn\'t exist.\n' % version_name)
-                    version_name = None
-                    continue
-
-        # filelisting
-        filelisting = FileListing(path, filter_func=self.filter_images)  # FIXME filterfunc: no hidden files, exclude list, no versions, just images!
-        for fileobject in filelisting.files_walk_filtered():
-            if fileobject.filetype == "Image":
-                if selected_version:
-                    self.stdout.write('generating version "%s" for: %s\n' % (selected_version, fileobject.path))
-                    versionobject = fileobject.version_generate(selected_version)  # FIXME force?
-                else:
-                    self.stdout.write('generating all versions for: %s\n' % fileobject.path)
-                    for version in VERSIONS:
-                        versionobject = fileobject.version_generate(version)  # FIXME force?
-
-        # # walkt throu the filebrowser directory
-        # # for all/new files (except file versions itself and excludes)
-        # for dirpath,dirnames,filenames in os.walk(path, followlinks=True):
-        #     rel_dir = os.path.relpath(dirpath, os.path.realpath(settings.MEDIA_ROOT))
-        #     for filename in filenames:
-        #         filtered = False
-        #         # no "hidden" files (stating with ".")
-        #         if filename.startswith('.'):
-        #             continue
-        #         # check the exclude list
-        #         for re_prefix in filter_re:
-        #             if re_prefix.search(filename):
-        #                 filtered = True
-        #         if filtered:
-        #             continue
-        #         (tmp, extension) = os.path.splitext(filename)
-        #         if extension in EXTENSIONS["Image"]:
-        #             self.createVersions(os.path.join(rel_dir, filename), selected_version)
+                return list(VERSIONS)
+            if version_name in VERSIONS:
+                return [version_name]
+            self.stderr.write('Error: Version "%s" doesn\'t exist.\n' % version_name)
 
     def filter_images(self, item):
         filtered = item.filename.startswith('.')
@@ -7,19 +7,20 @@ from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.utils.six.moves import input
 
-from filebrowser.settings import EXCLUDE, EXTENSIONS
+from filebrowser.settings import EXCLUDE, EXTENSIONS, VERSIONS_MANIFEST
+from filebrowser.sites import get_site_dict
 
 
 class Command(BaseCommand):
     args = '<media_path>'
     help = "Remove Image-Versions within FILEBROWSER_DIRECTORY/MEDIA_ROOT."
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('media_path', nargs='?', default='')
 
-        media_path = ""
+    def handle(self, *args, **options):
 
-        if len(args):
-            media_path = args[0]
+        media_path = options['media_path']
 
         path = os.path.join(settings.MEDIA_ROOT, media_path)
 
@@ -86,13 +87,27 @@ class Command(BaseCommand):
 
         # if "yes" we delete. any different case we finish without removing anything
         if do_remove == "y":
+            manifests = self.get_manifests()
             for current_file in files:
                 os.remove(current_file)
+                # the versions are generated again (instead of being found with the manifest)
+                for location, manifest in manifests:
+                    manifest.delete_version(os.path.relpath(current_file, location))
             self.stdout.write('%d file(s) removed.\n\n' % len(files))
         else:
             self.stdout.write('No files removed.\n\n')
         return
 
+    # (storage location, versions manifest) of all sites recording versions (s. VERSIONS_MANIFEST)
+    def get_manifests(self):
+        manifests = []
+        if not VERSIONS_MANIFEST:
+            return manifests
+        for site in get_site_dict().values():
+            if site.metadata_cache is not None and getattr(site.storage, 'location', None):
+                manifests.append((site.storage.location, site.metadata_cache))
+        return manifests
+
     # get files mathing:
     # path: search recoursive in this path (os.walk)
     # version_name: string is pre/suffix of filename
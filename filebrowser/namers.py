@@ -79,7 +79,7 @@ class OptionsNamer(VersionNamer):
             opts.append('%dx%d' % (width, height))
 
         for k, v in sorted(self.options.items()):
-            if not v or k in ('size', 'width', 'height',
+            if not v or k in ('size', 'width', 'height', 'draft',
                               'quality', 'subsampling', 'verbose_name'):
                 continue
             if v is True:
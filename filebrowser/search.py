@@ -0,0 +1,241 @@
+# coding: utf-8
+
+import os
+import re
+import sqlite3
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+from filebrowser import signals
+from filebrowser.settings import SEARCH_INDEX, SEARCH_INDEX_OPTIONS, UPLOAD_TEMPDIR
+
+
+def get_search_index(site):
+    "Returns the search index (as defined with SEARCH_INDEX) for a site, or None."
+    if not SEARCH_INDEX:
+        return None
+    index_cls = import_string(SEARCH_INDEX)
+    options = dict(SEARCH_INDEX_OPTIONS)
+    if options.get('location'):
+        # one index per site, e.g. /var/cache/filebrowser_search_{site}.sqlite3
+        options['location'] = options['location'].replace('{site}', site.name or 'filebrowser')
+    return index_cls(**options)
+
+
+def _regexp(pattern, value):
+    # REGEXP function for sqlite3 (compiled patterns are cached by re)
+    return value is not None and re.search(pattern, value, re.M) is not None
+
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+_REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+
+
+def _regex_literal(regex):
+    """
+    Returns the literal characters every match of regex starts with, and
+    whether regex is anchored with ^ (e.g. ('img', True) for '^img_\\d+').
+    Used to narrow down the names before the REGEXP function is called.
+    """
+    if '|' in regex:
+        return '', False
+    anchored = regex.startswith('^')
+    literal = []
+    for char in regex[1:] if anchored else regex:
+        if char in _REGEX_SPECIAL_CHARS:
+            # the preceding character may be optional (e.g. 'images?')
+            if char in '?*{' and literal:
+                literal.pop()
+            break
+        literal.append(char)
+    return ''.join(literal), anchored
+
+
+class SQLiteSearchIndex(object):
+    """
+    An index of all files/folders (paths relative to the storage location),
+    stored with a local SQLite database file.
+
+    Names are searched with a substring, a prefix, an extension or a regular
+    expression, without accessing the storage. The index is kept current with
+    the FileBrowser signals (s. below) and rebuilt with fb_search_index.
+    """
+
+    def __init__(self, location=None):
+        if not location:
+            raise ImproperlyConfigured("SQLiteSearchIndex requires a location, e.g. "
+                                       "FILEBROWSER_SEARCH_INDEX_OPTIONS = {'location': '/var/cache/filebrowser_search_{site}.sqlite3'}")
+        self.location = location
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # connections are not pickled (e.g. with the site of a FileObject)
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.location)
+            connection.create_function('REGEXP', 2, _regexp)
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS filebrowser_search ('
+                    'path TEXT PRIMARY KEY, name TEXT, extension TEXT, is_dir INTEGER)')
+                connection.execute('CREATE INDEX IF NOT EXISTS filebrowser_search_name ON filebrowser_search (name)')
+                connection.execute('CREATE INDEX IF NOT EXISTS filebrowser_search_extension ON filebrowser_search (extension)')
+            self._local.connection = connection
+        return connection
+
+    def _normpath(self, path):
+        path = os.path.normpath(force_text(path or '')).replace('\\', '/')
+        return '' if path == '.' else path
+
+    def _row(self, path, is_dir):
+        path = self._normpath(path)
+        name = os.path.basename(path).lower()
+        extension = '' if is_dir else os.path.splitext(name)[1]
+        return path, name, extension, int(bool(is_dir))
+
+    def _subtree(self, path):
+        # SQL condition and params for all paths within path (excluding path itself)
+        path = self._normpath(path)
+        if not path:
+            return "path != ''", []
+        # '0' follows '/' with ASCII, so the range matches path/ and all paths starting with it
+        return 'path > ? AND path < ?', [path + '/', path + '0']
+
+    def add(self, path, is_dir=False):
+        "Adds a file (or folder) to the index"
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO filebrowser_search VALUES (?, ?, ?, ?)', self._row(path, is_dir))
+
+    def add_many(self, items):
+        "Adds (path, is_dir) items to the index"
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO filebrowser_search VALUES (?, ?, ?, ?)',
+                (self._row(path, is_dir) for path, is_dir in items))
+
+    def remove(self, path):
+        "Removes a file (or folder including its content) from the index"
+        condition, params = self._subtree(path)
+        with self.connection:
+            self.connection.execute('DELETE FROM filebrowser_search WHERE path = ?', (self._normpath(path), ))
+            self.connection.execute('DELETE FROM filebrowser_search WHERE %s' % condition, params)
+
+    def rename(self, path, new_path):
+        "Renames a file (or folder including its content) with the index"
+        path, new_path = self._normpath(path), self._normpath(new_path)
+        condition, params = self._subtree(path)
+        rows = self.connection.execute(
+            'SELECT path, is_dir FROM filebrowser_search WHERE path = ? OR %s' % condition, [path] + params).fetchall()
+        self.remove(path)
+        self.add_many((new_path + item_path[len(path):], is_dir) for item_path, is_dir in rows)
+
+    def search(self, directory='', substring=None, prefix=None, extension=None, regex=None):
+        """
+        Returns the sorted paths within directory (recursive) with a name
+        (lower case) containing substring, starting with prefix, ending with
+        extension and/or matching the regular expression regex.
+        """
+        condition, params = self._subtree(directory)
+        conditions = [condition]
+        if substring:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append('%%%s%%' % _like_escape(substring.lower()))
+        if prefix:
+            conditions.append('name >= ? AND name < ?')
+            params.extend([prefix.lower(), prefix.lower() + u'\U0010ffff'])
+        if extension:
+            conditions.append('extension = ?')
+            params.append(extension.lower())
+        if regex:
+            # a prefix (using the index of name) or substring narrows down the names first
+            literal, anchored = _regex_literal(regex)
+            if literal and anchored:
+                conditions.append('name >= ? AND name < ?')
+                params.extend([literal, literal + u'\U0010ffff'])
+            elif literal:
+                conditions.append("name LIKE ? ESCAPE '\\'")
+                params.append('%%%s%%' % _like_escape(literal))
+            conditions.append('name REGEXP ?')
+            params.append(regex)
+        rows = self.connection.execute(
+            'SELECT path FROM filebrowser_search WHERE %s ORDER BY path' % ' AND '.join(conditions), params)
+        return [row[0] for row in rows]
+
+    def count(self, directory='', filename_filter=None):
+        """
+        Returns the number of files/folders within directory (recursive),
+        only counting names (not lower case) filename_filter returns True for.
+        """
+        condition, params = self._subtree(directory)
+        if filename_filter is None:
+            return self.connection.execute('SELECT COUNT(*) FROM filebrowser_search WHERE %s' % condition, params).fetchone()[0]
+        rows = self.connection.execute('SELECT path FROM filebrowser_search WHERE %s' % condition, params)
+        return sum(1 for row in rows if filename_filter(os.path.basename(row[0])))
+
+    def rebuild(self, storage, directory=''):
+        "Replaces the index for directory with the files/folders found with storage. Returns the number of items."
+        items = []
+        stack = [self._normpath(directory)]
+        while stack:
+            path = stack.pop()
+            try:
+                entries = [(entry.name, entry.is_dir) for entry in storage.scandir(path)]
+            except (AttributeError, NotImplementedError):
+                dirs, files = storage.listdir(path)
+                entries = [(name, True) for name in dirs] + [(name, False) for name in files]
+            for name, is_dir in entries:
+                item_path = os.path.join(path, name)
+                items.append((item_path, is_dir))
+                if is_dir:
+                    stack.append(item_path)
+        condition, params = self._subtree(directory)
+        with self.connection:
+            self.connection.execute('DELETE FROM filebrowser_search WHERE %s' % condition, params)
+        self.add_many(items)
+        return len(items)
+
+
+# Update the search index whenever the FileBrowser changes files/folders
+
+def index_upload(sender, path, file, site, **kwargs):
+    # temporary uploads are moved later on
+    if getattr(site, 'search_index', None) is not None and path != UPLOAD_TEMPDIR:
+        site.search_index.add(file.path)
+
+
+def index_createdir(sender, path, site, **kwargs):
+    if getattr(site, 'search_index', None) is not None:
+        site.search_index.add(path, is_dir=True)
+
+
+def index_delete(sender, path, site, **kwargs):
+    if getattr(site, 'search_index', None) is not None:
+        site.search_index.remove(path)
+
+
+def index_rename(sender, path, new_name, site, **kwargs):
+    if getattr(site, 'search_index', None) is not None:
+        site.search_index.rename(path, os.path.join(os.path.dirname(path), new_name))
+
+
+signals.filebrowser_post_upload.connect(index_upload)
+signals.filebrowser_post_createdir.connect(index_createdir)
+signals.filebrowser_post_delete.connect(index_delete)
+signals.filebrowser_post_rename.connect(index_rename)
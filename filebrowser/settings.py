@@ -33,7 +33,7 @@ SELECT_FORMATS = getattr(settings, "FILEBROWSER_SELECT_FORMATS", {
 # If no directory is given, versions are stored within the Image directory.
 # VERSION URL: VERSIONS_BASEDIR/original_path/originalfilename_versionsuffix.extension
 VERSIONS_BASEDIR = getattr(settings, 'FILEBROWSER_VERSIONS_BASEDIR', '_versions')
-# Versions Format. Available Attributes: verbose_name, width, height, opts
+# Versions Format. Available Attributes: verbose_name, width, height, opts, draft
 VERSIONS = getattr(settings, "FILEBROWSER_VERSIONS", {
     'admin_thumbnail': {'verbose_name': 'Admin Thumbnail', 'width': 60, 'height': 60, 'opts': 'crop'},
     'thumbnail': {'verbose_name': 'Thumbnail (1 col)', 'width': 60, 'height': 60, 'opts': 'crop'},
@@ -44,11 +44,24 @@ VERSIONS = getattr(settings, "FILEBROWSER_VERSIONS", {
 })
 # Quality of saved versions
 VERSION_QUALITY = getattr(settings, 'FILEBROWSER_VERSION_QUALITY', 90)
+# Decode JPEGs with a reduced size (1/2, 1/4 or 1/8, s. PIL's Image.draft)
+# when generating smaller versions. Can be set per version with 'draft'.
+VERSION_DRAFT_MODE = getattr(settings, 'FILEBROWSER_VERSION_DRAFT_MODE', False)
 # Versions available within the Admin-Interface.
 ADMIN_VERSIONS = getattr(settings, 'FILEBROWSER_ADMIN_VERSIONS', ['thumbnail', 'small', 'medium', 'big', 'large'])
 # Which Version should be used as Admin-thumbnail.
 ADMIN_THUMBNAIL = getattr(settings, 'FILEBROWSER_ADMIN_THUMBNAIL', 'admin_thumbnail')
 
+# Generate missing/outdated versions in background threads instead of within
+# the {% version %} templatetag (which then returns the URL of the version
+# before it actually exists).
+VERSIONS_ASYNC = getattr(settings, 'FILEBROWSER_VERSIONS_ASYNC', False)
+# Number of background threads generating versions
+VERSIONS_ASYNC_WORKERS = getattr(settings, 'FILEBROWSER_VERSIONS_ASYNC_WORKERS', 2)
+# Versions generated in background threads after an image has been uploaded.
+# True: ADMIN_THUMBNAIL and ADMIN_VERSIONS, or a list of version suffixes.
+VERSIONS_PREGENERATE = getattr(settings, 'FILEBROWSER_VERSIONS_PREGENERATE', False)
+
 VERSION_PROCESSORS = getattr(settings, 'FILEBROWSER_VERSION_PROCESSORS', [
     'filebrowser.utils.scale_and_crop',
 ])
@@ -78,6 +91,17 @@ for exts in EXTENSIONS.values():
 EXCLUDE = getattr(settings, 'FILEBROWSER_EXCLUDE', (r'_(%(exts)s)_.*_q\d{1,3}\.(%(exts)s)' % {'exts': ('|'.join(EXTENSION_LIST))},))
 # Max. Upload Size in Bytes.
 MAX_UPLOAD_SIZE = getattr(settings, "FILEBROWSER_MAX_UPLOAD_SIZE", 10485760)
+# Files larger than UPLOAD_CHUNK_SIZE (in Bytes) are uploaded with several
+# requests (chunks), resuming after an interrupted request. 0 disables chunked uploads.
+UPLOAD_CHUNK_SIZE = getattr(settings, "FILEBROWSER_UPLOAD_CHUNK_SIZE", 0)
+# Partial files of chunked uploads not continued within UPLOAD_CHUNK_MAX_AGE
+# (in seconds) are removed.
+UPLOAD_CHUNK_MAX_AGE = getattr(settings, "FILEBROWSER_UPLOAD_CHUNK_MAX_AGE", 86400)
+# Look up uploaded files by their content (SHA-256) with METADATA_CACHE.
+# 'report': save the file and report the identical file with the response,
+# 'existing': keep the identical file (and its versions) instead of saving a copy.
+# False disables the content index.
+UPLOAD_DEDUPLICATE = getattr(settings, "FILEBROWSER_UPLOAD_DEDUPLICATE", False)
 # Normalize filename and remove all non-alphanumeric characters
 # except for underscores, spaces & dashes.
 NORMALIZE_FILENAME = getattr(settings, "FILEBROWSER_NORMALIZE_FILENAME", False)
@@ -89,6 +113,12 @@ SLUGIFY_FILENAME = getattr(settings, "FILEBROWSER_SLUGIFY_FILENAME", False)
 # Loading a Sever-Directory with lots of files might take a while
 # Use this setting to limit the items shown
 LIST_PER_PAGE = getattr(settings, "FILEBROWSER_LIST_PER_PAGE", 50)
+# Only create FileObjects for the current page if the listing is sorted by
+# name and not filtered by type/date (no metadata needed for sorting/filtering)
+LAZY_LISTING = getattr(settings, "FILEBROWSER_LAZY_LISTING", False)
+# Answer GET requests of the browse, detail and version views with 304 Not
+# Modified (ETag/Last-Modified) if neither the files nor the request changed
+CONDITIONAL_GET = getattr(settings, "FILEBROWSER_CONDITIONAL_GET", False)
 # Default Sorting
 # Options: date, filesize, filename_lower, filetype_checked
 DEFAULT_SORTING_BY = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_BY", "date")
@@ -98,6 +128,14 @@ DEFAULT_SORTING_ORDER = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_ORDER", "
 FOLDER_REGEX = getattr(settings, "FILEBROWSER_FOLDER_REGEX", r'^[\w._\ /-]+$')
 # Traverse directories when searching
 SEARCH_TRAVERSE = getattr(settings, "FILEBROWSER_SEARCH_TRAVERSE", False)
+# Index used for searching with SEARCH_TRAVERSE (instead of walking the storage).
+# The index is updated with uploads, deletes, renames and new folders, use
+# the management command fb_search_index to build it.
+# Options: None, 'filebrowser.search.SQLiteSearchIndex'
+SEARCH_INDEX = getattr(settings, "FILEBROWSER_SEARCH_INDEX", None)
+# Keyword arguments for SEARCH_INDEX, e.g. {'location': '/var/cache/filebrowser_search_{site}.sqlite3'}
+# (SQLiteSearchIndex requires a location, {site} is replaced with the name of the site)
+SEARCH_INDEX_OPTIONS = getattr(settings, "FILEBROWSER_SEARCH_INDEX_OPTIONS", {})
 # Default Upload and Version Permissions
 DEFAULT_PERMISSIONS = getattr(settings, "FILEBROWSER_DEFAULT_PERMISSIONS", 0o755)
 # Overwrite existing files on upload
@@ -105,6 +143,34 @@ OVERWRITE_EXISTING = getattr(settings, "FILEBROWSER_OVERWRITE_EXISTING", True)
 # Add fake model to show filebrowser in admin dashboard
 SHOW_IN_DASHBOARD = getattr(settings, "FILEBROWSER_SHOW_IN_DASHBOARD", True)
 
+# METADATA CACHE
+
+# Cache for directory listings and file metadata (e.g. image dimensions),
+# validated with the modified time of the directory/file.
+# Options: None, 'filebrowser.cache.DjangoMetadataCache', 'filebrowser.cache.SQLiteMetadataCache'
+METADATA_CACHE = getattr(settings, 'FILEBROWSER_METADATA_CACHE', None)
+# Keyword arguments for METADATA_CACHE,
+# e.g. {'cache_alias': 'default'} or {'location': '/var/cache/filebrowser.sqlite3'}
+# (SQLiteMetadataCache requires a location)
+METADATA_CACHE_OPTIONS = getattr(settings, 'FILEBROWSER_METADATA_CACHE_OPTIONS', {})
+# Record generated versions with METADATA_CACHE. Versions found with this
+# manifest are not checked with the storage (existence, modified time) again.
+# Versions of originals changed outside of the FileBrowser have to be
+# removed (e.g. with fb_version_remove) in order to be regenerated.
+VERSIONS_MANIFEST = getattr(settings, 'FILEBROWSER_VERSIONS_MANIFEST', False)
+
+# INSTRUMENTATION
+
+# Count and time the storage calls of every FileBrowser view (reported with the
+# headers X-FileBrowser-Storage-Calls and Server-Timing and the logger
+# 'filebrowser.instrumentation').
+STORAGE_INSTRUMENTATION = getattr(settings, 'FILEBROWSER_STORAGE_INSTRUMENTATION', False)
+# Metrics sink for the storage calls (with STORAGE_INSTRUMENTATION).
+# Options: None, 'filebrowser.instrumentation.StatsdMetricsSink', 'filebrowser.instrumentation.LocalMetricsSink'
+STORAGE_METRICS = getattr(settings, 'FILEBROWSER_STORAGE_METRICS', None)
+# Keyword arguments for STORAGE_METRICS, e.g. {'host': 'localhost', 'port': 8125}
+STORAGE_METRICS_OPTIONS = getattr(settings, 'FILEBROWSER_STORAGE_METRICS_OPTIONS', {})
+
 # UPLOAD
 
 # Directory to Save temporary uploaded files (FileBrowseUploadField)
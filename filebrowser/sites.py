@@ -2,8 +2,12 @@
 
 import os
 import re
+import hashlib
 import json
-from time import gmtime, strftime, localtime, time
+import logging
+import tempfile
+from itertools import islice
+from time import gmtime, strftime, localtime, mktime, time
 
 from django import forms
 from django import VERSION as DJANGO_VERSION
@@ -11,6 +15,9 @@ from django.contrib import messages
 from django.contrib.admin.sites import site as admin_site
 from django.utils.module_loading import import_string 
 from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files import locks
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
 from django.core.files.storage import DefaultStorage, default_storage, FileSystemStorage
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 try:
@@ -21,25 +28,34 @@ from django.http import HttpResponseRedirect, HttpResponseBadRequest
 from django.shortcuts import render, HttpResponse
 from django.template import RequestContext as Context
 from django.template.response import TemplateResponse
-from django.utils.encoding import smart_text
-from django.utils.translation import ugettext as _
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from django.utils.encoding import force_bytes, smart_text
+from django.utils.translation import get_language, ugettext as _
 from django.views.decorators.cache import never_cache
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.core.exceptions import PermissionDenied
 
 from filebrowser import signals
-from filebrowser.base import FileListing, FileObject
+from filebrowser.base import FileListing, FileObject, LazyFileObjects, prefetch_metadata
+from filebrowser.cache import get_metadata_cache
+from filebrowser.compat import get_modified_time
+from filebrowser.search import get_search_index
+from filebrowser.instrumentation import get_metrics_sink, instrument_storage, instrumented_view
 from filebrowser.decorators import path_exists, file_exists
 from filebrowser.storage import FileSystemStorageMixin
 from filebrowser.templatetags.fb_tags import query_helper
 from filebrowser.utils import convert_filename
+from filebrowser.workers import version_queue
 from filebrowser.settings import (DIRECTORY, EXTENSIONS, SELECT_FORMATS, ADMIN_VERSIONS, ADMIN_THUMBNAIL,
-    MAX_UPLOAD_SIZE, NORMALIZE_FILENAME, CONVERT_FILENAME, SEARCH_TRAVERSE, EXCLUDE, VERSIONS,
+    MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_MAX_AGE, UPLOAD_DEDUPLICATE, NORMALIZE_FILENAME, CONVERT_FILENAME, SEARCH_TRAVERSE, EXCLUDE, VERSIONS,
     VERSIONS_BASEDIR, EXTENSION_LIST, DEFAULT_SORTING_BY, DEFAULT_SORTING_ORDER, LIST_PER_PAGE,
-    OVERWRITE_EXISTING, DEFAULT_PERMISSIONS, UPLOAD_TEMPDIR, ADMIN_CUSTOM
+    OVERWRITE_EXISTING, UPLOAD_TEMPDIR, ADMIN_CUSTOM, LAZY_LISTING, VERSIONS_ASYNC, STORAGE_INSTRUMENTATION, CONDITIONAL_GET
 )
 
+logger = logging.getLogger('filebrowser')
+
 
 def check_permission(perm):
 
@@ -156,6 +172,7 @@ def get_settings_var(directory=DIRECTORY):
     settings_var['ADMIN_THUMBNAIL'] = ADMIN_THUMBNAIL
     # FileBrowser Options
     settings_var['MAX_UPLOAD_SIZE'] = MAX_UPLOAD_SIZE
+    settings_var['UPLOAD_CHUNK_SIZE'] = UPLOAD_CHUNK_SIZE
     # Normalize Filenames
     settings_var['NORMALIZE_FILENAME'] = NORMALIZE_FILENAME
     # Convert Filenames
@@ -165,18 +182,59 @@ def get_settings_var(directory=DIRECTORY):
     return settings_var
 
 
-def handle_file_upload(path, file, site):
+def handle_file_upload(path, file, site, allow_overwrite=False):
     """
     Handle File Upload.
+
+    The file is written with its final name (s. storage.save_upload).
+    Returns the name of the saved file.
+    """
+    file_path = os.path.join(path, file.name)
+    if hasattr(site.storage, 'save_upload'):
+        return site.storage.save_upload(file_path, file, allow_overwrite=allow_overwrite)
+    # storages without StorageMixin
+    if allow_overwrite and site.storage.exists(file_path):
+        site.storage.delete(file_path)
+    return site.storage.save(file_path, file)
+
+
+class ChunkedUploadedFile(UploadedFile):
+    """
+    A file assembled from the chunks of a chunked upload. With
+    temporary_file_path, FileSystemStorage moves the file instead of copying it.
+    """
+
+    def __init__(self, path, name, size):
+        super(ChunkedUploadedFile, self).__init__(open(path, 'rb'), name, None, size, None)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class ContentDigestUploadHandler(FileUploadHandler):
+    """
+    Computes the SHA-256 digest of an uploaded file while it is received,
+    passing the data on to the next upload handler (s. UPLOAD_DEDUPLICATE).
     """
 
-    uploadedfile = None
-    try:
-        file_path = os.path.join(path, file.name)
-        uploadedfile = site.storage.save(file_path, file)
-    except Exception as inst:
-        raise inst
-    return uploadedfile
+    def __init__(self, request=None):
+        super(ContentDigestUploadHandler, self).__init__(request)
+        self.digest = None
+        self._hash = None
+
+    def new_file(self, *args, **kwargs):
+        super(ContentDigestUploadHandler, self).new_file(*args, **kwargs)
+        self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digest = self._hash.hexdigest()
+        # the file itself is returned by the next upload handler
+        return None
 
 
 def filebrowser_view(view):
@@ -184,6 +242,32 @@ def filebrowser_view(view):
     return staff_member_required(never_cache(xframe_options_sameorigin(view)))
 
 
+def conditional_filebrowser_view(view, get_validators):
+    """
+    Like filebrowser_view, but GET requests are answered with 304 Not Modified
+    if the ETag (or last modified datetime) returned by get_validators(request)
+    did not change (s. CONDITIONAL_GET). These responses may be stored by the
+    browser, but are revalidated with every request.
+
+    Other requests, and requests get_validators returns None for, are never cached.
+    """
+    def conditional_view(request, *args, **kwargs):
+        validators = None
+        if CONDITIONAL_GET and request.method in ('GET', 'HEAD'):
+            validators = get_validators(request)
+        if validators is None:
+            response = view(request, *args, **kwargs)
+            add_never_cache_headers(response)
+            return response
+        etag, last_modified = validators
+        response = condition(
+            etag_func=lambda request, *args, **kwargs: etag,
+            last_modified_func=lambda request, *args, **kwargs: last_modified)(view)(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True, must_revalidate=True, max_age=0)
+        return response
+    return staff_member_required(xframe_options_sameorigin(conditional_view))
+
+
 class FileBrowserSite(object):
     """
     A filebrowser.site defines admin views for browsing your servers media files.
@@ -193,7 +277,7 @@ class FileBrowserSite(object):
     def __init__(self, name=None, app_name='filebrowser', storage=default_storage):
         self.name = name
         self.app_name = app_name
-        self.storage = storage
+        self.storage = instrument_storage(storage) if STORAGE_INSTRUMENTATION else storage
 
         self._actions = {}
         self._global_actions = self._actions.copy()
@@ -203,6 +287,9 @@ class FileBrowserSite(object):
 
         # Per-site settings:
         self.directory = DIRECTORY
+        self.metadata_cache = get_metadata_cache(self)
+        self.search_index = get_search_index(self)
+        self.metrics_sink = get_metrics_sink(self)
 
     def _directory_get(self):
         "Set directory"
@@ -219,18 +306,26 @@ class FileBrowserSite(object):
         from django.conf.urls import url
 
         # filebrowser urls (views)
+        instrumented = self.instrument_view
         urlpatterns = [
-            url(r'^browse/$', path_exists(self, filebrowser_view(self.browse)), name="fb_browse"),
-            url(r'^createdir/', path_exists(self, filebrowser_view(self.createdir)), name="fb_createdir"),
-            url(r'^upload/', path_exists(self, filebrowser_view(self.upload)), name="fb_upload"),
-            url(r'^delete_confirm/$', file_exists(self, path_exists(self, filebrowser_view(self.delete_confirm))), name="fb_delete_confirm"),
-            url(r'^delete/$', file_exists(self, path_exists(self, filebrowser_view(self.delete))), name="fb_delete"),
-            url(r'^detail/$', file_exists(self, path_exists(self, filebrowser_view(self.detail))), name="fb_detail"),
-            url(r'^version/$', file_exists(self, path_exists(self, filebrowser_view(self.version))), name="fb_version"),
-            url(r'^upload_file/$', staff_member_required(csrf_exempt(self._upload_file)), name="fb_do_upload"),
+            url(r'^browse/$', instrumented(path_exists(self, conditional_filebrowser_view(self.browse, self.browse_validators)), 'browse'), name="fb_browse"),
+            url(r'^createdir/', instrumented(path_exists(self, filebrowser_view(self.createdir)), 'createdir'), name="fb_createdir"),
+            url(r'^upload/', instrumented(path_exists(self, filebrowser_view(self.upload)), 'upload'), name="fb_upload"),
+            url(r'^delete_confirm/$', instrumented(file_exists(self, path_exists(self, filebrowser_view(self.delete_confirm))), 'delete_confirm'), name="fb_delete_confirm"),
+            url(r'^delete/$', instrumented(file_exists(self, path_exists(self, filebrowser_view(self.delete))), 'delete'), name="fb_delete"),
+            url(r'^detail/$', instrumented(file_exists(self, path_exists(self, conditional_filebrowser_view(self.detail, self.file_validators))), 'detail'), name="fb_detail"),
+            url(r'^version/$', instrumented(file_exists(self, path_exists(self, conditional_filebrowser_view(self.version, self.file_validators))), 'version'), name="fb_version"),
+            url(r'^upload_file/$', instrumented(staff_member_required(csrf_exempt(self._upload_file)), '_upload_file'), name="fb_do_upload"),
+            url(r'^upload_chunk/$', instrumented(staff_member_required(csrf_exempt(self._upload_chunk)), '_upload_chunk'), name="fb_do_upload_chunk"),
         ]
         return urlpatterns
 
+    def instrument_view(self, view, name):
+        "Records the storage calls of view with name (s. STORAGE_INSTRUMENTATION)"
+        if not STORAGE_INSTRUMENTATION:
+            return view
+        return instrumented_view(view, self, name)
+
     def add_action(self, action, name=None):
         """
         Register an action to be available globally.
@@ -296,16 +391,20 @@ class FileBrowserSite(object):
                 exp = (r'_%s(%s)$') % (k, '|'.join(EXTENSION_LIST))
                 filter_re.append(re.compile(exp, re.IGNORECASE))
 
-        def filter_browse(item):
-            "Defining a browse filter"
-            filtered = item.filename.startswith('.')
+        def filter_filename(filename):
+            "Defining a browse filter (by filename)"
+            filtered = filename.startswith('.')
             for re_prefix in filter_re:
-                if re_prefix.search(item.filename):
+                if re_prefix.search(filename):
                     filtered = True
             if filtered:
                 return False
             return True
 
+        def filter_browse(item):
+            "Defining a browse filter"
+            return filter_filename(item.filename)
+
         query = request.GET.copy()
         path = u'%s' % os.path.join(self.directory, query.get('dir', ''))
 
@@ -315,12 +414,10 @@ class FileBrowserSite(object):
             sorting_by=query.get('o', DEFAULT_SORTING_BY),
             sorting_order=query.get('ot', DEFAULT_SORTING_ORDER),
             site=self)
-
-        files = []
-        if SEARCH_TRAVERSE and query.get("q"):
-            listing = filelisting.files_walk_filtered()
-        else:
-            listing = filelisting.files_listing_filtered()
+        # the listing already read for the ETag (s. browse_validators)
+        validated_listing = getattr(request, '_filebrowser_listing', None)
+        if validated_listing is not None and validated_listing.path == path:
+            filelisting._listing_entries = validated_listing.listing_entries()
 
         # If we do a search, precompile the search pattern now
         do_search = query.get("q")
@@ -330,19 +427,46 @@ class FileBrowserSite(object):
         filter_type = query.get('filter_type')
         filter_date = query.get('filter_date')
 
-        for fileobject in listing:
-            # date/type filter
-            append = False
-            if (not filter_type or fileobject.filetype == filter_type) and (not filter_date or get_filterdate(filter_date, fileobject.date or 0)):
-                append = True
-            # search
-            if do_search and not re_q.search(fileobject.filename.lower()):
-                append = False
-            # append
-            if append:
-                files.append(fileobject)
+        results_total = None
+        if SEARCH_TRAVERSE and do_search and self.search_index is not None:
+            # FileObjects are only created for the matching paths
+            listing = [
+                FileObject(item_path, site=self)
+                for item_path in self.search_index.search(path, regex=query.get("q").lower())
+                if filter_filename(os.path.basename(item_path))]
+            # counting the same items as walking the directories (s. files_walk_filtered)
+            results_total = self.search_index.count(path, filename_filter=filter_filename)
+        elif SEARCH_TRAVERSE and do_search:
+            listing = filelisting.files_walk_filtered(sort=False)
+        elif LAZY_LISTING and not filter_type and not filter_date and filelisting.sorting_by_name():
+            # Neither sorting nor filtering needs any metadata: FileObjects
+            # are only created for the current page (s. Paginator below).
+            listing = filelisting.files_listing_lazy(filename_filter=filter_filename)
+        else:
+            listing = filelisting.files_listing_filtered(sort=False)
 
-        filelisting.results_total = len(listing)
+        if isinstance(listing, LazyFileObjects):
+            files = listing
+            if do_search:
+                files = listing.filter(lambda filename: re_q.search(filename.lower()))
+        else:
+            files = []
+            for fileobject in listing:
+                # date/type filter
+                append = False
+                if (not filter_type or fileobject.filetype == filter_type) and (not filter_date or get_filterdate(filter_date, fileobject.date or 0)):
+                    append = True
+                # search
+                if do_search and not re_q.search(fileobject.filename.lower()):
+                    append = False
+                # append
+                if append:
+                    files.append(fileobject)
+            # Sorted after filtering, and only as far as the Paginator
+            # accesses the items (s. SortedFileObjects).
+            files = filelisting.sort_fileobjects(files)
+
+        filelisting.results_total = len(listing) if results_total is None else results_total
         filelisting.results_current = len(files)
 
         p = Paginator(files, LIST_PER_PAGE)
@@ -352,6 +476,10 @@ class FileBrowserSite(object):
         except (EmptyPage, InvalidPage):
             page = p.page(p.num_pages)
 
+        if isinstance(files, LazyFileObjects) and (self.metadata_cache is not None or not isinstance(self.storage, FileSystemStorage)):
+            # One (cached) listing instead of several storage calls for every item of the page
+            prefetch_metadata(page.object_list)
+
         request.current_app = self.name
         return TemplateResponse(request, 'filebrowser/index.html', dict(
             admin_site.each_context(request),
@@ -370,6 +498,78 @@ class FileBrowserSite(object):
             }
         ))
 
+    def _validators(self, request, fingerprint, last_modified):
+        """
+        ETag (from the fingerprint of the files, the request and the user)
+        and last modified datetime for conditional views, or None if the
+        response must not be cached (e.g. pending messages).
+        """
+        if len(messages.get_messages(request)):
+            return None
+        user = request.user
+        etag = hashlib.md5(force_bytes(repr([
+            request.path,
+            fingerprint,
+            sorted(request.GET.lists()),
+            user.pk,
+            user.get_username(),
+            user.is_superuser,
+            sorted(user.get_all_permissions()),
+            get_language(),
+            # forms of the page include the CSRF token
+            request.META.get('CSRF_COOKIE'),
+        ]))).hexdigest()
+        return etag, last_modified
+
+    def browse_validators(self, request):
+        """
+        ETag and last modified datetime of the browse view: the listing of
+        the directory (names, sizes and modified times) without creating
+        any FileObject. None for searches traversing directories or if the
+        storage is not able to list metadata (s. FileListing.listing_entries).
+        With date filters, the ETag includes which files match the filter
+        right now, and there is no last modified datetime.
+        """
+        query = request.GET
+        if SEARCH_TRAVERSE and query.get('q'):
+            return None
+        path = u'%s' % os.path.join(self.directory, query.get('dir', ''))
+        filelisting = self.filelisting_class(path, site=self)
+        entries = filelisting.listing_entries()
+        if entries is None:
+            return None
+        # the view reuses the listing (unless answered with 304 Not Modified)
+        request._filebrowser_listing = filelisting
+        filter_date = query.get('filter_date')
+        fingerprint = sorted(
+            (entry.name, entry.is_dir, entry.size, entry.modified_time,
+             # results of date filters change with the current time (e.g. past7days)
+             filter_date and get_filterdate(
+                 filter_date, mktime(entry.modified_time.timetuple()) if entry.modified_time else 0))
+            for entry in entries)
+        if filter_date:
+            return self._validators(request, fingerprint, None)
+        modified_times = [entry.modified_time for entry in entries if entry.modified_time is not None]
+        # the directory itself changes with deleted files
+        directory_modified_time = self._content_mtime(path)
+        if directory_modified_time is not None:
+            modified_times.append(directory_modified_time)
+        return self._validators(request, fingerprint, max(modified_times) if modified_times else None)
+
+    def file_validators(self, request):
+        """
+        ETag and last modified datetime of the detail and version views
+        (the modified time and size of the file), None if the storage does
+        not provide a modified time.
+        """
+        query = request.GET
+        path = os.path.join(self.directory, query.get('dir', ''), query.get('filename', ''))
+        modified_time = self._content_mtime(path)
+        if modified_time is None:
+            return None
+        size = None if self.storage.isdir(path) else self.storage.size(path)
+        return self._validators(request, (modified_time, size), modified_time)
+
     @check_permission('filebrowser.add_filebrowser')
     def createdir(self, request):
         "Create Directory"
@@ -443,12 +643,15 @@ class FileBrowserSite(object):
                 sorting_by=query.get('o', 'filename'),
                 sorting_order=query.get('ot', DEFAULT_SORTING_ORDER),
                 site=self)
-            filelisting = filelisting.files_walk_total()
-            if len(filelisting) > 100:
-                additional_files = len(filelisting) - 100
-                filelisting = filelisting[:100]
+            # Only the first 100 items are shown (and turned into FileObjects),
+            # the remaining items are just counted.
+            items = filelisting.walk_iter()
+            preview = [FileObject(os.path.join(self.directory, item), site=self) for item in islice(items, 100)]
+            if self.search_index is not None and len(preview) == 100:
+                additional_files = max(self.search_index.count(filelisting.path) - 100, 0) or None
             else:
-                additional_files = None
+                additional_files = sum(1 for item in items) or None
+            filelisting = list(filelisting.sort_fileobjects(preview))
         else:
             filelisting = None
             additional_files = None
@@ -534,6 +737,18 @@ class FileBrowserSite(object):
         else:
             form = ChangeForm(initial={"name": fileobject.filename}, path=path, fileobject=fileobject, filebrowser_site=self)
 
+        # Generate the admin versions shown with the template from a single decode of the image
+        if fileobject.filetype == "Image" and not fileobject.is_version:
+            if VERSIONS_ASYNC:
+                # the worker leaves out versions which are up to date (s. versions_generate)
+                version_queue.put_many(fileobject, list(ADMIN_VERSIONS) + [ADMIN_THUMBNAIL])
+            else:
+                try:
+                    fileobject.versions_generate(list(ADMIN_VERSIONS) + [ADMIN_THUMBNAIL])
+                except (IOError, OSError, ValueError, SyntaxError):
+                    # broken or unsupported images (PIL), the version templatetag shows placeholders
+                    logger.exception('Error generating versions of %s', fileobject.path)
+
         request.current_app = self.name
         return TemplateResponse(request, 'filebrowser/detail.html', dict(
             admin_site.each_context(request),
@@ -571,6 +786,109 @@ class FileBrowserSite(object):
             }
         ))
 
+    def _upload_path(self, request):
+        "Returns folder, path (relative to the storage location) and temporary for an upload request"
+        folder = request.GET.get('folder', '')
+        temporary = request.GET.get('temporary', '')
+
+        fb_uploadurl_re = re.compile(r'^.*(%s)' % reverse("filebrowser:fb_upload", current_app=self.name))
+        folder = fb_uploadurl_re.sub('', folder)
+
+        # temporary upload folder should be outside self.directory
+        if folder == UPLOAD_TEMPDIR and temporary == "true":
+            path = folder
+        else:
+            path = os.path.join(self.directory, folder)
+        return folder, path, temporary == "true"
+
+    @property
+    def deduplicate_uploads(self):
+        "True, if uploads are looked up with the content index (s. UPLOAD_DEDUPLICATE)"
+        return bool(UPLOAD_DEDUPLICATE) and self.metadata_cache is not None
+
+    def _content_mtime(self, path):
+        # Storages without modified times for directories (e.g. S3, where
+        # folders are key prefixes) raise AttributeError
+        try:
+            return get_modified_time(self.storage, path)
+        except (OSError, NotImplementedError, AttributeError):
+            return None
+
+    def _find_duplicate(self, digest):
+        "Returns the FileObject of an existing file with the content digest, or None"
+        record = self.metadata_cache.get_content(digest)
+        if record is None:
+            return None
+        # the file has been changed or removed since it was indexed
+        if record['mtime'] is None or self._content_mtime(record['path']) != record['mtime']:
+            self.metadata_cache.delete_content(digest)
+            return None
+        return FileObject(record['path'], site=self)
+
+    def _save_upload(self, request, folder, path, temporary, filedata, digest=None):
+        """
+        Saves the uploaded filedata with path, returns the JSON response for Ajax Upload.
+
+        With the content digest of filedata, identical files are looked up
+        with the content index (s. UPLOAD_DEDUPLICATE).
+        """
+        temp_filename = None
+        duplicate = None
+
+        # we convert the filename before uploading in order
+        # to check for existing files/folders
+        file_name = convert_filename(filedata.name)
+        filedata.name = file_name
+        file_path = os.path.join(path, file_name)
+        file_already_exists = self.storage.exists(file_path)
+
+        # construct temporary filename by adding the upload folder, because
+        # otherwise we don't have any clue if the file has temporary been
+        # uploaded or not
+        if folder == UPLOAD_TEMPDIR and temporary:
+            temp_filename = os.path.join(folder, file_name)
+
+        # Check for name collision with a directory
+        if file_already_exists and self.storage.isdir(file_path):
+            ret_json = {'success': False, 'filename': file_name}
+            return HttpResponse(json.dumps(ret_json))
+
+        # temporary uploads are moved later on, so they are not indexed
+        if digest is not None and not temporary:
+            duplicate = self._find_duplicate(digest)
+            if duplicate is not None and UPLOAD_DEDUPLICATE == 'existing':
+                # nothing is saved, the identical file (and its versions) is used instead
+                ret_json = {
+                    'success': True,
+                    'filename': duplicate.filename,
+                    'temp_filename': None,
+                    'url': duplicate.url,
+                    'duplicate_of': duplicate.path,
+                }
+                return HttpResponse(json.dumps(ret_json), content_type="application/json")
+
+        signals.filebrowser_pre_upload.send(sender=request, path=folder, file=filedata, site=self)
+        # the final name is decided before writing, an existing file is replaced
+        # instead of moving the upload afterwards (s. OVERWRITE_EXISTING)
+        file_name = smart_text(handle_file_upload(path, filedata, site=self, allow_overwrite=file_already_exists and OVERWRITE_EXISTING))
+        filedata.name = os.path.relpath(file_name, path)
+
+        f = FileObject(file_name, site=self)
+        signals.filebrowser_post_upload.send(sender=request, path=folder, file=f, site=self)
+
+        # let Ajax Upload know whether we saved it or not
+        ret_json = {
+            'success': True,
+            'filename': f.filename,
+            'temp_filename': temp_filename,
+            'url': f.url,
+        }
+        if duplicate is not None:
+            ret_json['duplicate_of'] = duplicate.path
+        elif digest is not None and not temporary:
+            self.metadata_cache.set_content(digest, f.path, self._content_mtime(f.path))
+        return HttpResponse(json.dumps(ret_json), content_type="application/json")
+
     @check_permission('filebrowser.add_filebrowser')
     def _upload_file(self, request):
         """
@@ -580,9 +898,11 @@ class FileBrowserSite(object):
         we upload to site.directory
         """
         if request.method == "POST":
-            folder = request.GET.get('folder', '')
-            temporary = request.GET.get('temporary', '')
-            temp_filename = None
+            digest_handler = None
+            if self.deduplicate_uploads:
+                # hash the file while it is received (before request.FILES is accessed)
+                digest_handler = ContentDigestUploadHandler(request)
+                request.upload_handlers.insert(0, digest_handler)
 
             if len(request.FILES) == 0:
                 return HttpResponseBadRequest('Invalid request! No files included.')
@@ -590,62 +910,116 @@ class FileBrowserSite(object):
                 return HttpResponseBadRequest('Invalid request! Multiple files included.')
 
             filedata = list(request.FILES.values())[0]
+            folder, path, temporary = self._upload_path(request)
+            digest = digest_handler.digest if digest_handler is not None else None
+            return self._save_upload(request, folder, path, temporary, filedata, digest=digest)
 
-            fb_uploadurl_re = re.compile(r'^.*(%s)' % reverse("filebrowser:fb_upload", current_app=self.name))
-            folder = fb_uploadurl_re.sub('', folder)
+    def _chunk_path(self, request, upload_id):
+        """
+        Returns the local path of the partial file for a chunked upload.
+        Partial files are scoped to the site, the user and the upload folder.
+        """
+        key = hashlib.sha256(force_bytes(repr([
+            self.name, request.user.pk, request.GET.get('folder', ''), upload_id]))).hexdigest()
+        return os.path.join(self._chunk_directory(), '%s.part' % key)
 
-            # temporary upload folder should be outside self.directory
-            if folder == UPLOAD_TEMPDIR and temporary == "true":
-                path = folder
-            else:
-                path = os.path.join(self.directory, folder)
-            # we convert the filename before uploading in order
-            # to check for existing files/folders
-            file_name = convert_filename(filedata.name)
-            filedata.name = file_name
-            file_path = os.path.join(path, file_name)
-            file_already_exists = self.storage.exists(file_path)
-
-            # construct temporary filename by adding the upload folder, because
-            # otherwise we don't have any clue if the file has temporary been
-            # uploaded or not
-            if folder == UPLOAD_TEMPDIR and temporary == "true":
-                temp_filename = os.path.join(folder, file_name)
-
-            # Check for name collision with a directory
-            if file_already_exists and self.storage.isdir(file_path):
-                ret_json = {'success': False, 'filename': file_name}
-                return HttpResponse(json.dumps(ret_json))
-
-            signals.filebrowser_pre_upload.send(sender=request, path=folder, file=filedata, site=self)
-            uploadedfile = handle_file_upload(path, filedata, site=self)
-
-            if file_already_exists and OVERWRITE_EXISTING:
-                old_file = smart_text(file_path)
-                new_file = smart_text(uploadedfile)
-                self.storage.move(new_file, old_file, allow_overwrite=True)
-                full_path = FileObject(smart_text(old_file), site=self).path_full
-            else:
-                file_name = smart_text(uploadedfile)
-                filedata.name = os.path.relpath(file_name, path)
-                full_path = FileObject(smart_text(file_name), site=self).path_full
-
-            # set permissions
-            if DEFAULT_PERMISSIONS is not None:
-                os.chmod(full_path, DEFAULT_PERMISSIONS)
-
-            f = FileObject(smart_text(file_name), site=self)
-            signals.filebrowser_post_upload.send(sender=request, path=folder, file=f, site=self)
-
-            # let Ajax Upload know whether we saved it or not
-            ret_json = {
-                'success': True,
-                'filename': f.filename,
-                'temp_filename': temp_filename,
-                'url': f.url,
-            }
+    def _chunk_directory(self):
+        "Returns the local directory of the partial files of chunked uploads"
+        directory = os.path.join(UPLOAD_TEMPDIR, 'chunks')
+        try:
+            directory = self.storage.path(directory)
+        except NotImplementedError:
+            # no local storage, keep the chunks with the system temp directory
+            directory = os.path.join(tempfile.gettempdir(), 'filebrowser_chunks')
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by a concurrent request
+                pass
+        return directory
+
+    def _remove_stale_chunks(self):
+        "Removes the partial files of uploads not continued within UPLOAD_CHUNK_MAX_AGE"
+        directory = self._chunk_directory()
+        expired = time() - UPLOAD_CHUNK_MAX_AGE
+        for filename in os.listdir(directory):
+            chunk_path = os.path.join(directory, filename)
+            try:
+                if filename.endswith('.part') and os.path.getmtime(chunk_path) < expired:
+                    os.remove(chunk_path)
+            except OSError:
+                # removed by a concurrent request
+                pass
+
+    @check_permission('filebrowser.add_filebrowser')
+    def _upload_chunk(self, request):
+        """
+        Upload a file with several requests (s. UPLOAD_CHUNK_SIZE).
+
+        GET returns the offset of an upload (the size of the partial file),
+        in order to resume an interrupted upload. POST appends a chunk at
+        offset (409 Conflict if the partial file has another size), the
+        last chunk completes the upload (like _upload_file).
+        """
+        upload_id = request.GET.get('upload_id', '')
+        if not re.match(r'^[\w-]{1,64}$', upload_id):
+            return HttpResponseBadRequest('Invalid request! Missing or invalid upload_id.')
+        chunk_path = self._chunk_path(request, upload_id)
+        current_offset = os.path.getsize(chunk_path) if os.path.exists(chunk_path) else 0
+
+        if request.method == "GET":
+            return HttpResponse(json.dumps({'offset': current_offset}), content_type="application/json")
+        if request.method != "POST":
+            return HttpResponseBadRequest('Invalid request!')
+
+        if len(request.FILES) != 1:
+            return HttpResponseBadRequest('Invalid request! Exactly one chunk must be included.')
+        try:
+            offset = int(request.GET.get('offset', ''))
+            total = int(request.GET.get('total', ''))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid request! Missing offset or total.')
+        chunk = list(request.FILES.values())[0]
+        if total > MAX_UPLOAD_SIZE or offset + chunk.size > total:
+            return HttpResponseBadRequest('Invalid request! The file is too large.')
+
+        if offset == 0:
+            self._remove_stale_chunks()
+
+        with open(chunk_path, 'ab') as f:
+            # concurrent requests for the same upload append one after another
+            locks.lock(f, locks.LOCK_EX)
+            current_offset = os.fstat(f.fileno()).st_size
+            if offset != current_offset:
+                # the client continues with the offset we have (e.g. after a chunk got lost)
+                ret_json = {'success': False, 'offset': current_offset}
+                return HttpResponse(json.dumps(ret_json), content_type="application/json", status=409)
+            for data in chunk.chunks():
+                f.write(data)
+        offset += chunk.size
+        if offset < total:
+            ret_json = {'success': True, 'offset': offset}
             return HttpResponse(json.dumps(ret_json), content_type="application/json")
 
+        # complete, move the file to the upload directory
+        filedata = ChunkedUploadedFile(chunk_path, request.GET.get('qqfile') or chunk.name, total)
+        folder, path, temporary = self._upload_path(request)
+        digest = None
+        if self.deduplicate_uploads:
+            # the chunks arrive with separate requests, the local partial file is hashed once complete
+            digest = hashlib.sha256()
+            for data in filedata.chunks():
+                digest.update(data)
+            digest = digest.hexdigest()
+            filedata.seek(0)
+        try:
+            return self._save_upload(request, folder, path, temporary, filedata, digest=digest)
+        finally:
+            filedata.close()
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
 storage = DefaultStorage()
 # Default FileBrowser site
 site = FileBrowserSite(name='filebrowser', storage=storage)
@@ -253,6 +253,9 @@ qq.FileUploaderBasic = function(o){
         // set to true to see the server response
         debug: false,
         action: '/server/upload',
+        // files larger than chunkSize are uploaded with several requests to chunkAction
+        chunkAction: null,
+        chunkSize: 0,
         params: {},
         button: null,
         multiple: true,
@@ -323,6 +326,8 @@ qq.FileUploaderBasic.prototype = {
         var handler = new qq[handlerClass]({
             debug: this._options.debug,
             action: this._options.action,         
+            chunkAction: this._options.chunkAction,
+            chunkSize: this._options.chunkSize,
             maxConnections: this._options.maxConnections,   
             onProgress: function(id, fileName, loaded, total){                
                 self._onProgress(id, fileName, loaded, total);
@@ -1176,6 +1181,11 @@ qq.extend(qq.UploadHandlerXhr.prototype, {
             size = this.getSize(id);
                 
         this._loaded[id] = 0;
+
+        if (this._options.chunkAction && this._options.chunkSize && size > this._options.chunkSize){
+            this._uploadChunked(id, params);
+            return;
+        }
                                 
         var xhr = this._xhrs[id] = new XMLHttpRequest();
         var self = this;
@@ -1206,6 +1216,103 @@ qq.extend(qq.UploadHandlerXhr.prototype, {
         xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
         xhr.send(formData);
     },
+    /**
+     * Uploads the file identified by id with several requests (chunks).
+     * Asks the server for the offset first and continues from there, so an
+     * interrupted upload is resumed (with up to 3 retries per chunk).
+     */
+    _uploadChunked: function(id, params){
+        var self = this,
+            file = this._files[id],
+            name = this.getName(id),
+            size = this.getSize(id),
+            slice = file.slice || file.webkitSlice || file.mozSlice,
+            retries = 0;
+
+        params = params || {};
+        // the same file (name, size, date) continues with the same upload
+        var uploadId = (name + '-' + size + '-' + (file.lastModified || '')).replace(/[^\w-]/g, '_').slice(-64);
+
+        var url = function(extra){
+            var query = {};
+            qq.extend(query, params);
+            qq.extend(query, {upload_id: uploadId, qqfile: name});
+            qq.extend(query, extra || {});
+            return qq.obj2url(query, self._options.chunkAction);
+        };
+
+        var request = function(method, query, data, onResponse){
+            var xhr = self._xhrs[id] = new XMLHttpRequest();
+            if (xhr.upload){
+                xhr.upload.onprogress = function(e){
+                    if (e.lengthComputable && query && query.offset !== undefined){
+                        self._loaded[id] = query.offset + e.loaded;
+                        self._options.onProgress(id, name, self._loaded[id], size);
+                    }
+                };
+            }
+            xhr.onreadystatechange = function(){
+                if (xhr.readyState != 4 || !self._files[id]) return;
+                var response = null;
+                if (xhr.status == 200 || xhr.status == 409){
+                    try {
+                        response = eval("(" + xhr.responseText + ")");
+                    } catch(err){
+                        response = null;
+                    }
+                }
+                onResponse(xhr, response);
+            };
+            xhr.open(method, url(query), true);
+            xhr.setRequestHeader("X-Requested-With", "XMLHttpRequest");
+            xhr.send(data);
+        };
+
+        var retry = function(xhr){
+            // resume with the offset of the server after a failed request
+            if (xhr.status != 400 && retries++ < 3){
+                setTimeout(resume, 1000 * retries);
+            } else {
+                self._onComplete(id, {status: xhr.status, responseText: xhr.responseText});
+            }
+        };
+
+        var send = function(offset){
+            var formData = new FormData();
+            formData.append('file', slice.call(file, offset, Math.min(offset + self._options.chunkSize, size)), name);
+            request("POST", {offset: offset, total: size}, formData, function(xhr, response){
+                if (xhr.status == 409 && response && response.offset !== undefined){
+                    // the partial file has another size (e.g. a chunk got lost or
+                    // was sent twice), continue with the offset of the server
+                    if (retries++ < 3){
+                        send(response.offset);
+                    } else {
+                        self._onComplete(id, {status: xhr.status, responseText: xhr.responseText});
+                    }
+                } else if (!response || xhr.status != 200){
+                    retry(xhr);
+                } else if (response.offset !== undefined && response.offset < size){
+                    retries = 0;
+                    send(response.offset);
+                } else {
+                    // the last chunk returns the response of the complete upload
+                    self._onComplete(id, xhr);
+                }
+            });
+        };
+
+        var resume = function(){
+            request("GET", null, null, function(xhr, response){
+                if (response && response.offset !== undefined){
+                    send(response.offset);
+                } else {
+                    retry(xhr);
+                }
+            });
+        };
+
+        resume();
+    },
     _onComplete: function(id, xhr){
         // the request was aborted/cancelled
         if (!this._files[id]) return;
@@ -1,7 +1,12 @@
 # coding: utf-8
 
+import errno
 import os
 import shutil
+import stat
+import uuid
+from collections import namedtuple
+from datetime import datetime
 
 from django.core.files.move import file_move_safe
 from django.utils.encoding import smart_text
@@ -9,6 +14,25 @@ from django.utils.encoding import smart_text
 from filebrowser.base import FileObject
 from filebrowser.settings import DEFAULT_PERMISSIONS
 
+try:
+    from os import scandir as _scandir
+except ImportError:
+    # Python 2: use the scandir backport, if installed
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+
+# One item of a directory listing, including the metadata
+# FileObject needs for filetype, filesize and date.
+# name: Name of the file/folder (not including the path)
+# is_dir: True, if the item is a folder
+# size: Size in bytes
+# modified_time: Modified time as datetime (s. storage.get_modified_time)
+# size and modified_time are None for dangling entries (e.g. broken symlinks).
+ListingEntry = namedtuple('ListingEntry', ['name', 'is_dir', 'size', 'modified_time'])
+
 
 class StorageMixin(object):
     """
@@ -53,6 +77,35 @@ class StorageMixin(object):
         """
         raise NotImplementedError()
 
+    def save_upload(self, name, content, allow_overwrite=False):
+        """
+        Saves content with name in one go and returns the name of the file.
+
+        If allow_overwrite==True, an existing file name is replaced. Otherwise
+        another name is chosen (like with save()).
+        """
+        if allow_overwrite and self.exists(name):
+            self.delete(name)
+        return self.save(name, content)
+
+    def read_header(self, name, length):
+        """
+        Returns (at most) the first length bytes of the file name.
+        """
+        f = self.open(name)
+        try:
+            return f.read(length)
+        finally:
+            f.close()
+
+    def scandir(self, name):
+        """
+        Returns a list of ListingEntry items (folders first, then files) for
+        the directory name, fetching names, types, sizes and modified times
+        at once. Analogue to os.scandir().
+        """
+        raise NotImplementedError()
+
 
 class FileSystemStorageMixin(StorageMixin):
 
@@ -75,29 +128,156 @@ class FileSystemStorageMixin(StorageMixin):
         full_path = FileObject(smart_text(name), site=self).path_full
         os.chmod(full_path, DEFAULT_PERMISSIONS)
 
+    def save_upload(self, name, content, allow_overwrite=False):
+        # Writes to a temporary file next to the final file and renames it,
+        # so an existing file is replaced atomically (and never copied).
+        if not allow_overwrite:
+            name = self.get_available_name(name)
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        temp_path = os.path.join(directory, '.%s.upload' % uuid.uuid4().hex)
+        mode = DEFAULT_PERMISSIONS if DEFAULT_PERMISSIONS is not None else self.file_permissions_mode
+        try:
+            moved = False
+            if hasattr(content, 'temporary_file_path'):
+                # uploads kept with a temporary file are moved instead of copied, if possible
+                try:
+                    os.rename(content.temporary_file_path(), temp_path)
+                    moved = True
+                except OSError:
+                    pass
+            if moved:
+                if mode is not None:
+                    os.chmod(temp_path, mode)
+            else:
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                    # permissions are set with the open file (not available with Windows)
+                    if mode is not None and hasattr(os, 'fchmod'):
+                        os.fchmod(f.fileno(), mode)
+                    elif mode is not None:
+                        os.chmod(temp_path, mode)
+            if allow_overwrite:
+                getattr(os, 'replace', os.rename)(temp_path, full_path)
+            elif hasattr(os, 'link'):
+                name = self._link_upload(temp_path, name)
+            else:
+                os.rename(temp_path, full_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name.replace('\\', '/')
+
+    def _link_upload(self, temp_path, name):
+        # Links the temporary file with name, which fails (instead of replacing
+        # the file) if the name has been taken meanwhile. Returns the final name.
+        while True:
+            full_path = self.path(name)
+            try:
+                os.link(temp_path, full_path)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    name = self.get_available_name(name)
+                    continue
+                # no hard links with this file system (e.g. EPERM, EXDEV, ENOTSUP)
+                file_move_safe(temp_path, full_path, allow_overwrite=False)
+                return name
+            os.remove(temp_path)
+            return name
+
+    def _listing_datetime(self, timestamp):
+        # Same conversion as get_modified_time() (Django >= 1.10)
+        if hasattr(self, '_datetime_from_timestamp'):
+            return self._datetime_from_timestamp(timestamp)
+        return datetime.fromtimestamp(timestamp)
+
+    def _listing_entry(self, name, stat_func):
+        try:
+            st = stat_func()
+        except OSError:
+            return ListingEntry(name, False, None, None)
+        return ListingEntry(name, stat.S_ISDIR(st.st_mode), st.st_size, self._listing_datetime(st.st_mtime))
+
+    def scandir(self, name):
+        path = self.path(name)
+        if _scandir is not None:
+            entries = [self._listing_entry(entry.name, entry.stat) for entry in _scandir(path)]
+        else:
+            entries = [self._listing_entry(entry, lambda entry=entry: os.stat(os.path.join(path, entry))) for entry in os.listdir(path)]
+        return [e for e in entries if e.is_dir] + [e for e in entries if not e.is_dir]
+
 
 class S3BotoStorageMixin(StorageMixin):
 
+    # Max. number of keys deleted with one (multi-object delete) request
+    delete_batch_size = 1000
+
+    def _directory_prefix(self, name):
+        # Key prefix of all items within the directory name ('' for the root)
+        name = self._encode_name(self._normalize_name(self._clean_name(name or '')))
+        return name.rstrip('/') + '/' if name.strip('/') else ''
+
+    def _listing_datetime(self, last_modified):
+        # Same conversion as S3BotoStorage.get_modified_time(). LIST responses
+        # include milliseconds, the Last-Modified header (HEAD) does not.
+        from boto.utils import parse_ts
+        from django.conf import settings
+        from django.utils import timezone
+        modified_time = timezone.make_aware(parse_ts(last_modified).replace(microsecond=0), timezone.utc)
+        if settings.USE_TZ:
+            return modified_time
+        return timezone.make_naive(modified_time, timezone.get_default_timezone())
+
+    def _list_directory(self, name):
+        """
+        Lists the directory name with one (paginated) delimiter request.
+        Returns a list of directory names and a list of keys.
+        """
+        prefix = self._directory_prefix(name)
+        prefix_length = len(smart_text(prefix))
+        dirs, keys = [], []
+        for item in self.bucket.list(prefix=prefix, delimiter='/'):
+            item_name = item.name[prefix_length:]
+            if item_name.endswith('/'):
+                # common prefix (boto.s3.prefix.Prefix)
+                dirs.append(item_name.rstrip('/'))
+            elif item_name:
+                # skip directory placeholders (keys named like the prefix)
+                keys.append(item)
+        return dirs, keys
+
     def isfile(self, name):
         return self.exists(name)
 
     def isdir(self, name):
-        # That's some inefficient implementation...
-        # If there are some files having 'name' as their prefix, then
+        # If there are some files having 'name/' as their prefix, then
         # the name is considered to be a directory
         if not name:  # Empty name is a directory
             return True
-
-        if self.isfile(name):
-            return False
-
-        name = self._normalize_name(self._clean_name(name))
-        dirlist = self.bucket.list(self._encode_name(name))
-
-        # Check whether the iterator is empty
-        for item in dirlist:
-            return True
-        return False
+        return len(self.bucket.get_all_keys(prefix=self._directory_prefix(name), max_keys=1)) > 0
+
+    def listdir(self, name):
+        dirs, keys = self._list_directory(name)
+        return dirs, [key.name.rsplit('/', 1)[-1] for key in keys]
+
+    def scandir(self, name):
+        # Sizes and modified times are part of the LIST response, so
+        # FileObjects do not need a HEAD request for each key.
+        dirs, keys = self._list_directory(name)
+        entries = [ListingEntry(d, True, None, None) for d in dirs]
+        for key in keys:
+            entries.append(ListingEntry(
+                key.name.rsplit('/', 1)[-1], False, key.size, self._listing_datetime(key.last_modified)))
+        return entries
 
     def move(self, old_file_name, new_file_name, allow_overwrite=False):
 
@@ -120,11 +300,26 @@ class S3BotoStorageMixin(StorageMixin):
     def makedirs(self, name):
         pass
 
-    def rmtree(self, name):
+    def save_upload(self, name, content, allow_overwrite=False):
+        # A PUT replaces an existing key, no need to delete it before
+        if allow_overwrite:
+            return self._save(name, content)
+        return self.save(name, content)
+
+    def read_header(self, name, length):
+        # Ranged GET instead of downloading the whole file
         name = self._normalize_name(self._clean_name(name))
-        dirlist = self.bucket.list(self._encode_name(name))
-        for item in dirlist:
-            item.delete()
+        key = self.bucket.get_key(self._encode_name(name))
+        return key.get_contents_as_string(headers={'Range': 'bytes=0-%d' % (length - 1)})
+
+    def rmtree(self, name):
+        # Multi-object delete requests instead of one request per key
+        key_names = [key.name for key in self.bucket.list(prefix=self._directory_prefix(name))]
+        for i in range(0, len(key_names), self.delete_batch_size):
+            result = self.bucket.delete_keys(key_names[i:i + self.delete_batch_size], quiet=True)
+            if result.errors:
+                error = result.errors[0]
+                raise IOError("Couldn't delete '%s': %s" % (error.key, error.message))
 
     def setpermission(self, name):
         # Permissions for S3 uploads with django-storages
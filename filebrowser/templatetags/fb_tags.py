@@ -7,7 +7,8 @@ from django.template import TemplateSyntaxError
 from django.utils.http import urlquote
 from django.utils.safestring import mark_safe
 
-from filebrowser.settings import EXTENSIONS, SELECT_FORMATS
+from filebrowser.settings import SELECT_FORMATS
+from filebrowser.utils import get_format_extensions, get_format_filetypes
 
 
 register = template.Library()
@@ -123,10 +124,8 @@ class SelectableNode(template.Node):
             format = self.format.resolve(context)
         except template.VariableDoesNotExist:
             format = ''
-        if filetype and format and filetype in SELECT_FORMATS[format]:
-            selectable = True
-        elif filetype and format and filetype not in SELECT_FORMATS[format]:
-            selectable = False
+        if filetype and format:
+            selectable = filetype in get_format_filetypes(format)
         else:
             selectable = True
         context['selectable'] = selectable
@@ -146,16 +145,11 @@ register.tag(selectable)
 
 
 def get_file_extensions(qs):
-    extensions = []
     if "type" in qs and qs.get("type") in SELECT_FORMATS:
-        for format in SELECT_FORMATS.get(qs.get("type"), []):
-            extensions.extend(EXTENSIONS[format])
+        extensions = get_format_extensions(qs.get("type"))
     else:
-        for k, v in EXTENSIONS.items():
-            for item in v:
-                if item:
-                    extensions.append(item)
-    return mark_safe(extensions)
+        extensions = get_format_extensions()
+    return mark_safe(list(extensions))
 
 
 # Django 1.9 auto escapes simple_tag unless marked as safe
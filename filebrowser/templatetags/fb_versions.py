@@ -4,9 +4,10 @@ from django.conf import settings
 from django.core.files import File
 from django.template import Library, Node, Variable, VariableDoesNotExist, TemplateSyntaxError
 
-from filebrowser.settings import VERSIONS, PLACEHOLDER, SHOW_PLACEHOLDER, FORCE_PLACEHOLDER
+from filebrowser.settings import VERSIONS, PLACEHOLDER, SHOW_PLACEHOLDER, FORCE_PLACEHOLDER, VERSIONS_ASYNC
 from filebrowser.base import FileObject
 from filebrowser.sites import get_default_site
+from filebrowser.workers import version_queue
 
 
 register = Library()
@@ -39,7 +40,10 @@ class VersionNode(Node):
             source = PLACEHOLDER
         fileobject = FileObject(source, site=site)
         try:
-            version = fileobject.version_generate(version_suffix)
+            if VERSIONS_ASYNC:
+                version = self.version_async(fileobject, version_suffix)
+            else:
+                version = fileobject.version_generate(version_suffix)
             if self.var_name:
                 context[self.var_name] = version
             else:
@@ -51,6 +55,16 @@ class VersionNode(Node):
                 context[self.var_name] = ""
         return ""
 
+    def version_async(self, fileobject, version_suffix):
+        """
+        Returns the version (which may not exist yet) and adds a job
+        for generating it, if necessary.
+        """
+        version_path = fileobject.version_path(version_suffix)
+        if not version_queue.is_pending(version_path) and fileobject.version_outdated(version_suffix):
+            version_queue.put(fileobject, version_suffix)
+        return FileObject(version_path, site=fileobject.site)
+
 
 def version(parser, token):
     """
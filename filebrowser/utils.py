@@ -2,6 +2,7 @@
 
 import re
 import os
+import struct
 import unicodedata
 import math
 from unidecode import unidecode
@@ -11,7 +12,7 @@ from django.utils.module_loading import import_string
 from django.utils.encoding import smart_unicode
 from django.template.defaultfilters import slugify
 from filebrowser.settings import STRICT_PIL, NORMALIZE_FILENAME, CONVERT_FILENAME, SLUGIFY_FILENAME
-from filebrowser.settings import VERSION_PROCESSORS
+from filebrowser.settings import VERSION_PROCESSORS, EXTENSIONS, SELECT_FORMATS
 
 if STRICT_PIL:
     from PIL import Image
@@ -71,36 +72,100 @@ def path_strip(path, root):
 _default_processors = None
 
 
+def get_default_processors():
+    """
+    Get the image processors defined with VERSION_PROCESSORS.
+    """
+    global _default_processors
+    if _default_processors is None:
+        _default_processors = [import_string(name) for name in VERSION_PROCESSORS]
+    return _default_processors
+
+
+_extension_index = None
+
+
+def get_extension_index():
+    """
+    Get a dict mapping (lower case) extensions to their filetype as defined with EXTENSIONS.
+    """
+    global _extension_index
+    if _extension_index is None:
+        index = {}
+        for filetype, extensions in EXTENSIONS.items():
+            for extension in extensions:
+                if extension:
+                    index[extension.lower()] = filetype
+        _extension_index = index
+    return _extension_index
+
+
+def get_file_type(extension):
+    """
+    Get the filetype for an extension (including the dot), '' if the
+    extension is not defined with EXTENSIONS.
+    """
+    return get_extension_index().get(extension.lower(), '')
+
+
+_format_filetypes = {}
+_format_extensions = {}
+
+
+def get_format_filetypes(format):
+    """
+    Get the filetypes selectable with a format (as defined with SELECT_FORMATS).
+    """
+    if format not in _format_filetypes:
+        _format_filetypes[format] = frozenset(SELECT_FORMATS[format])
+    return _format_filetypes[format]
+
+
+def get_format_extensions(format=None):
+    """
+    Get the extensions of all filetypes selectable with a format (as defined
+    with SELECT_FORMATS) or all extensions defined with EXTENSIONS (if format is None).
+    """
+    if format not in _format_extensions:
+        if format is None:
+            filetypes = EXTENSIONS.keys()
+        else:
+            filetypes = SELECT_FORMATS[format]
+        _format_extensions[format] = tuple(
+            extension for filetype in filetypes for extension in EXTENSIONS.get(filetype, []) if extension)
+    return _format_extensions[format]
+
+
 def process_image(source, processor_options, processors=None):
     """
     Process a source PIL image through a series of image processors, returning
     the (potentially) altered image.
     """
-    global _default_processors
     if processors is None:
-        if _default_processors is None:
-            _default_processors = [import_string(name) for name in VERSION_PROCESSORS]
-        processors = _default_processors
+        processors = get_default_processors()
     image = source
     for processor in processors:
         image = processor(image, **processor_options)
     return image
 
 
-def scale_and_crop(im, width=None, height=None, opts='', **kwargs):
+def scale_and_crop_ratio(size, width=None, height=None, opts=''):
     """
-    Scale and Crop.
+    Get the ratio scale_and_crop resizes an image of size (x, y) with,
+    together with the size (xr, yr) it is cropped to.
+
+    Returns None if scale_and_crop does not change the image at all.
     """
-    x, y = [float(v) for v in im.size]
+    x, y = [float(v) for v in size]
     width = float(width or 0)
     height = float(height or 0)
 
     if (x, y) == (width, height):
-        return im
+        return None
 
     if 'upscale' not in opts:
         if (x < width or not width) and (y < height or not height):
-            return im
+            return None
 
     if width:
         xr = float(width)
@@ -115,15 +180,128 @@ def scale_and_crop(im, width=None, height=None, opts='', **kwargs):
         r = max(xr / x, yr / y)
     else:
         r = min(xr / x, yr / y)
+    return r, xr, yr
+
+
+def crop_center(im, xr, yr):
+    """
+    Crop the center (xr, yr) of an image.
+    """
+    x, y = [float(v) for v in im.size]
+    ex, ey = (x - min(x, xr)) / 2, (y - min(y, yr)) / 2
+    if ex or ey:
+        im = im.crop((int(ex), int(ey), int(ex + xr), int(ey + yr)))
+    return im
+
+
+def scale_and_crop(im, width=None, height=None, opts='', **kwargs):
+    """
+    Scale and Crop.
+    """
+    ratio = scale_and_crop_ratio(im.size, width, height, opts)
+    if ratio is None:
+        return im
+    r, xr, yr = ratio
+    x, y = im.size
 
     if r < 1.0 or (r > 1.0 and 'upscale' in opts):
         im = im.resize((int(math.ceil(x * r)), int(math.ceil(y * r))), resample=Image.ANTIALIAS)
 
     if 'crop' in opts:
-        x, y = [float(v) for v in im.size]
-        ex, ey = (x - min(x, xr)) / 2, (y - min(y, yr)) / 2
-        if ex or ey:
-            im = im.crop((int(ex), int(ey), int(ex + xr), int(ey + yr)))
+        im = crop_center(im, xr, yr)
     return im
 
 scale_and_crop.valid_options = ('crop', 'upscale')
+
+
+# JPEG "start of frame" markers (except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+# JPEG markers without a length/payload
+JPEG_STANDALONE_MARKERS = set([0x01, 0xD8] + list(range(0xD0, 0xD8)))
+
+
+def _jpeg_dimensions(data):
+    i = 2
+    while i + 4 <= len(data):
+        if data[i:i + 1] != b'\xff':
+            return None
+        marker = struct.unpack('B', data[i + 1:i + 2])[0]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def _tiff_dimensions(data):
+    byteorder = '<' if data[:2] == b'II' else '>'
+    offset = struct.unpack(byteorder + 'I', data[4:8])[0]
+    if offset + 2 > len(data):
+        return None
+    count = struct.unpack(byteorder + 'H', data[offset:offset + 2])[0]
+    width = height = None
+    for n in range(count):
+        entry = data[offset + 2 + n * 12:offset + 14 + n * 12]
+        if len(entry) < 12:
+            return None
+        tag, type_ = struct.unpack(byteorder + 'HH', entry[:4])
+        if tag not in (256, 257):
+            continue
+        if type_ == 3:  # SHORT
+            value = struct.unpack(byteorder + 'H', entry[8:10])[0]
+        else:  # LONG
+            value = struct.unpack(byteorder + 'I', entry[8:12])[0]
+        if tag == 256:
+            width = value
+        else:
+            height = value
+        if width is not None and height is not None:
+            return width, height
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = struct.unpack('<I', data[24:27] + b'\x00')[0]
+        height = struct.unpack('<I', data[27:30] + b'\x00')[0]
+        return width + 1, height + 1
+    return None
+
+
+def get_image_dimensions_from_header(data):
+    """
+    Get the dimensions (width, height) of an image from the first bytes of
+    the file (JPEG, PNG, GIF, TIFF and WebP).
+
+    Returns None if the format is unknown or data does not contain the
+    dimensions (e.g. because it is too short).
+    """
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        if data[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', data[6:10])
+        if data[:2] == b'\xff\xd8':
+            return _jpeg_dimensions(data)
+        if data[:4] in (b'II*\x00', b'MM\x00*'):
+            return _tiff_dimensions(data)
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return _webp_dimensions(data)
+    except struct.error:
+        pass
+    return None
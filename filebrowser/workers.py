@@ -0,0 +1,116 @@
+# coding: utf-8
+
+import logging
+import threading
+
+from django.utils.six.moves import queue
+
+from filebrowser import signals
+from filebrowser.settings import VERSIONS_ASYNC_WORKERS, VERSIONS_PREGENERATE, ADMIN_VERSIONS, ADMIN_THUMBNAIL, UPLOAD_TEMPDIR
+
+
+logger = logging.getLogger('filebrowser')
+
+
+class VersionQueue(object):
+    """
+    Generates versions with a pool of background threads.
+
+    Jobs are deduplicated by version path, so a version which is requested
+    again while it is still waiting (or being generated) is not generated twice.
+    Several versions of one image are generated with a single job (s. put_many).
+    """
+
+    def __init__(self, workers=VERSIONS_ASYNC_WORKERS):
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        # Threads are started with the first job (not at import time)
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name='filebrowser-versions-%d' % len(self._threads))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, fileobject, version_suffix, extra_options=None):
+        """
+        Add a job for generating a version of fileobject.
+
+        Returns the path of the version, which exists as soon as the job is done.
+        """
+        version_path = fileobject.version_path(version_suffix, extra_options)
+        self._put(fileobject, [version_suffix], [version_path], extra_options)
+        return version_path
+
+    def put_many(self, fileobject, version_suffixes, extra_options=None):
+        """
+        Add a job for generating several versions of fileobject with a
+        single decode of the image (s. FileObject.versions_generate).
+
+        Returns the paths of the versions.
+        """
+        version_paths = [fileobject.version_path(version_suffix, extra_options) for version_suffix in version_suffixes]
+        self._put(fileobject, version_suffixes, version_paths, extra_options)
+        return version_paths
+
+    def _put(self, fileobject, version_suffixes, version_paths, extra_options):
+        with self._lock:
+            # versions already waiting are left out
+            jobs = [(suffix, path) for suffix, path in zip(version_suffixes, version_paths) if path not in self._pending]
+            if not jobs:
+                return
+            self._pending.update(path for suffix, path in jobs)
+            self._start()
+        self._queue.put(([path for suffix, path in jobs], fileobject, [suffix for suffix, path in jobs], extra_options))
+
+    def is_pending(self, version_path):
+        "True, if the version is waiting to be (or being) generated"
+        return version_path in self._pending
+
+    def _work(self):
+        while True:
+            version_paths, fileobject, version_suffixes, extra_options = self._queue.get()
+            try:
+                if len(version_suffixes) == 1:
+                    fileobject.version_generate(version_suffixes[0], extra_options)
+                else:
+                    fileobject.versions_generate(version_suffixes, extra_options)
+            except Exception:
+                logger.exception('Error generating versions %s', ', '.join(version_paths))
+            finally:
+                with self._lock:
+                    self._pending.difference_update(version_paths)
+                self._queue.task_done()
+
+    def join(self):
+        "Block until all jobs are done"
+        self._queue.join()
+
+
+# Default queue used by the {% version %} templatetag
+version_queue = VersionQueue()
+
+
+def get_pregenerate_versions():
+    "Returns the version suffixes generated with every uploaded image (s. VERSIONS_PREGENERATE)"
+    if VERSIONS_PREGENERATE is True:
+        return [ADMIN_THUMBNAIL] + [suffix for suffix in ADMIN_VERSIONS if suffix != ADMIN_THUMBNAIL]
+    return list(VERSIONS_PREGENERATE or [])
+
+
+# Generate versions of uploaded images in the background
+
+def pregenerate_versions(sender, path, file, site, **kwargs):
+    version_suffixes = get_pregenerate_versions()
+    # temporary uploads are moved later on
+    if not version_suffixes or path == UPLOAD_TEMPDIR:
+        return
+    if file.filetype == "Image" and not file.is_version:
+        version_queue.put_many(file, version_suffixes)
+
+
+signals.filebrowser_post_upload.connect(pregenerate_versions)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmarks for listing, search, versions and uploads (s. benchmarks/suite.py).
+
+    ./runbenchmarks.py --sizes 1000 10000 100000 --output results.json
+    ./runbenchmarks.py --compare results.json --threshold 1.2
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000],
+                        help='Number of files of the synthetic media trees. Default: 1000 10000')
+    parser.add_argument('--storages', nargs='+', choices=['local', 'memory'], default=['local', 'memory'],
+                        help='Storages to benchmark. Default: local memory')
+    parser.add_argument('--select', nargs='+', default=None, metavar='PREFIX',
+                        help='Run the benchmarks with names starting with PREFIX only (e.g. listing versions.large)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (the median is reported). Default: 3')
+    parser.add_argument('--images', type=int, default=10, help='Images per image size. Default: 10')
+    parser.add_argument('--output', default=None, help='Write the results (JSON) to this file')
+    parser.add_argument('--compare', default=None, help='Compare with results (JSON) of a previous run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='With --compare: exit with an error if a median is slower by this factor. Default: 1.2')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from benchmarks.suite import compare, run_suite, write_results
+
+    def log(message):
+        sys.stdout.write(message + '\n')
+        sys.stdout.flush()
+
+    try:
+        results = run_suite(sizes=args.sizes, storages=args.storages, repeat=args.repeat, select=args.select,
+                            images_per_size=args.images, log=log)
+    finally:
+        if not os.environ.get('FILEBROWSER_BENCHMARK_ROOT'):
+            shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    regressions = []
+    if args.compare:
+        with io.open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        for result, ratio in regressions:
+            log('slower: %s %s %d files (%.2fx)' % (result['benchmark'], result['storage'], result['files'], ratio))
+
+    if args.output:
+        write_results(args.output, results, sizes=args.sizes, storages=args.storages, repeat=args.repeat,
+                      images=args.images, select=args.select)
+    sys.exit(bool(regressions))
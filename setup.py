@@ -17,7 +17,7 @@ setup(
     maintainer='Maxim Sukharev',
     maintainer_email='max@smacker.ru',
     license='BSD',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     include_package_data=True,
     classifiers=[
         'Development Status :: 5 - Production/Stable',
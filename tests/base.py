@@ -3,13 +3,25 @@ import shutil
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import RequestFactory, TestCase
 
 from filebrowser.settings import DIRECTORY, VERSIONS_BASEDIR
 from filebrowser.base import FileObject
 from filebrowser.sites import site
 
 
+def superuser_request(method, path, data=None, user_pk=None, **extra):
+    """
+    Returns a request of an active superuser (not saved to the database),
+    in order to call the views of a site directly.
+    """
+    request = getattr(RequestFactory(), method)(path, data or {}, **extra)
+    request.user = User(pk=user_pk, is_active=True, is_staff=True, is_superuser=True)
+    request._messages = CookieStorage(request)
+    return request
+
+
 class FilebrowserTestCase(TestCase):
 
     @classmethod
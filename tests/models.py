@@ -1,3 +1,15 @@
+from django.db import models
+
+from filebrowser.fields import FileBrowseField, FileBrowseQuerySet
+
+
+class BlogEntry(models.Model):
+    image = FileBrowseField(max_length=255, blank=True)
+    document = FileBrowseField(max_length=255, blank=True)
+
+    objects = FileBrowseQuerySet.as_manager()
+
+
 from .test_base import *
 from .test_commands import *
 from .test_decorators import *
@@ -2,14 +2,17 @@
 
 import os
 import ntpath
+import pickle
 import posixpath
 import shutil
 
 from mock import patch
 
-from filebrowser.base import FileObject, FileListing
+from filebrowser.base import FileObject, FileListing, prefetch_metadata
 from filebrowser.sites import site
 from filebrowser.settings import VERSIONS
+from filebrowser.utils import scale_and_crop
+from PIL import Image
 from tests.base import FilebrowserTestCase as TestCase
 
 
@@ -121,6 +124,35 @@ class FileObjectAttributeTests(TestCase):
         # FIXME: test date/datetime
         self.assertEqual(self.F_IMAGE.exists, True)
 
+    def test_cached_attributes(self):
+        """
+        FileObject cached attributes (kept with slots)
+
+        # is_cached
+        # set/delete
+        # pickle
+        """
+        fileobject = FileObject(self.F_IMAGE.path, site=site)
+        self.assertFalse(hasattr(fileobject, '__dict__'))
+        self.assertFalse(fileobject.is_cached('filesize'))
+        with patch.object(site.storage, 'size', return_value=870037) as size:
+            self.assertEqual(fileobject.filesize, 870037)
+            self.assertEqual(fileobject.filesize, 870037)
+            self.assertEqual(size.call_count, 1)
+        self.assertTrue(fileobject.is_cached('filesize'))
+
+        fileobject.date = 1.0
+        self.assertEqual(fileobject.date, 1.0)
+        del fileobject.date
+        del fileobject.date
+        self.assertFalse(fileobject.is_cached('date'))
+
+        fileobject = pickle.loads(pickle.dumps(fileobject))
+        self.assertEqual(fileobject.path, self.F_IMAGE.path)
+        self.assertTrue(fileobject.is_cached('filesize'))
+        self.assertFalse(fileobject.is_cached('date'))
+        self.assertEqual(fileobject.filename, 'testimage.jpg')
+
     def test_path_url_attributes(self):
         """
         FileObject path and url attributes
@@ -168,6 +200,15 @@ class FileObjectAttributeTests(TestCase):
         self.assertEqual(self.F_IMAGE.aspectratio, 1.3333333333333333)
         self.assertEqual(self.F_IMAGE.orientation, 'Landscape')
 
+    def test_dimensions_from_header(self):
+        """
+        FileObject dimensions are read from the header of the file
+        """
+        with patch('filebrowser.base.Image.open') as image_open, patch.object(site.storage, 'read_header', wraps=site.storage.read_header) as read_header:
+            self.assertEqual(self.F_IMAGE.dimensions, (1000, 750))
+            self.assertFalse(image_open.called)
+            read_header.assert_called_once_with(self.F_IMAGE.path, 4 * 1024)
+
     def test_folder_attributes(self):
         """
         FileObject folder attributes
@@ -413,6 +454,132 @@ class FileListingTests(TestCase):
         self.assertEqual(self.F_LISTING_FOLDER.results_listing_total(), 2)
         self.assertEqual(self.F_LISTING_FOLDER.results_listing_filtered(), 2)
 
+    def test_listing_entries(self):
+        """
+        FileListing listing with metadata
+
+        # listing_entries
+        # files_listing_total (prefilled attributes)
+        """
+
+        self.assertEqual(self.F_LISTING_IMAGE.listing_entries(), [])
+        entries = self.F_LISTING_FOLDER.listing_entries()
+        self.assertEqual([(e.name, e.is_dir) for e in entries], [(u'folder', True), (u'testimage.jpg', False)])
+        self.assertEqual(entries[1].size, 870037)
+
+        with patch.object(site.storage, 'size') as size, patch.object(site.storage, 'exists') as exists, patch.object(site.storage, 'isdir') as isdir:
+            listing = FileListing(self.DIRECTORY, sorting_by='filesize', sorting_order='asc')
+            listing.__dict__['is_folder'] = True
+            files = listing.files_listing_total()
+            self.assertEqual([(f.filename, f.is_folder, f.exists) for f in files], [(u'folder', True, True), (u'testimage.jpg', False, True)])
+            self.assertEqual(files[1].filesize, 870037)
+            self.assertFalse(size.called)
+            self.assertFalse(exists.called)
+            self.assertFalse(isdir.called)
+        self.assertEqual(files[1].date, FileObject(files[1].path, site=site).date)
+
+    def test_prefetch_metadata(self):
+        """
+        prefetch_metadata fills listing attributes with one listing per directory
+        """
+        shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
+        fileobjects = [
+            FileObject(os.path.join(self.DIRECTORY, 'testimage.jpg'), site=site),
+            FileObject(os.path.join(self.DIRECTORY, 'folder'), site=site),
+            FileObject(os.path.join(self.DIRECTORY, 'missing.jpg'), site=site),
+            FileObject(os.path.join(self.DIRECTORY, 'folder', 'subfolder', 'testimage.jpg'), site=site),
+        ]
+        expected = [(f.is_folder, f.exists, f.filesize, f.date) for f in [FileObject(f.path, site=site) for f in fileobjects]]
+
+        with patch.object(site.storage, 'scandir', wraps=site.storage.scandir) as scandir:
+            prefetch_metadata(fileobjects)
+            self.assertEqual(scandir.call_count, 2)
+        with patch.object(site.storage, 'size') as size, patch.object(site.storage, 'exists') as exists, patch.object(site.storage, 'isdir') as isdir:
+            self.assertEqual([(f.is_folder, f.exists, f.filesize, f.date) for f in fileobjects], expected)
+            self.assertFalse(size.called or exists.called or isdir.called)
+
+        # only the given fields are filled
+        fileobject = FileObject(os.path.join(self.DIRECTORY, 'testimage.jpg'), site=site)
+        prefetch_metadata([fileobject], fields=('filesize', ))
+        self.assertTrue(fileobject.is_cached('filesize'))
+        self.assertEqual(fileobject.filesize, 870037)
+        self.assertFalse(fileobject.is_cached('date'))
+
+    def test_listing_lazy(self):
+        """
+        FileListing lazy listing
+
+        # sorting_by_name
+        # files_listing_lazy
+        """
+
+        self.assertEqual(self.F_LISTING_FOLDER.sorting_by_name(), False)
+        self.assertRaises(ValueError, self.F_LISTING_FOLDER.files_listing_lazy)
+
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.DIRECTORY_PATH, 'Another.jpg'))
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.DIRECTORY_PATH, '.hidden.jpg'))
+        listing = FileListing(self.DIRECTORY, sorting_by='filename_lower', sorting_order='desc')
+        self.assertEqual(listing.sorting_by_name(), True)
+
+        with patch('filebrowser.base.FileObject') as fileobject_class:
+            files = listing.files_listing_lazy(filename_filter=lambda filename: not filename.startswith('.'))
+            self.assertEqual(len(files), 3)
+            self.assertFalse(fileobject_class.called)
+
+        self.assertEqual(files.filenames, [u'testimage.jpg', u'folder', u'Another.jpg'])
+        self.assertEqual([f.path for f in files[1:]], [u'_test/uploads/folder', u'_test/uploads/Another.jpg'])
+        self.assertEqual(files[0].filesize, 870037)
+        self.assertEqual(files.filter(lambda filename: 'image' in filename).filenames, [u'testimage.jpg'])
+        self.assertEqual(listing.results_listing_total(), 4)
+        self.assertEqual(listing.results_listing_filtered(), 3)
+
+    def test_sorting(self):
+        """
+        FileListing sorting
+
+        # sort_keys
+        # sort_fileobjects
+        # files_listing_total (cached FileObjects are not modified)
+        """
+        listing = FileListing(self.DIRECTORY, sorting_order='desc')
+        first = [f.filename for f in listing.files_listing_total()]
+        self.assertEqual([f.filename for f in listing.files_listing_total()], first)
+        self.assertEqual([f.filename for f in listing._fileobjects_total], list(reversed(first)))
+        self.assertEqual([f.filename for f in listing.files_listing_total(sort=False)], list(reversed(first)))
+
+        # metadata is prefetched with one listing per directory, missing values come first
+        listing = FileListing(self.DIRECTORY, sorting_by='filesize', sorting_order='asc')
+        files = listing.files_walk_total(sort=False) + [FileObject(os.path.join(self.DIRECTORY, 'missing.jpg'), site=site)]
+        expected = [FileObject(f.path, site=site).filesize for f in files]
+        expected[-1] = float('-inf')
+        with patch.object(site.storage, 'scandir', wraps=site.storage.scandir) as scandir, \
+                patch.object(site.storage, 'size') as size, patch.object(site.storage, 'exists') as exists:
+            keys = listing.sort_keys(files)
+            self.assertEqual(scandir.call_count, 3)
+            self.assertFalse(size.called or exists.called)
+        self.assertEqual(keys, expected)
+        self.assertEqual([f.filename for f in listing.sort_fileobjects(files)][0], 'missing.jpg')
+
+    def test_sorted_fileobjects(self):
+        """
+        SortedFileObjects only sorts the items being accessed
+        """
+        for i in range(100):
+            open(os.path.join(self.SUBFOLDER_PATH, 'file%03d.txt' % (i * 37 % 100)), 'w').close()
+        listing = FileListing(os.path.join(self.DIRECTORY, 'folder', 'subfolder'), sorting_by='filename', sorting_order='desc')
+        expected = sorted(listing.files_listing_total(sort=False), key=lambda f: f.filename, reverse=True)
+
+        files = listing.sort_fileobjects(listing.files_listing_total(sort=False))
+        self.assertEqual(len(files), 101)
+        self.assertEqual(files[0], expected[0])
+        self.assertEqual(files[:10], expected[:10])
+        self.assertEqual(len(files.head(10)), 10)
+        self.assertFalse(files._complete)
+        self.assertEqual(files[-1], expected[-1])
+        self.assertEqual(files[10:20], expected[10:20])
+        self.assertEqual(list(files), expected)
+        self.assertRaises(IndexError, lambda: files[101])
+
     def test_walk(self):
         """
         FileObject walk
@@ -431,6 +598,28 @@ class FileListingTests(TestCase):
         self.assertEqual(self.F_LISTING_FOLDER.results_walk_total(), 4)
         self.assertEqual(self.F_LISTING_FOLDER.results_walk_filtered(), 4)
 
+    def test_walk_iter(self):
+        """
+        FileListing walk_iter
+
+        # walk_iter
+        # files_walk_iter
+        """
+
+        self.assertEqual(list(self.F_LISTING_IMAGE.walk_iter()), [])
+        self.assertEqual(list(self.F_LISTING_FOLDER.walk_iter(max_depth=1)), [u'folder', u'testimage.jpg'])
+        self.assertEqual(list(self.F_LISTING_FOLDER.walk_iter(max_depth=2)), [u'folder/subfolder', u'folder', u'testimage.jpg'])
+        self.assertEqual(list(self.F_LISTING_FOLDER.walk_iter(stop_func=lambda item: item == u'folder/subfolder')), [u'folder/subfolder/testimage.jpg', u'folder/subfolder'])
+
+        # symbolic links creating a cycle are not walked again
+        os.symlink(self.FOLDER_PATH, os.path.join(self.SUBFOLDER_PATH, 'cycle'))
+        self.assertEqual(list(self.F_LISTING_FOLDER.walk_iter()), [u'folder/subfolder/cycle', u'folder/subfolder/testimage.jpg', u'folder/subfolder', u'folder', u'testimage.jpg'])
+
+        listing = FileListing(self.DIRECTORY, filter_func=lambda fileobject: fileobject.filetype == 'Image')
+        files = listing.files_walk_iter()
+        self.assertEqual(next(files).path, u'_test/uploads/folder/subfolder/testimage.jpg')
+        self.assertEqual([f.path for f in files], [u'_test/uploads/testimage.jpg'])
+
 
 class FileObjecNamerTests(TestCase):
 
@@ -510,3 +699,64 @@ class FileObjecNamerTests(TestCase):
         self.assertEqual(f_version.is_version, True)
         self.assertEqual(f_version.original_filename, "testimage.jpg")
         self.assertEqual(f_version.original.path, self.F_IMAGE.path)
+
+
+class FileObjectVersionsGenerateTests(TestCase):
+
+    PATCH_VERSIONS = {
+        'thumbnail': {'verbose_name': 'Thumbnail (1 col)', 'width': 60, 'height': 60, 'opts': 'crop'},
+        'small': {'verbose_name': 'Small (2 col)', 'width': 140, 'height': '', 'opts': ''},
+        'large': {'verbose_name': 'Large (8 col)', 'width': 680, 'height': '', 'opts': ''},
+        'huge': {'verbose_name': 'Huge', 'width': 2000, 'height': '', 'opts': 'upscale'},
+    }
+
+    def setUp(self):
+        super(FileObjectVersionsGenerateTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    @patch('filebrowser.base.VERSIONS', PATCH_VERSIONS)
+    def test_versions_generate(self):
+        """
+        FileObject versions_generate
+
+        # decodes the original once
+        # has the same sizes as version_generate
+        # only generates missing/outdated versions
+        """
+        with patch('filebrowser.base.Image.open', wraps=Image.open) as image_open:
+            versions = self.F_IMAGE.versions_generate(sorted(self.PATCH_VERSIONS))
+            self.assertEqual(image_open.call_count, 1)
+
+        original = Image.open(self.F_IMAGE.path_full)
+        for suffix, version in versions.items():
+            self.assertEqual(Image.open(version.path_full).size, scale_and_crop(original, **self.PATCH_VERSIONS[suffix]).size)
+        for suffix, version in versions.items():
+            self.assertEqual(version.path, self.F_IMAGE.version_path(suffix))
+            self.assertEqual(self.F_IMAGE.version_outdated(suffix), False)
+
+        os.remove(versions['small'].path_full)
+        with patch.object(FileObject, '_save_version', side_effect=lambda version, path: path) as save_version:
+            self.F_IMAGE.versions_generate(sorted(self.PATCH_VERSIONS))
+            self.assertEqual([c[0][1] for c in save_version.call_args_list], [versions['small'].path])
+
+    def test_versions_generate_missing(self):
+        versions = self.F_MISSING.versions_generate(['large'])
+        self.assertEqual(versions['large'].path, "")
+
+    @patch('filebrowser.base.VERSION_DRAFT_MODE', True)
+    def test_draft_mode(self):
+        """
+        FileObject versions of JPEGs are generated from a reduced decode
+        """
+        thumbnail = self.PATCH_VERSIONS['thumbnail']
+        self.assertEqual(self.F_IMAGE._draft_size((1000, 750), [thumbnail]), (80, 60))
+        self.assertEqual(self.F_IMAGE._open_image([thumbnail]).size, (125, 94))
+        self.assertEqual(self.F_IMAGE._open_image([thumbnail, self.PATCH_VERSIONS['large']]).size, (1000, 750))
+        self.assertEqual(self.F_IMAGE._open_image([dict(thumbnail, draft=False)]).size, (1000, 750))
+        self.assertEqual(self.F_IMAGE._open_image([self.PATCH_VERSIONS['huge']]).size, (1000, 750))
+        with patch('filebrowser.base.VERSION_DRAFT_MODE', False):
+            self.assertEqual(self.F_IMAGE._open_image([thumbnail]).size, (1000, 750))
+            self.assertEqual(self.F_IMAGE._open_image([dict(thumbnail, draft=True)]).size, (125, 94))
+
+        version = self.F_IMAGE.version_generate('thumbnail', thumbnail)
+        self.assertEqual(Image.open(version.path_full).size, (60, 60))
@@ -0,0 +1,27 @@
+# coding: utf-8
+from django.test import TestCase
+
+from benchmarks.media import MediaTree
+from benchmarks.storage import InMemoryStorage
+from benchmarks.suite import compare, run_suite
+
+
+class BenchmarkTests(TestCase):
+
+    def test_media_tree(self):
+        storage = InMemoryStorage()
+        tree = MediaTree(storage, 'benchmark', 250, images_per_size=1, files_per_folder=100).create()
+        self.assertEqual(len(storage.listdir(tree.flat_path)[1]), 250)
+        self.assertTrue(storage.listdir(tree.nested_path)[0])
+        self.assertEqual(sorted(tree.images), ['large', 'medium', 'small'])
+        self.assertTrue(storage.isfile(tree.images['small'][0]))
+        tree.remove()
+        self.assertFalse(storage.exists(tree.path))
+
+    def test_run_suite(self):
+        results = run_suite(sizes=(20, ), storages=('memory', ), repeat=1, select=['listing', 'walk', 'upload'], images_per_size=1)
+        self.assertEqual([r['benchmark'] for r in results], ['listing', 'listing_sorted_page', 'walk', 'upload'])
+        self.assertEqual(results[0]['ops'], 20)
+        self.assertEqual(compare(results, results, 1.2), [])
+        slower = dict(results[0], median=results[0]['median'] * 2)
+        self.assertEqual(compare([slower], results, 1.2), [(slower, 2.0)])
@@ -0,0 +1,177 @@
+# coding: utf-8
+import os
+import pickle
+import shutil
+
+from django.core.exceptions import ImproperlyConfigured
+from mock import patch
+from PIL import Image
+
+from filebrowser import signals
+from filebrowser.base import FileListing, FileObject, prefetch_versions
+from filebrowser.cache import DjangoMetadataCache, SQLiteMetadataCache
+from filebrowser.sites import site
+from tests.base import FilebrowserTestCase as TestCase
+
+
+class MetadataCacheTestsMixin(object):
+
+    def setUp(self):
+        super(MetadataCacheTestsMixin, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        self.cache = self.get_cache()
+        self._old_cache = site.metadata_cache
+        site.metadata_cache = self.cache
+
+    def tearDown(self):
+        site.metadata_cache = self._old_cache
+        super(MetadataCacheTestsMixin, self).tearDown()
+
+    def test_scandir(self):
+        entries = self.cache.scandir(site.storage, self.F_FOLDER.path)
+        self.assertEqual([e.name for e in entries], [u'subfolder', u'testimage.jpg'])
+
+        # unchanged directory: listing is read from the cache
+        with patch.object(site.storage, 'scandir') as scandir:
+            self.assertEqual(self.cache.scandir(site.storage, self.F_FOLDER.path), entries)
+            self.assertFalse(scandir.called)
+
+        # changed directory: listing is read from the storage
+        os.utime(self.FOLDER_PATH, (0, 0))
+        with patch.object(site.storage, 'scandir', return_value=[]) as scandir:
+            self.assertEqual(self.cache.scandir(site.storage, self.F_FOLDER.path), [])
+            self.assertTrue(scandir.called)
+
+    def test_scandir_without_directory_mtime(self):
+        # e.g. S3, where folders have no modified time
+        with patch.object(site.storage, 'get_modified_time', side_effect=AttributeError):
+            entries = self.cache.scandir(site.storage, self.F_FOLDER.path)
+        self.assertEqual([e.name for e in entries], [u'subfolder', u'testimage.jpg'])
+        self.assertIsNone(self.cache.get(self.cache.make_key('dir', self.F_FOLDER.path)))
+        with patch.object(site.storage, 'get_modified_time', return_value=None):
+            with patch.object(site.storage, 'scandir', return_value=[]) as scandir:
+                self.assertEqual(self.cache.scandir(site.storage, self.F_FOLDER.path), [])
+                self.assertTrue(scandir.called)
+
+    def test_filelisting(self):
+        listing = FileListing(self.F_FOLDER.path, sorting_by='filename_lower', sorting_order='asc', site=site)
+        self.assertEqual([f.filename for f in listing.files_listing_total()], [u'subfolder', u'testimage.jpg'])
+        self.assertEqual(self.cache.get(self.cache.make_key('dir', self.F_FOLDER.path))['entries'], listing.listing_entries())
+
+    def test_dimensions(self):
+        self.assertEqual(self.F_IMAGE.dimensions, (1000, 750))
+        self.assertEqual(self.cache.get_file(self.F_IMAGE.path, self.F_IMAGE.date), {'dimensions': (1000, 750)})
+        with patch('filebrowser.base.Image.open') as image_open:
+            self.assertEqual(FileObject(self.F_IMAGE.path, site=site).dimensions, (1000, 750))
+            self.assertFalse(image_open.called)
+        # stale metadata is ignored
+        self.assertEqual(self.cache.get_file(self.F_IMAGE.path, self.F_IMAGE.date + 1), {})
+
+    def test_invalidate_signals(self):
+        self.cache.scandir(site.storage, self.F_FOLDER.path)
+        self.cache.set_file(self.F_IMAGE.path, self.F_IMAGE.date, dimensions=(1, 1))
+        signals.filebrowser_post_delete.send(sender=None, path=self.F_IMAGE.path, name=self.F_IMAGE.filename, site=site)
+        self.assertEqual(self.cache.get(self.cache.make_key('dir', self.F_FOLDER.path)), None)
+        self.assertEqual(self.cache.get_file(self.F_IMAGE.path, self.F_IMAGE.date), {})
+
+        self.cache.scandir(site.storage, self.F_FOLDER.path)
+        signals.filebrowser_post_upload.send(sender=None, path='folder', file=self.F_IMAGE, site=site)
+        self.assertEqual(self.cache.get(self.cache.make_key('dir', self.F_FOLDER.path)), None)
+
+    @patch('filebrowser.base.VERSIONS_MANIFEST', True)
+    def test_versions_manifest(self):
+        version = self.F_IMAGE.version_generate('large')
+        record = self.cache.get_version(self.F_IMAGE.path, version.path)
+        self.assertEqual(record['original'], self.F_IMAGE.path)
+        self.assertEqual(record['version_path'], version.path)
+        self.assertEqual(record['version_suffix'], 'large')
+        self.assertEqual(record['original_date'], self.F_IMAGE.date)
+        self.assertEqual(record['dimensions'], Image.open(version.path_full).size)
+
+        # recorded versions are not checked with the storage
+        with patch.object(site.storage, 'isfile') as isfile, patch.object(site.storage, 'exists') as exists:
+            self.assertEqual(FileObject(self.F_IMAGE.path, site=site).version_generate('large').path, version.path)
+            self.assertFalse(isfile.called)
+            self.assertFalse(exists.called)
+
+        # other options or a changed original (if known) require a check
+        with patch.object(site.storage, 'isfile', return_value=False) as isfile:
+            self.assertTrue(FileObject(self.F_IMAGE.path, site=site).version_outdated('large', {'quality': 20}))
+        fileobject = FileObject(self.F_IMAGE.path, site=site)
+        fileobject.date = record['original_date'] + 1
+        with patch.object(site.storage, 'isfile', return_value=False) as isfile:
+            self.assertTrue(fileobject.version_outdated('large'))
+
+        # existing versions are recorded when checked with the storage
+        self.cache.delete_versions(self.F_IMAGE.path)
+        self.assertFalse(self.F_IMAGE.version_outdated('large'))
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, version.path)['version_suffix'], 'large')
+
+        # a listing of the version directory confirms recorded versions (e.g. removed outside of the FileBrowser)
+        os.remove(version.path_full)
+        self.assertFalse(FileObject(self.F_IMAGE.path, site=site).version_outdated('large'))
+        fileobject = FileObject(self.F_IMAGE.path, site=site)
+        prefetch_versions([fileobject])
+        self.assertTrue(fileobject.version_outdated('large'))
+        self.assertEqual(fileobject.version_generate('large').path, version.path)
+        self.assertTrue(os.path.exists(version.path_full))
+
+        self.F_IMAGE.delete_versions()
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, version.path), None)
+        self.assertTrue(self.F_IMAGE.version_outdated('large'))
+
+        # versions are removed from the manifest by their path
+        version = self.F_IMAGE.version_generate('large')
+        self.cache.delete_version(version.path)
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, version.path), None)
+
+    @patch('filebrowser.base.VERSIONS_MANIFEST', True)
+    def test_versions_manifest_signals(self):
+        versions = self.F_IMAGE.versions_generate(['small', 'admin_thumbnail'])
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, versions['small'].path)['version_suffix'], 'small')
+
+        self.F_IMAGE.delete_admin_versions()
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, versions['small'].path), None)
+        self.assertNotEqual(self.cache.get_version(self.F_IMAGE.path, versions['admin_thumbnail'].path), None)
+
+        signals.filebrowser_post_delete.send(sender=None, path=self.F_IMAGE.path, name=self.F_IMAGE.filename, site=site)
+        self.assertEqual(self.cache.get_version(self.F_IMAGE.path, versions['admin_thumbnail'].path), None)
+
+    def test_content(self):
+        self.assertEqual(self.cache.get_content('abc'), None)
+        self.cache.set_content('abc', self.F_IMAGE.path, 1)
+        self.assertEqual(self.cache.get_content('abc'), {'path': self.F_IMAGE.path, 'mtime': 1})
+        self.cache.delete_content('abc')
+        self.assertEqual(self.cache.get_content('abc'), None)
+
+
+class DjangoMetadataCacheTests(MetadataCacheTestsMixin, TestCase):
+
+    def get_cache(self):
+        cache = DjangoMetadataCache(key_prefix='test')
+        cache.cache.clear()
+        return cache
+
+
+class SQLiteMetadataCacheTests(MetadataCacheTestsMixin, TestCase):
+
+    def get_cache(self):
+        return SQLiteMetadataCache(key_prefix='test', location=os.path.join(self.TEST_PATH, 'metadata.sqlite3'))
+
+    def test_location_required(self):
+        self.assertRaises(ImproperlyConfigured, SQLiteMetadataCache)
+
+    def test_database_errors(self):
+        # e.g. an unwritable (or locked) database: the listing is read from the storage
+        cache = SQLiteMetadataCache(location=os.path.join(self.TEST_PATH, 'missing', 'metadata.sqlite3'))
+        with patch('filebrowser.cache.logger') as logger:
+            entries = cache.scandir(site.storage, self.F_FOLDER.path)
+            self.assertEqual([e.name for e in entries], [u'subfolder', u'testimage.jpg'])
+            self.assertEqual(cache.get_file(self.F_IMAGE.path, self.F_IMAGE.date), {})
+            cache.invalidate(self.F_IMAGE.path)
+            self.assertTrue(logger.warning.called)
+
+    def test_pickle(self):
+        self.cache.set('key', 'value')
+        cache = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(cache.get('key'), 'value')
@@ -6,9 +6,14 @@ import shutil
 
 from django.conf import settings
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.utils.six import StringIO
+from mock import patch
 
-from filebrowser.settings import DIRECTORY
+from filebrowser.base import FileObject
+from filebrowser.cache import DjangoMetadataCache
+from filebrowser.settings import DIRECTORY, VERSIONS
+from filebrowser.sites import site
 from tests.base import FilebrowserTestCase as TestCase
 
 
@@ -33,3 +38,83 @@ class VersionGenerateCommandTests(TestCase):
         call_command('fb_version_generate', DIRECTORY)
 
         self.assertTrue(os.path.exists(self.version_file))
+
+    def test_fb_version_generate_noinput(self):
+        call_command('fb_version_generate', DIRECTORY, interactive=False, stdout=StringIO())
+
+        for version_suffix in VERSIONS:
+            self.assertTrue(self.F_IMAGE.version_path(version_suffix) in self.F_IMAGE.versions())
+            self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, self.F_IMAGE.version_path(version_suffix))))
+
+    def test_fb_version_generate_versions(self):
+        call_command('fb_version_generate', DIRECTORY, versions=['large', 'small'], stdout=StringIO())
+
+        self.assertTrue(os.path.exists(self.version_file))
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, self.F_IMAGE.version_path('small'))))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, self.F_IMAGE.version_path('medium'))))
+
+        with self.assertRaises(CommandError):
+            call_command('fb_version_generate', DIRECTORY, versions=['missing'], stdout=StringIO())
+
+    def test_fb_version_generate_workers(self):
+        shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
+        stdout = StringIO()
+
+        call_command('fb_version_generate', DIRECTORY, versions=['large'], workers=2, stdout=stdout)
+
+        self.assertTrue(os.path.exists(self.version_file))
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, "_test/_versions/folder/subfolder/testimage_large.jpg")))
+        self.assertIn('2/2 images (100%)', stdout.getvalue())
+
+    def test_fb_version_generate_checkpoint(self):
+        shutil.copy(self.STATIC_IMG_PATH, self.SUBFOLDER_PATH)
+        checkpoint = os.path.join(self.TEST_PATH, 'checkpoint')
+        with open(checkpoint, 'w') as f:
+            f.write('versions: large\n%s\n' % self.F_IMAGE.path)
+
+        # images listed with the checkpoint are skipped
+        call_command('fb_version_generate', DIRECTORY, versions=['large'], checkpoint=checkpoint, stdout=StringIO())
+
+        self.assertFalse(os.path.exists(self.version_file))
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, "_test/_versions/folder/subfolder/testimage_large.jpg")))
+        # a complete run removes the checkpoint
+        self.assertFalse(os.path.exists(checkpoint))
+
+        # a checkpoint with other versions is not used
+        with open(checkpoint, 'w') as f:
+            f.write('versions: small\n%s\n' % self.F_IMAGE.path)
+        call_command('fb_version_generate', DIRECTORY, versions=['large'], checkpoint=checkpoint, stdout=StringIO(), stderr=StringIO())
+
+        self.assertTrue(os.path.exists(self.version_file))
+
+
+@patch('filebrowser.base.VERSIONS_MANIFEST', True)
+@patch('filebrowser.management.commands.fb_version_remove.VERSIONS_MANIFEST', True)
+class VersionRemoveCommandTests(TestCase):
+
+    def setUp(self):
+        super(VersionRemoveCommandTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        self._old_cache = site.metadata_cache
+        site.metadata_cache = DjangoMetadataCache(key_prefix='test')
+        site.metadata_cache.cache.clear()
+
+    def tearDown(self):
+        site.metadata_cache = self._old_cache
+        super(VersionRemoveCommandTests, self).tearDown()
+
+    def test_fb_version_remove(self):
+        version = self.F_IMAGE.version_generate('large')
+        self.assertTrue(site.storage.isfile(version.path))
+
+        # suffix, version name, confirmation
+        with patch('filebrowser.management.commands.fb_version_remove.input', side_effect=['s', 'large', 'y']):
+            call_command('fb_version_remove', '_test', stdout=StringIO())
+        self.assertFalse(site.storage.isfile(version.path))
+        self.assertEqual(site.metadata_cache.get_version(self.F_IMAGE.path, version.path), None)
+
+        # the removed version is generated again
+        fileobject = FileObject(self.F_IMAGE.path, site=site)
+        self.assertTrue(fileobject.version_outdated('large'))
+        self.assertEqual(fileobject.version_generate('large').path, version.path)
+        self.assertTrue(site.storage.isfile(version.path))
@@ -2,10 +2,18 @@
 
 from tests import FilebrowserTestCase as TestCase
 
+from django import forms
 from django.utils.six import string_types
 
 from filebrowser.base import FileObject
-from filebrowser.fields import FileBrowseField
+import os
+import shutil
+
+from mock import patch
+
+from filebrowser.fields import FileBrowseField, FileBrowseFormField, prefetch_fileobjects
+from filebrowser.sites import site
+from tests.models import BlogEntry
 
 
 class FileBrowseFieldTests(TestCase):
@@ -33,3 +41,68 @@ class FileBrowseFieldTests(TestCase):
             self.assertIsInstance(actual, string_types)
             self.assertEqual(actual, self.path_to_file)
         self.assertEqual(field.to_python(None), None)
+
+
+class FileBrowseFormFieldTests(TestCase):
+
+    def test_clean_extensions(self):
+        field = FileBrowseFormField(extensions=['.jpg', '.PNG'])
+        self.assertEqual(field.clean('/path/to/file.JPG'), '/path/to/file.JPG')
+        self.assertEqual(field.clean('/path/to/file.png'), '/path/to/file.png')
+        self.assertRaises(forms.ValidationError, field.clean, '/path/to/file.pdf')
+
+    def test_clean_format(self):
+        # a format restricts the selectable files with the FileBrowser, but not the extensions of the field
+        field = FileBrowseFormField(format='image')
+        self.assertEqual(field.clean('/path/to/file.jpg'), '/path/to/file.jpg')
+        self.assertEqual(field.clean('/path/to/file.pdf'), '/path/to/file.pdf')
+        field = FileBrowseFormField(format='image', extensions=['.jpg'])
+        self.assertRaises(forms.ValidationError, field.clean, '/path/to/file.pdf')
+        # a format given as a filetype (s. EXTENSIONS) restricts the extensions
+        field = FileBrowseFormField(format='Document')
+        self.assertEqual(field.clean('/path/to/file.pdf'), '/path/to/file.pdf')
+        self.assertRaises(forms.ValidationError, field.clean, '/path/to/file.jpg')
+
+
+class PrefetchFileObjectsTests(TestCase):
+
+    def setUp(self):
+        super(PrefetchFileObjectsTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, 'other.jpg'))
+        self.F_IMAGE.version_generate('thumbnail')
+        BlogEntry.objects.create(image=self.F_IMAGE.path, document=os.path.join(self.F_FOLDER.path, 'missing.pdf'))
+        BlogEntry.objects.create(image=os.path.join(self.F_FOLDER.path, 'other.jpg'))
+
+    def test_prefetch_fileobjects(self):
+        entries = prefetch_fileobjects(list(BlogEntry.objects.all()), versions=True)
+        with patch.object(site.storage, 'size') as size, patch.object(site.storage, 'exists') as exists, \
+                patch.object(site.storage, 'isfile') as isfile, patch.object(site.storage, 'isdir') as isdir:
+            self.assertEqual([(e.image.exists, e.image.filesize) for e in entries], [(True, 870037), (True, 870037)])
+            self.assertEqual(entries[0].document.exists, False)
+            self.assertEqual(entries[1].document, '')
+            self.assertEqual(entries[0].image.version_outdated('thumbnail'), False)
+            self.assertEqual(entries[1].image.version_outdated('thumbnail'), True)
+            self.assertFalse(size.called or exists.called or isfile.called or isdir.called)
+
+        entries = prefetch_fileobjects(list(BlogEntry.objects.all()), field_names=['document'])
+        self.assertFalse(entries[0].image.is_cached('exists'))
+        self.assertTrue(entries[0].document.is_cached('exists'))
+
+    def test_queryset(self):
+        with patch('filebrowser.fields.prefetch_fileobjects') as prefetch:
+            entries = list(BlogEntry.objects.all())
+            self.assertFalse(prefetch.called)
+
+        with patch.object(site.storage, 'scandir', wraps=site.storage.scandir) as scandir:
+            entries = list(BlogEntry.objects.prefetch_fileobjects('image').order_by('pk'))
+            self.assertEqual(scandir.call_count, 1)
+        self.assertEqual([e.image.filename for e in entries], ['testimage.jpg', 'other.jpg'])
+        self.assertTrue(entries[1].image.is_cached('filesize'))
+
+        # generating a version invalidates the prefetched versions
+        entries = BlogEntry.objects.prefetch_fileobjects(versions=True)
+        entry = entries[0] if entries[0].image.filename == 'other.jpg' else entries[1]
+        self.assertEqual(entry.image.version_outdated('thumbnail'), True)
+        entry.image.version_generate('thumbnail')
+        self.assertEqual(entry.image.version_outdated('thumbnail'), False)
@@ -0,0 +1,98 @@
+# coding: utf-8
+import pickle
+import shutil
+
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse
+from django.template import engines
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory
+from mock import patch
+
+from filebrowser.base import FileObject
+from filebrowser.instrumentation import LocalMetricsSink, StatsdMetricsSink, instrument_storage, instrumented_view
+from filebrowser.sites import FileBrowserSite, site
+from tests.base import FilebrowserTestCase as TestCase
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        super(InstrumentationTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        self.site = FileBrowserSite(name='instrumented', storage=site.storage)
+        self.site.storage = instrument_storage(site.storage)
+        self.site.metrics_sink = LocalMetricsSink()
+        self.request = RequestFactory().get('/')
+
+    def test_instrument_storage(self):
+        storage = self.site.storage
+        self.assertTrue(isinstance(storage, FileSystemStorage))
+        self.assertEqual(storage.location, site.storage.location)
+        self.assertIs(instrument_storage(storage), storage)
+        # no request is recorded, the storage works as usual
+        self.assertTrue(storage.isdir(self.F_FOLDER.path))
+
+    def test_pickle(self):
+        # e.g. FileObjects of models cached with a pickling cache backend
+        storage = pickle.loads(pickle.dumps(self.site.storage, pickle.HIGHEST_PROTOCOL))
+        self.assertIs(type(storage), type(self.site.storage))
+        self.assertEqual(storage.location, site.storage.location)
+        fileobject = pickle.loads(pickle.dumps(FileObject(self.F_IMAGE.path, site=self.site)))
+        self.assertIs(type(fileobject.site.storage), type(self.site.storage))
+        self.assertTrue(fileobject.exists)
+        self.assertEqual(fileobject.site.metrics_sink.calls, self.site.metrics_sink.calls)
+        pickle.loads(pickle.dumps(StatsdMetricsSink())).record('browse', 'listdir', 1, 0.1)
+
+    def test_view(self):
+        def view(request):
+            fileobject = FileObject(self.F_IMAGE.path, site=self.site)
+            fileobject.exists, fileobject.filesize
+            self.site.storage.isdir(self.F_FOLDER.path)
+            self.site.storage.isdir(self.F_SUBFOLDER.path)
+            # nested calls (exists) are part of get_available_name
+            self.site.storage.get_available_name(self.F_IMAGE.path)
+            return HttpResponse()
+
+        with patch('filebrowser.instrumentation.logger') as logger:
+            response = instrumented_view(view, self.site, 'browse')(self.request)
+            self.assertTrue(str(logger.debug.call_args[0][1]).startswith('browse: 5 storage calls'))
+
+        self.assertEqual(response['X-FileBrowser-Storage-Calls'], '5')
+        self.assertIn('fb-isdir;desc="isdir (2)";dur=', response['Server-Timing'])
+        self.assertEqual(dict(self.site.metrics_sink.calls), {
+            ('browse', 'exists'): 1, ('browse', 'size'): 1, ('browse', 'isdir'): 2, ('browse', 'get_available_name'): 1})
+
+        # calls outside of instrumented views are not recorded
+        self.site.storage.isdir(self.F_FOLDER.path)
+        self.assertEqual(self.site.metrics_sink.calls[('browse', 'isdir')], 2)
+
+    def test_template_response(self):
+        def view(request):
+            template = engines['django'].from_string('{{ fileobject.filesize }}')
+            return SimpleTemplateResponse(template, {'fileobject': FileObject(self.F_IMAGE.path, site=self.site)})
+
+        response = instrumented_view(view, self.site, 'detail')(self.request)
+        self.assertNotIn('X-FileBrowser-Storage-Calls', response)
+        response.render()
+        # calls made while rendering the template are included
+        self.assertEqual(response['X-FileBrowser-Storage-Calls'], str(sum(self.site.metrics_sink.calls.values())))
+        self.assertEqual(self.site.metrics_sink.calls[('detail', 'size')], 1)
+
+    @patch('filebrowser.sites.STORAGE_INSTRUMENTATION', True)
+    def test_site(self):
+        instrumented_site = FileBrowserSite(name='instrumented_site', storage=site.storage)
+        self.assertTrue(instrumented_site.storage._filebrowser_instrumented)
+        view = instrumented_site.instrument_view(lambda request: HttpResponse(), 'browse')
+        self.assertEqual(view(self.request)['X-FileBrowser-Storage-Calls'], '0')
+
+    def test_disabled(self):
+        # views and storage are left as they are
+        self.assertFalse(hasattr(site.storage, '_filebrowser_instrumented'))
+        self.assertNotIn('X-FileBrowser-Storage-Calls', site.instrument_view(lambda request: HttpResponse(), 'browse')(self.request))
+
+    def test_statsd(self):
+        sink = StatsdMetricsSink(prefix='fb')
+        with patch.object(sink, '_socket') as sock:
+            sink.record('_upload_file', 'save_upload', 1, 0.25)
+        sock.sendto.assert_called_once_with(b'fb.upload_file.save_upload.calls:1|c\nfb.upload_file.save_upload.time:250.000|ms', ('localhost', 8125))
@@ -0,0 +1,148 @@
+# coding: utf-8
+import os
+import pickle
+import shutil
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.six import StringIO
+from mock import patch
+
+from filebrowser import signals
+from filebrowser.base import FileObject
+from filebrowser.search import SQLiteSearchIndex, _regex_literal, _regexp, get_search_index
+from filebrowser.settings import UPLOAD_TEMPDIR
+from filebrowser.sites import site
+from tests.base import FilebrowserTestCase as TestCase, superuser_request
+
+
+class SQLiteSearchIndexTests(TestCase):
+
+    def setUp(self):
+        super(SQLiteSearchIndexTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.SUBFOLDER_PATH, 'Other_Image.PNG'))
+        self.index = SQLiteSearchIndex(location=os.path.join(self.TEST_PATH, 'search.sqlite3'))
+        self._old_index = site.search_index
+        site.search_index = self.index
+        self.folder = self.F_FOLDER.path
+        self.image = self.F_IMAGE.path
+        self.other_image = os.path.join(self.F_SUBFOLDER.path, 'Other_Image.PNG')
+
+    def tearDown(self):
+        site.search_index = self._old_index
+        super(SQLiteSearchIndexTests, self).tearDown()
+
+    def test_rebuild(self):
+        self.assertEqual(self.index.rebuild(site.storage, self.DIRECTORY), 4)
+        self.assertEqual(self.index.count(self.DIRECTORY), 4)
+        self.assertEqual(self.index.count(self.F_SUBFOLDER.path), 1)
+        self.assertEqual(self.index.search(self.DIRECTORY), sorted([self.folder, self.F_SUBFOLDER.path, self.image, self.other_image]))
+
+        # rebuilding a directory replaces its items only
+        os.remove(os.path.join(self.SUBFOLDER_PATH, 'Other_Image.PNG'))
+        self.assertEqual(self.index.rebuild(site.storage, self.F_SUBFOLDER.path), 0)
+        self.assertEqual(self.index.search(self.DIRECTORY), sorted([self.folder, self.F_SUBFOLDER.path, self.image]))
+
+    def test_search(self):
+        self.index.rebuild(site.storage, self.DIRECTORY)
+
+        self.assertEqual(self.index.search(self.DIRECTORY, substring='IMAGE'), [self.other_image, self.image])
+        self.assertEqual(self.index.search(self.DIRECTORY, substring='%'), [])
+        self.assertEqual(self.index.search(self.DIRECTORY, prefix='other'), [self.other_image])
+        self.assertEqual(self.index.search(self.DIRECTORY, extension='.png'), [self.other_image])
+        self.assertEqual(self.index.search(self.DIRECTORY, regex='^sub'), [self.F_SUBFOLDER.path])
+        self.assertEqual(self.index.search(self.F_SUBFOLDER.path, substring='image'), [self.other_image])
+        # the directory itself is not part of the results
+        self.assertEqual(self.index.search(self.folder, substring='folder'), [self.F_SUBFOLDER.path])
+
+    def test_signals(self):
+        signals.filebrowser_post_createdir.send(sender=None, path=self.folder, name='folder', site=site)
+        signals.filebrowser_post_upload.send(sender=None, path=self.folder, file=self.F_IMAGE, site=site)
+        # temporary uploads are not indexed
+        signals.filebrowser_post_upload.send(sender=None, path=UPLOAD_TEMPDIR, file=FileObject(
+            os.path.join(UPLOAD_TEMPDIR, 'testimage.jpg'), site=site), site=site)
+        self.index.add(self.other_image)
+        self.assertEqual(self.index.search(self.DIRECTORY), sorted([self.folder, self.image, self.other_image]))
+
+        signals.filebrowser_post_rename.send(sender=None, path=self.folder, name='folder', new_name='renamed', site=site)
+        renamed = os.path.join(self.DIRECTORY, 'renamed')
+        self.assertEqual(self.index.search(self.DIRECTORY), [
+            renamed, os.path.join(renamed, 'subfolder', 'Other_Image.PNG'), os.path.join(renamed, 'testimage.jpg')])
+
+        signals.filebrowser_post_delete.send(sender=None, path=renamed, name='renamed', site=site)
+        self.assertEqual(self.index.search(self.DIRECTORY), [])
+
+    def test_pickle(self):
+        self.index.rebuild(site.storage, self.DIRECTORY)
+        index = pickle.loads(pickle.dumps(self.index))
+        self.assertEqual(index.count(self.DIRECTORY), 4)
+
+    def test_browse(self):
+        # hidden/excluded files are neither listed nor counted
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, '.hidden_image.jpg'))
+        self.index.rebuild(site.storage, self.DIRECTORY)
+        self.assertEqual(self.index.count(self.DIRECTORY), 5)
+        request = superuser_request('get', '/', {'q': 'image', 'o': 'filename_lower', 'ot': 'asc'})
+        with patch('filebrowser.sites.SEARCH_TRAVERSE', True), \
+                patch.object(site.storage, 'listdir') as listdir, \
+                patch('filebrowser.sites.TemplateResponse') as template_response:
+            site.browse(request)
+            self.assertFalse(listdir.called)
+        context = template_response.call_args[0][2]
+        self.assertEqual([f.path for f in context['page'].object_list], [self.other_image, self.image])
+        self.assertEqual(context['filelisting'].results_total, 4)
+
+        # the same total as walking the directories
+        with patch('filebrowser.sites.SEARCH_TRAVERSE', True), \
+                patch.object(site, 'search_index', None), \
+                patch('filebrowser.sites.TemplateResponse') as template_response:
+            site.browse(request)
+        self.assertEqual(template_response.call_args[0][2]['filelisting'].results_total, 4)
+
+    def test_browse_sorting(self):
+        for name in ['mid', 'alpha', 'zeta', 'beta']:
+            with open(os.path.join(self.FOLDER_PATH, '%s.txt' % name), 'w') as f:
+                f.write(name)
+        self.index.rebuild(site.storage, self.DIRECTORY)
+
+        def browse(search_index):
+            request = superuser_request('get', '/', {'q': 'txt', 'o': 'filename_lower', 'ot': 'desc'})
+            with patch('filebrowser.sites.SEARCH_TRAVERSE', True), \
+                    patch.object(site, 'search_index', search_index), \
+                    patch('filebrowser.sites.TemplateResponse') as template_response:
+                site.browse(request)
+            return [f.filename for f in template_response.call_args[0][2]['page'].object_list]
+
+        # the index and walking the directories return the same results in the same order
+        self.assertEqual(browse(self.index), ['zeta.txt', 'mid.txt', 'beta.txt', 'alpha.txt'])
+        self.assertEqual(browse(None), ['zeta.txt', 'mid.txt', 'beta.txt', 'alpha.txt'])
+
+    def test_regex_prefilter(self):
+        self.index.rebuild(site.storage, self.DIRECTORY)
+        self.assertEqual(_regex_literal('^other_\\w+'), ('other_', True))
+        self.assertEqual(_regex_literal('images?'), ('image', False))
+        self.assertEqual(_regex_literal('image|sub'), ('', False))
+        with patch('filebrowser.search._regexp', return_value=True) as regexp:
+            self.index.connection.create_function('REGEXP', 2, regexp)
+            self.assertEqual(self.index.search(self.DIRECTORY, regex='^other'), [self.other_image])
+            # only names starting with the literal prefix are matched with the regular expression
+            self.assertEqual(regexp.call_count, 1)
+
+        self.index.connection.create_function('REGEXP', 2, _regexp)
+        self.assertEqual(self.index.search(self.DIRECTORY, regex='images?\\.'), [self.other_image, self.image])
+        self.assertEqual(self.index.search(self.DIRECTORY, regex='^sub|image'), [self.F_SUBFOLDER.path, self.other_image, self.image])
+
+    def test_location_required(self):
+        self.assertRaises(ImproperlyConfigured, SQLiteSearchIndex)
+        with patch('filebrowser.search.SEARCH_INDEX', 'filebrowser.search.SQLiteSearchIndex'), \
+                patch('filebrowser.search.SEARCH_INDEX_OPTIONS', {'location': '/tmp/search_{site}.sqlite3'}):
+            self.assertEqual(get_search_index(site).location, '/tmp/search_filebrowser.sqlite3')
+
+    def test_command(self):
+        call_command('fb_search_index', stdout=StringIO())
+        self.assertEqual(self.index.count(self.DIRECTORY), 4)
+
+        with self.assertRaises(CommandError):
+            call_command('fb_search_index', 'missing', stdout=StringIO())
@@ -3,21 +3,36 @@ from __future__ import with_statement
 import os
 import json
 import shutil
+import time
+import unittest
 
 try:
-    from django.urls import reverse
+    from django.urls import resolve, reverse
 except ImportError:
-    from django.core.urlresolvers import reverse
+    from django.core.urlresolvers import resolve, reverse
 try:
     from django.utils.six.moves.urllib.parse import urlencode
 except ImportError:
     from django.utils.http import urlencode
-from mock import patch
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.response import TemplateResponse
+from django.test import TestCase as DjangoTestCase
+from mock import Mock, patch
 
-from filebrowser.settings import VERSIONS, DEFAULT_PERMISSIONS
+try:
+    import boto
+    from moto import mock_s3_deprecated
+except ImportError:
+    boto = None
+
+from filebrowser.settings import ADMIN_THUMBNAIL, ADMIN_VERSIONS, VERSIONS, DEFAULT_PERMISSIONS
 from filebrowser.base import FileObject
-from filebrowser.sites import site
-from tests.base import FilebrowserTestCase as TestCase
+from filebrowser.cache import SQLiteMetadataCache
+from filebrowser.sites import FileBrowserSite, handle_file_upload, site
+from tests.base import FilebrowserTestCase as TestCase, superuser_request
+from tests.test_storage import S3BotoStorage
 
 
 class BrowseViewTests(TestCase):
@@ -53,6 +68,22 @@ class BrowseViewTests(TestCase):
         self.assertContains(response, '<input type="hidden" name="CKEditor" value="id_body" />')
         self.assertContains(response, '<input type="hidden" name="CKEditorFuncNum" value="1" />')
 
+    def test_sorted_page(self):
+        """
+        Files are filtered before sorting, only the current page is sorted completely.
+        """
+        for i in range(120):
+            with open(os.path.join(self.FOLDER_PATH, 'file%03d.txt' % (i * 37 % 120)), 'w') as f:
+                f.write('x' * i)
+        request = superuser_request('get', self.url, {'dir': 'folder', 'o': 'filesize', 'ot': 'desc', 'filter_type': 'Document', 'p': '2'})
+
+        with patch('filebrowser.sites.LIST_PER_PAGE', 10), patch('filebrowser.sites.TemplateResponse') as template_response:
+            site.browse(request)
+        context = template_response.call_args[0][2]
+        self.assertEqual(context['page'].paginator.count, 120)
+        self.assertEqual([f.filesize for f in context['page'].object_list], list(range(109, 99, -1)))
+        self.assertFalse(context['page'].paginator.object_list._complete)
+
 
 class CreateDirViewTests(TestCase):
     def setUp(self):
@@ -210,6 +241,153 @@ class UploadFileViewTests(TestCase):
             self.assertEqual(site.storage.listdir(self.F_SUBFOLDER), ([], [u'test_image_000.jpg']))
 
 
+class HandleFileUploadTests(TestCase):
+    def test_storage_without_save_upload(self):
+        storage = Mock(spec=['exists', 'delete', 'save', 'open'], wraps=FileSystemStorage(location=site.storage.location))
+        upload_site = Mock(storage=storage)
+        name = handle_file_upload(self.F_SUBFOLDER.path, SimpleUploadedFile('file.txt', b'first'), upload_site)
+        self.assertEqual(name, os.path.join(self.F_SUBFOLDER.path, 'file.txt'))
+        name = handle_file_upload(self.F_SUBFOLDER.path, SimpleUploadedFile('file.txt', b'second'), upload_site, allow_overwrite=True)
+        self.assertEqual(name, os.path.join(self.F_SUBFOLDER.path, 'file.txt'))
+        self.assertTrue(storage.delete.called)
+        with open(os.path.join(site.storage.location, name), 'rb') as f:
+            self.assertEqual(f.read(), b'second')
+
+
+@patch('filebrowser.sites.UPLOAD_TEMPDIR', '_test/tempfolder')
+class UploadChunkViewTests(TestCase):
+    def setUp(self):
+        super(UploadChunkViewTests, self).setUp()
+        self.url = reverse('filebrowser:fb_do_upload_chunk')
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            self.content = f.read()
+
+    def request(self, method='post', chunk=None, user_pk=1, **params):
+        params.setdefault('folder', self.F_SUBFOLDER.path_relative_directory)
+        params.setdefault('upload_id', 'testimage-jpg')
+        params.setdefault('qqfile', 'testimage.jpg')
+        url = '?'.join([self.url, urlencode(params)])
+        data = {'file': SimpleUploadedFile('blob', chunk)} if method == 'post' else None
+        request = superuser_request(method, url, data, user_pk=user_pk)
+        response = site._upload_chunk(request)
+        return response.status_code, json.loads(response.content.decode('utf-8')) if response.status_code in (200, 409) else None
+
+    def test_chunks(self):
+        uploaded_path = os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')
+        total = len(self.content)
+        chunks = [0, 300000, 600000]
+
+        with patch('filebrowser.signals.filebrowser_pre_upload.send') as pre_upload, \
+                patch('filebrowser.signals.filebrowser_post_upload.send') as post_upload:
+            self.assertEqual(self.request('get'), (200, {'offset': 0}))
+            self.assertEqual(self.request(chunk=self.content[:300000], offset=0, total=total), (200, {'success': True, 'offset': 300000}))
+
+            # resume after a disconnect
+            self.assertEqual(self.request('get'), (200, {'offset': 300000}))
+            # a chunk with the wrong offset is refused, the client continues with the offset of the server
+            self.assertEqual(self.request(chunk=self.content[:300000], offset=0, total=total), (409, {'success': False, 'offset': 300000}))
+            self.assertEqual(self.request(chunk=self.content[300000:600000], offset=300000, total=total), (200, {'success': True, 'offset': 600000}))
+            self.assertFalse(pre_upload.called or post_upload.called)
+            self.assertFalse(site.storage.exists(uploaded_path))
+
+            status, data = self.request(chunk=self.content[600000:], offset=600000, total=total)
+            self.assertEqual(pre_upload.call_count, 1)
+            self.assertEqual(post_upload.call_count, 1)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['filename'], 'testimage.jpg')
+        with site.storage.open(uploaded_path) as f:
+            self.assertEqual(f.read(), self.content)
+        # the partial file has been moved
+        self.assertEqual(os.listdir(site._chunk_directory()), [])
+        self.assertEqual(self.request('get'), (200, {'offset': 0}))
+
+    def test_scope(self):
+        total = len(self.content)
+        self.assertEqual(self.request(chunk=self.content[:300000], offset=0, total=total), (200, {'success': True, 'offset': 300000}))
+        # the same upload_id of another user or with another folder is another upload
+        self.assertEqual(self.request('get', user_pk=2), (200, {'offset': 0}))
+        self.assertEqual(self.request('get', folder=self.F_FOLDER.path_relative_directory), (200, {'offset': 0}))
+        self.assertEqual(self.request(chunk=self.content[:300000], offset=300000, total=total, user_pk=2), (409, {'success': False, 'offset': 0}))
+        self.assertEqual(self.request('get'), (200, {'offset': 300000}))
+
+    def test_remove_stale_chunks(self):
+        total = len(self.content)
+        self.request(chunk=self.content[:300000], offset=0, total=total)
+        stale_path = os.path.join(site._chunk_directory(), os.listdir(site._chunk_directory())[0])
+        os.utime(stale_path, (0, 0))
+        # starting another upload removes partial files older than UPLOAD_CHUNK_MAX_AGE
+        self.request(chunk=self.content[:300000], offset=0, total=total, upload_id='other-jpg')
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertEqual(self.request('get'), (200, {'offset': 0}))
+        self.assertEqual(self.request('get', upload_id='other-jpg'), (200, {'offset': 300000}))
+
+    def test_invalid(self):
+        self.assertEqual(self.request('get', upload_id='../x')[0], 400)
+        self.assertEqual(self.request(chunk=b'x', offset=0)[0], 400)
+        self.assertEqual(self.request(chunk=b'xx', offset=0, total=1)[0], 400)
+        with patch('filebrowser.sites.MAX_UPLOAD_SIZE', 10):
+            self.assertEqual(self.request(chunk=b'x', offset=0, total=11)[0], 400)
+
+
+class UploadDeduplicateTests(TestCase):
+    def setUp(self):
+        super(UploadDeduplicateTests, self).setUp()
+        self.url = reverse('filebrowser:fb_do_upload')
+        self._old_cache = site.metadata_cache
+        site.metadata_cache = SQLiteMetadataCache(location=os.path.join(self.TEST_PATH, 'metadata.sqlite3'))
+        with open(self.STATIC_IMG_PATH, "rb") as f:
+            self.content = f.read()
+
+    def tearDown(self):
+        site.metadata_cache = self._old_cache
+        super(UploadDeduplicateTests, self).tearDown()
+
+    def upload(self, name, content, folder=None):
+        url = '?'.join([self.url, urlencode({'folder': folder or self.F_SUBFOLDER.path_relative_directory})])
+        request = superuser_request('post', url, {'file': SimpleUploadedFile(name, content)})
+        return json.loads(site._upload_file(request).content.decode('utf-8'))
+
+    @patch('filebrowser.sites.UPLOAD_DEDUPLICATE', 'report')
+    def test_report(self):
+        data = self.upload('testimage.jpg', self.content)
+        self.assertNotIn('duplicate_of', data)
+
+        data = self.upload('copy.jpg', self.content, folder=self.F_FOLDER.path_relative_directory)
+        self.assertEqual(data['filename'], 'copy.jpg')
+        self.assertEqual(data['duplicate_of'], os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg'))
+        self.assertEqual(site.storage.listdir(self.F_FOLDER), ([u'subfolder'], [u'copy.jpg']))
+
+        data = self.upload('other.jpg', self.content[:1000])
+        self.assertNotIn('duplicate_of', data)
+
+    @patch('filebrowser.sites.UPLOAD_DEDUPLICATE', 'existing')
+    def test_existing(self):
+        original_path = os.path.join(self.F_SUBFOLDER.path, 'testimage.jpg')
+        self.upload('testimage.jpg', self.content)
+
+        with patch('filebrowser.signals.filebrowser_pre_upload.send') as pre_upload:
+            data = self.upload('copy.jpg', self.content, folder=self.F_FOLDER.path_relative_directory)
+            self.assertFalse(pre_upload.called)
+        self.assertEqual(data['filename'], 'testimage.jpg')
+        self.assertEqual(data['url'], site.storage.url(original_path))
+        self.assertEqual(data['duplicate_of'], original_path)
+        self.assertEqual(site.storage.listdir(self.F_FOLDER), ([u'subfolder'], []))
+
+        # the original has been changed since, the upload is saved
+        os.utime(site.storage.path(original_path), (0, 0))
+        data = self.upload('copy.jpg', self.content, folder=self.F_FOLDER.path_relative_directory)
+        self.assertEqual(data['filename'], 'copy.jpg')
+        self.assertNotIn('duplicate_of', data)
+
+    def test_disabled(self):
+        self.upload('testimage.jpg', self.content)
+        data = self.upload('copy.jpg', self.content)
+        self.assertNotIn('duplicate_of', data)
+        self.assertEqual(len(site.storage.listdir(self.F_SUBFOLDER)[1]), 2)
+
+
 class DetailViewTests(TestCase):
     def setUp(self):
         super(DetailViewTests, self).setUp()
@@ -253,6 +431,35 @@ class DetailViewTests(TestCase):
             self.assertFalse(site.storage.exists(path))
 
 
+class DetailVersionsTests(TestCase):
+    def setUp(self):
+        super(DetailVersionsTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    def detail(self):
+        request = superuser_request('get', '/', {'dir': 'folder', 'filename': 'testimage.jpg'})
+        with patch('filebrowser.sites.TemplateResponse'):
+            site.detail(request)
+
+    @patch('filebrowser.sites.VERSIONS_ASYNC', True)
+    def test_async(self):
+        with patch('filebrowser.sites.version_queue') as version_queue, \
+                patch.object(FileObject, 'version_outdated') as version_outdated:
+            self.detail()
+        # outdated versions are found by the worker
+        self.assertFalse(version_outdated.called)
+        self.assertEqual(version_queue.put_many.call_args[0][1], list(ADMIN_VERSIONS) + [ADMIN_THUMBNAIL])
+
+    def test_errors(self):
+        with patch.object(FileObject, 'versions_generate', side_effect=IOError('cannot identify image file')), \
+                patch('filebrowser.sites.logger') as logger:
+            self.detail()
+        self.assertTrue(logger.exception.called)
+
+        with patch.object(FileObject, 'versions_generate', side_effect=KeyError):
+            self.assertRaises(KeyError, self.detail)
+
+
 class DeleteConfirmViewTests(TestCase):
     def setUp(self):
         super(DeleteConfirmViewTests, self).setUp()
@@ -266,6 +473,20 @@ class DeleteConfirmViewTests(TestCase):
         self.assertTrue(response.status_code == 200)
         self.assertTrue('filebrowser/delete_confirm.html' in [t.name for t in response.templates])
 
+    def test_preview(self):
+        """ Only the first 100 items of a folder are turned into FileObjects, the remaining items are counted. """
+        for i in range(120):
+            open(os.path.join(self.SUBFOLDER_PATH, 'file%03d.txt' % i), 'w').close()
+        request = superuser_request('get', self.url, {'dir': '', 'filename': self.F_FOLDER.filename})
+
+        with patch('filebrowser.sites.TemplateResponse') as template_response:
+            site.delete_confirm(request)
+        context = template_response.call_args[0][2]
+        self.assertEqual(len(context['filelisting']), 100)
+        self.assertEqual(context['additional_files'], 22)
+        filenames = [f.filename for f in context['filelisting']]
+        self.assertEqual(filenames, sorted(filenames, reverse=True))
+
 
 class DeleteViewTests(TestCase):
     def setUp(self):
@@ -293,3 +514,136 @@ class DeleteViewTests(TestCase):
         self.assertFalse(site.storage.exists(self.F_IMAGE.path))
         for version in versions:
             self.assertFalse(site.storage.exists(version.path))
+
+
+@patch('filebrowser.sites.CONDITIONAL_GET', True)
+class ConditionalViewTests(TestCase):
+    def setUp(self):
+        super(ConditionalViewTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    def request(self, name, params=None, **headers):
+        url = reverse('filebrowser:%s' % name)
+        request = superuser_request('get', url, params, **headers)
+        response = resolve(url).func(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_browse(self):
+        response = self.request('fb_browse', {'dir': 'folder'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+
+        # unchanged: the view (and the template) is skipped
+        with patch('filebrowser.sites.TemplateResponse') as template_response:
+            response = self.request('fb_browse', {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse(template_response.called)
+
+        # other query parameters and changed folders are not cached
+        response = self.request('fb_browse', {'dir': 'folder', 'o': 'filename'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        shutil.copy(self.STATIC_IMG_PATH, os.path.join(self.FOLDER_PATH, 'other.jpg'))
+        response = self.request('fb_browse', {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail(self):
+        params = {'dir': 'folder', 'filename': 'testimage.jpg'}
+        etag = self.request('fb_detail', params)['ETag']
+        self.assertEqual(self.request('fb_detail', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the version view has its own ETag
+        self.assertEqual(self.request('fb_version', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        os.utime(self.F_IMAGE.path_full, (0, 0))
+        self.assertEqual(self.request('fb_detail', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_browse_reuses_listing(self):
+        with patch.object(site.storage, 'scandir', wraps=site.storage.scandir) as scandir:
+            self.assertEqual(self.request('fb_browse', {'dir': 'folder'}).status_code, 200)
+            self.assertEqual(scandir.call_count, 1)
+        with patch.object(site.storage, 'listdir') as listdir:
+            self.assertEqual(self.request('fb_browse', {'dir': 'folder', 'o': 'filename_lower'}).status_code, 200)
+            self.assertFalse(listdir.called)
+
+    def test_browse_filter_date(self):
+        params = {'dir': 'folder', 'filter_date': 'past7days'}
+        response = self.request('fb_browse', params)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.request('fb_browse', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # a week later, the unchanged file does not match the filter anymore
+        with patch('filebrowser.sites.time', return_value=time.time() + 8 * 86400):
+            self.assertEqual(self.request('fb_browse', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_never_cache(self):
+        with patch('filebrowser.sites.CONDITIONAL_GET', False):
+            response = self.request('fb_browse', {'dir': 'folder'})
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
+
+        # pages showing messages are not cached
+        with patch.object(CookieStorage, '__len__', return_value=1):
+            response = self.request('fb_browse', {'dir': 'folder'})
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
+
+
+@unittest.skipIf(S3BotoStorage is None, 'boto, moto and django-storages are required')
+class S3ViewTests(DjangoTestCase):
+    """
+    Views of a site with S3BotoStorageMixin, where folders have neither
+    modified times nor sizes.
+    """
+    def setUp(self):
+        from tests.test_storage import S3Storage
+        self.mock = mock_s3_deprecated()
+        self.mock.start()
+        boto.connect_s3().create_bucket('filebrowser')
+        self.site = FileBrowserSite(name='filebrowser_s3', storage=S3Storage(bucket='filebrowser', access_key='key', secret_key='secret'))
+        self.site.directory = 'uploads/'
+        for name in ['uploads/folder/a.txt', 'uploads/folder/sub/b.txt', 'uploads/c.txt']:
+            key = self.site.storage.bucket.new_key(name)
+            key.set_contents_from_string(b'x' * len(name))
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def request(self, name, params=None, **headers):
+        request = superuser_request('get', reverse('filebrowser:%s' % name), params, **headers)
+        view = [pattern.callback for pattern in self.site.get_urls() if pattern.name == name][0]
+        response = view(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_browse(self):
+        with patch('filebrowser.sites.TemplateResponse', wraps=TemplateResponse) as template_response:
+            response = self.request('fb_browse', {'o': 'filename_lower', 'ot': 'asc'})
+        self.assertEqual(response.status_code, 200)
+        context = template_response.call_args[0][2]
+        self.assertEqual([(f.filename, f.is_folder) for f in context['page'].object_list], [
+            (u'c.txt', False), (u'folder', True)])
+        self.assertEqual(context['filelisting'].results_total, 2)
+
+        # folders (without modified times) are listed with date filters, files sorted by date
+        with patch('filebrowser.sites.TemplateResponse', wraps=TemplateResponse) as template_response:
+            self.request('fb_browse', {'dir': 'folder', 'o': 'date', 'ot': 'desc'})
+            self.request('fb_browse', {'dir': 'folder', 'filter_date': 'today'})
+        self.assertEqual([f.filename for f in template_response.call_args_list[0][0][2]['page'].object_list], [u'a.txt', u'sub'])
+        self.assertEqual([f.filename for f in template_response.call_args_list[1][0][2]['page'].object_list], [u'a.txt'])
+
+    @patch('filebrowser.sites.CONDITIONAL_GET', True)
+    def test_browse_conditional(self):
+        response = self.request('fb_browse', {'dir': 'folder'})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.request('fb_browse', {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        key = self.site.storage.bucket.new_key('uploads/folder/d.txt')
+        key.set_contents_from_string(b'd')
+        self.assertEqual(self.request('fb_browse', {'dir': 'folder'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
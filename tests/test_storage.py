@@ -0,0 +1,155 @@
+# coding: utf-8
+import errno
+import os
+import unittest
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import TestCase
+from mock import patch
+
+try:
+    import boto
+    from moto import mock_s3_deprecated
+    from storages.backends.s3boto import S3BotoStorage
+except ImportError:
+    S3BotoStorage = None
+
+from filebrowser.sites import site
+from filebrowser.storage import S3BotoStorageMixin
+from tests.base import FilebrowserTestCase
+
+if S3BotoStorage is not None:
+    class S3Storage(S3BotoStorageMixin, S3BotoStorage):
+        pass
+
+
+class FileSystemStorageMixinTests(FilebrowserTestCase):
+
+    def setUp(self):
+        super(FileSystemStorageMixinTests, self).setUp()
+        self.storage = site.storage
+        self.name = os.path.join(self.F_SUBFOLDER.path, 'file.txt')
+
+    def listdir(self):
+        return sorted(os.listdir(self.SUBFOLDER_PATH))
+
+    @patch('filebrowser.storage.DEFAULT_PERMISSIONS', 0o640)
+    def test_save_upload(self):
+        self.assertEqual(self.storage.save_upload(self.name, SimpleUploadedFile('file.txt', b'first')), self.name)
+        self.assertEqual(os.stat(self.storage.path(self.name)).st_mode & 0o777, 0o640)
+
+        # another name is chosen for an existing file, unless allow_overwrite
+        other_name = self.storage.save_upload(self.name, SimpleUploadedFile('file.txt', b'second'))
+        self.assertNotEqual(other_name, self.name)
+        with patch.object(self.storage, 'move') as move, patch.object(self.storage, 'delete') as delete:
+            self.assertEqual(self.storage.save_upload(self.name, ContentFile(b'third'), allow_overwrite=True), self.name)
+            self.assertFalse(move.called or delete.called)
+        with self.storage.open(self.name) as f:
+            self.assertEqual(f.read(), b'third')
+        # no temporary files are left
+        self.assertEqual(self.listdir(), sorted(['file.txt', os.path.basename(other_name)]))
+
+    def test_save_upload_temporary_file(self):
+        upload = TemporaryUploadedFile('file.txt', 'text/plain', 4, None)
+        upload.write(b'data')
+        upload.flush()
+        temp_path = upload.temporary_file_path()
+        self.storage.save_upload(self.name, upload)
+        # the temporary file is moved (if on the same device) or copied
+        with self.storage.open(self.name) as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(self.listdir(), ['file.txt'])
+        upload.close()
+        self.assertFalse(os.path.exists(temp_path))
+
+    def test_save_upload_link_exists(self):
+        # the name is taken between choosing it and linking the file
+        link = os.link
+
+        def link_once_taken(source, target):
+            if os.path.basename(target) == 'file.txt':
+                with open(target, 'wb') as f:
+                    f.write(b'other')
+            link(source, target)
+
+        with patch('os.link', side_effect=link_once_taken):
+            other_name = self.storage.save_upload(self.name, ContentFile(b'data'))
+        self.assertNotEqual(other_name, self.name)
+        with self.storage.open(other_name) as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(self.listdir(), sorted(['file.txt', os.path.basename(other_name)]))
+
+    def test_save_upload_without_links(self):
+        with patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')):
+            self.assertEqual(self.storage.save_upload(self.name, ContentFile(b'data')), self.name)
+        with self.storage.open(self.name) as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertEqual(self.listdir(), ['file.txt'])
+
+    def test_save_upload_error(self):
+        with patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')), \
+                patch('filebrowser.storage.file_move_safe', side_effect=IOError):
+            self.assertRaises(IOError, self.storage.save_upload, self.name, ContentFile(b'data'))
+        self.assertEqual(self.listdir(), [])
+
+
+@unittest.skipIf(S3BotoStorage is None, 'boto, moto and django-storages are required')
+class S3BotoStorageMixinTests(TestCase):
+
+    def setUp(self):
+        self.mock = mock_s3_deprecated()
+        self.mock.start()
+        boto.connect_s3().create_bucket('filebrowser')
+        self.storage = S3Storage(bucket='filebrowser', access_key='key', secret_key='secret')
+        for name in ['uploads/image.jpg', 'uploads/folder/a.txt', 'uploads/folder/sub/b.txt', 'uploads/folder2/c.txt', 'other.txt']:
+            key = self.storage.bucket.new_key(name)
+            key.set_contents_from_string(b'x' * len(name))
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_isdir(self):
+        self.assertTrue(self.storage.isdir(''))
+        self.assertTrue(self.storage.isdir('uploads'))
+        self.assertTrue(self.storage.isdir('uploads/folder/'))
+        self.assertFalse(self.storage.isdir('uploads/image.jpg'))
+        self.assertFalse(self.storage.isdir('uploads/fold'))
+        with patch.object(self.storage.bucket, 'get_all_keys', return_value=[]) as get_all_keys:
+            self.assertFalse(self.storage.isdir('missing'))
+            get_all_keys.assert_called_once_with(prefix='missing/', max_keys=1)
+
+    def test_listdir(self):
+        self.assertEqual(self.storage.listdir('uploads'), ([u'folder', u'folder2'], [u'image.jpg']))
+        self.assertEqual(self.storage.listdir('uploads/folder'), ([u'sub'], [u'a.txt']))
+        self.assertEqual(self.storage.listdir(''), ([u'uploads'], [u'other.txt']))
+
+    def test_scandir(self):
+        entries = self.storage.scandir('uploads')
+        self.assertEqual([(e.name, e.is_dir, e.size) for e in entries], [
+            (u'folder', True, None), (u'folder2', True, None), (u'image.jpg', False, len('uploads/image.jpg'))])
+        self.assertEqual(entries[2].modified_time, self.storage.get_modified_time('uploads/image.jpg'))
+
+    def test_rmtree(self):
+        self.storage.delete_batch_size = 2
+        with patch.object(self.storage.bucket, 'delete_keys', wraps=self.storage.bucket.delete_keys) as delete_keys:
+            self.storage.rmtree('uploads/folder')
+            self.assertEqual(delete_keys.call_count, 1)
+        self.assertEqual(sorted(key.name for key in self.storage.bucket.list()), [
+            u'other.txt', u'uploads/folder2/c.txt', u'uploads/image.jpg'])
+
+        self.storage.delete_batch_size = 1
+        with patch.object(self.storage.bucket, 'delete_keys', wraps=self.storage.bucket.delete_keys) as delete_keys:
+            self.storage.rmtree('uploads')
+            self.assertEqual(delete_keys.call_count, 2)
+        self.assertEqual([key.name for key in self.storage.bucket.list()], [u'other.txt'])
+
+    def test_save_upload(self):
+        with patch.object(self.storage.bucket, 'copy_key') as copy_key, patch.object(self.storage, 'delete') as delete:
+            self.assertEqual(self.storage.save_upload('uploads/image.jpg', ContentFile(b'new'), allow_overwrite=True), 'uploads/image.jpg')
+            self.assertFalse(copy_key.called or delete.called)
+        self.assertEqual(self.storage.bucket.get_key('uploads/image.jpg').get_contents_as_string(), b'new')
+
+        # without allow_overwrite, the storage decides (s. AWS_S3_FILE_OVERWRITE)
+        self.storage.file_overwrite = False
+        self.assertNotEqual(self.storage.save_upload('other.txt', ContentFile(b'new')), 'other.txt')
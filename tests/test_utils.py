@@ -0,0 +1,68 @@
+# coding: utf-8
+from io import BytesIO
+
+from django.test import TestCase
+
+from filebrowser.utils import (get_image_dimensions_from_header, get_extension_index, get_file_type,
+    get_format_extensions, get_format_filetypes)
+
+try:
+    from PIL import Image, features
+except ImportError:
+    from PIL import Image
+    features = None
+
+
+class GetImageDimensionsFromHeaderTests(TestCase):
+
+    def get_header(self, format, size=(123, 45), **kwargs):
+        f = BytesIO()
+        Image.new('RGB', size, 'red').save(f, format=format, **kwargs)
+        return f.getvalue()
+
+    def test_formats(self):
+        for format in ('PNG', 'GIF', 'JPEG', 'TIFF'):
+            self.assertEqual(tuple(get_image_dimensions_from_header(self.get_header(format))), (123, 45), format)
+
+    def test_jpeg_with_exif(self):
+        data = self.get_header('JPEG', size=(640, 480), exif=b'Exif\x00\x00' + b'\x00' * 2000)
+        self.assertEqual(get_image_dimensions_from_header(data), (640, 480))
+        # SOF marker not within the header
+        self.assertEqual(get_image_dimensions_from_header(data[:1000]), None)
+
+    def test_webp(self):
+        if features is None or not features.check('webp'):
+            return
+        self.assertEqual(get_image_dimensions_from_header(self.get_header('WEBP')), (123, 45))
+        self.assertEqual(get_image_dimensions_from_header(self.get_header('WEBP', lossless=True)), (123, 45))
+
+    def test_unknown(self):
+        self.assertEqual(get_image_dimensions_from_header(b''), None)
+        self.assertEqual(get_image_dimensions_from_header(b'not an image'), None)
+        self.assertEqual(get_image_dimensions_from_header(self.get_header('BMP')), None)
+
+
+class ExtensionIndexTests(TestCase):
+
+    def test_get_extension_index(self):
+        index = get_extension_index()
+        self.assertEqual(index['.jpg'], 'Image')
+        self.assertEqual(index['.pdf'], 'Document')
+        self.assertNotIn('', index)
+        self.assertIs(get_extension_index(), index)
+
+    def test_get_file_type(self):
+        self.assertEqual(get_file_type('.jpg'), 'Image')
+        self.assertEqual(get_file_type('.JPG'), 'Image')
+        self.assertEqual(get_file_type('.mp3'), 'Audio')
+        self.assertEqual(get_file_type('.unknown'), '')
+        self.assertEqual(get_file_type(''), '')
+
+    def test_get_format_filetypes(self):
+        self.assertEqual(get_format_filetypes('image'), frozenset(['Image']))
+        self.assertEqual(get_format_filetypes('media'), frozenset(['Video', 'Audio']))
+        self.assertRaises(KeyError, get_format_filetypes, 'unknown')
+
+    def test_get_format_extensions(self):
+        self.assertEqual(get_format_extensions('image'), ('.jpg', '.jpeg', '.gif', '.png', '.tif', '.tiff'))
+        self.assertEqual(set(get_format_extensions()), set(get_extension_index()))
@@ -7,9 +7,13 @@ from django.template import Context, Template, TemplateSyntaxError
 from mock import patch
 
 from tests.base import FilebrowserTestCase as TestCase
-from filebrowser.settings import STRICT_PIL
+from filebrowser import signals
+from filebrowser.base import FileObject
+from filebrowser.settings import STRICT_PIL, ADMIN_VERSIONS, ADMIN_THUMBNAIL, UPLOAD_TEMPDIR
+from filebrowser.sites import site
 from filebrowser import utils
 from filebrowser.utils import scale_and_crop, process_image
+from filebrowser.workers import VersionQueue, version_queue
 
 if STRICT_PIL:
     from PIL import Image
@@ -450,3 +454,96 @@ class VersionObjectTemplateTagTests(TestCase):
         r = t.render(c)
         self.assertEqual(c["version_large"].url, os.path.join(settings.MEDIA_URL, "_test/_versions/placeholders/testimage_large.jpg"))
         self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/_versions/placeholders/testimage_large.jpg"))
+
+
+@patch('filebrowser.templatetags.fb_versions.VERSIONS_ASYNC', True)
+class VersionAsyncTemplateTagTests(TestCase):
+    """Test versions generated in background threads
+
+    Eg:
+    {% version obj "large" %}
+    {% version obj "large" as version_large %}
+
+    """
+    def setUp(self):
+        super(VersionAsyncTemplateTagTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+        self.version_file = os.path.join(self.VERSIONS_PATH, "folder", "testimage_large.jpg")
+
+    def test_with_obj(self):
+        t = Template('{% load fb_versions %}{% version obj "large" %}')
+        c = Context({"obj": self.F_IMAGE})
+        r = t.render(c)
+        self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/_versions/folder/testimage_large.jpg"))
+        version_queue.join()
+        self.assertTrue(os.path.exists(self.version_file))
+
+    def test_as_var(self):
+        t = Template('{% load fb_versions %}{% version obj "large" as version_large %}{{ version_large.url }}')
+        c = Context({"obj": self.F_IMAGE})
+        r = t.render(c)
+        self.assertEqual(r, os.path.join(settings.MEDIA_URL, "_test/_versions/folder/testimage_large.jpg"))
+        version_queue.join()
+        self.assertTrue(c["version_large"].exists)
+
+    def test_deduplicate(self):
+        queue = VersionQueue(workers=1)
+        with patch('filebrowser.templatetags.fb_versions.version_queue', queue), patch.object(queue, '_start'):
+            for i in range(3):
+                Template('{% load fb_versions %}{% version obj "large" %}').render(Context({"obj": self.F_IMAGE}))
+            self.assertEqual(queue._queue.qsize(), 1)
+        queue._start()
+        queue.join()
+        self.assertTrue(os.path.exists(self.version_file))
+
+    def test_existing_version(self):
+        self.F_IMAGE.version_generate("large")
+        with patch.object(version_queue, 'put') as put:
+            Template('{% load fb_versions %}{% version obj "large" %}').render(Context({"obj": self.F_IMAGE}))
+            self.assertFalse(put.called)
+
+
+class VersionQueueTests(TestCase):
+
+    def setUp(self):
+        super(VersionQueueTests, self).setUp()
+        shutil.copy(self.STATIC_IMG_PATH, self.FOLDER_PATH)
+
+    def test_put_many(self):
+        queue = VersionQueue(workers=1)
+        with patch.object(queue, '_start'):
+            large_path = queue.put(self.F_IMAGE, "large")
+            paths = queue.put_many(self.F_IMAGE, ["large", "small", "thumbnail"])
+            # "large" is already waiting, the second job generates the remaining versions
+            self.assertEqual(queue._queue.qsize(), 2)
+            self.assertEqual(paths[0], large_path)
+            self.assertTrue(all(queue.is_pending(path) for path in paths))
+
+        with patch.object(FileObject, 'versions_generate', wraps=self.F_IMAGE.versions_generate) as versions_generate:
+            queue._start()
+            queue.join()
+            versions_generate.assert_called_once_with(["small", "thumbnail"], None)
+        self.assertFalse(any(queue.is_pending(path) for path in paths))
+        self.assertTrue(all(site.storage.isfile(path) for path in paths))
+
+    @patch('filebrowser.workers.VERSIONS_PREGENERATE', True)
+    def test_pregenerate_on_upload(self):
+        with patch.object(version_queue, 'put_many') as put_many:
+            signals.filebrowser_post_upload.send(sender=None, path=self.F_FOLDER.path, file=self.F_IMAGE, site=site)
+            put_many.assert_called_once_with(self.F_IMAGE, [ADMIN_THUMBNAIL] + [v for v in ADMIN_VERSIONS if v != ADMIN_THUMBNAIL])
+
+            # temporary uploads and other files are left out
+            put_many.reset_mock()
+            signals.filebrowser_post_upload.send(sender=None, path=UPLOAD_TEMPDIR, file=self.F_IMAGE, site=site)
+            signals.filebrowser_post_upload.send(sender=None, path=self.F_FOLDER.path, file=FileObject('_test/uploads/folder/test.txt', site=site), site=site)
+            self.assertFalse(put_many.called)
+
+        with patch('filebrowser.workers.VERSIONS_PREGENERATE', ['large']):
+            signals.filebrowser_post_upload.send(sender=None, path=self.F_FOLDER.path, file=self.F_IMAGE, site=site)
+            version_queue.join()
+        self.assertTrue(os.path.exists(os.path.join(self.VERSIONS_PATH, "folder", "testimage_large.jpg")))
+
+    def test_disabled(self):
+        with patch.object(version_queue, 'put_many') as put_many:
+            signals.filebrowser_post_upload.send(sender=None, path=self.F_FOLDER.path, file=self.F_IMAGE, site=site)
+            self.assertFalse(put_many.called)